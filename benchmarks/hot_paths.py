@@ -0,0 +1,246 @@
+"""
+Benchmarks of the sweeper's hot paths: building & iterating the mesh, logging data, and the per-step work of a sweep
+(Sweeper._set_state, _do_measurement, and advance.) They run against components.fake_labrad.FakeConnection with no
+latency, so they measure the sweeper's own overhead rather than that of LabRAD.
+
+Run from the repository root:
+	python -m benchmarks.hot_paths                          # run, and print the results
+	python -m benchmarks.hot_paths --save baseline.json     # also save them as a baseline
+	python -m benchmarks.hot_paths --compare baseline.json  # compare with a saved baseline; exits with status 1 if anything regressed
+
+Each timing is the best of --repeats runs. Memory use per mesh point needs tracemalloc (python 3.4+), and is skipped without it.
+"""
+import argparse, json, platform, sys, time, numpy
+from components.sweep_mesh  import SweepMesh, Axis
+from components.logger      import DataSet
+from components.fake_labrad import FakeConnection
+from components.engine      import monotonic
+from sweeper import Sweeper
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+BASELINE_VERSION = 1
+
+MESH_SIZES = [[100,100],[300,300],[1000,1000]] # grid sizes for the mesh build benchmarks
+NEXT_STEPS = 20000                             # mesh points iterated by the next() benchmarks
+LOG_ROWS   = 20000                             # rows logged by the DataSet benchmarks
+SWEEP_AXES = [200,20]                          # mesh of the Sweeper benchmarks
+
+def best_time(func,repeats):
+	"""Returns the shortest time (in seconds) taken by func() over <repeats> calls. func() does its own setup before returning a callable to time."""
+	times = []
+	for n in range(repeats):
+		timed = func()
+		start = monotonic()
+		timed()
+		times.append(monotonic() - start)
+	return min(times)
+
+def result(value,unit,better='lower'):
+	return {'value':value,'unit':unit,'better':better}
+
+def _axes(sizes):
+	return [Axis(0.0,1.0,points) for points in sizes]
+
+def _lincombs(n_axes):
+	return [[0.0]+[1.0]*n_axes,[0.5]+[-1.0]*n_axes]
+
+def bench_mesh_build(repeats):
+	results = {}
+	for sizes in MESH_SIZES:
+		name = 'x'.join([str(points) for points in sizes])
+		for lazy in [False,True]:
+			def build():
+				mesh = SweepMesh()
+				return lambda:mesh.from_linear_functions(_axes(sizes),_lincombs(len(sizes)),lazy=lazy)
+			results['mesh_build_{name}{lazy}'.format(name=name,lazy='_lazy' if lazy else '')] = result(best_time(build,repeats),'s')
+		if tracemalloc is not None:
+			tracemalloc.start()
+			before = tracemalloc.get_traced_memory()[0]
+			mesh   = SweepMesh()
+			mesh.from_linear_functions(_axes(sizes),_lincombs(len(sizes)))
+			used   = tracemalloc.get_traced_memory()[0] - before
+			tracemalloc.stop()
+			results['mesh_memory_per_point_{name}'.format(name=name)] = result(used / float(mesh.total_steps() + 1),'bytes')
+			del mesh
+	return results
+
+def bench_mesh_next(repeats):
+	results = {}
+	for traversal in ['raster','serpentine']:
+		for lazy in [False,True]:
+			def iterate():
+				mesh = SweepMesh(traversal)
+				mesh.from_linear_functions(_axes([100,NEXT_STEPS//100]),_lincombs(2),lazy=lazy)
+				def run():
+					for n in range(NEXT_STEPS):
+						mesh.next()
+				return run
+			name = 'mesh_next_{traversal}{lazy}'.format(traversal=traversal,lazy='_lazy' if lazy else '')
+			results[name] = result(best_time(iterate,repeats) / NEXT_STEPS * 1e6,'us/step')
+	return results
+
+def _dataset(cxn,async_write=False):
+	dataset = DataSet([['x','v'],['y','v']],[['z','z','v']],name='benchmark',loc='benchmarks',async_write=async_write,connection=cxn)
+	dataset.create_dataset()
+	return dataset
+
+def bench_logging(repeats):
+	results = {}
+	rows    = [[float(n),float(n)*0.5,float(n)*0.25] for n in range(LOG_ROWS)]
+
+	def add_rows():
+		dataset = DataSet([['x','v'],['y','v']],[['z','z','v']],connection=FakeConnection())
+		def run():
+			for row in rows:
+				dataset.add_data([row])
+		return run
+	results['dataset_add_data_rows'] = result(LOG_ROWS / best_time(add_rows,repeats),'rows/s','higher')
+
+	def add_block():
+		dataset = DataSet([['x','v'],['y','v']],[['z','z','v']],connection=FakeConnection())
+		return lambda:dataset.add_data(rows)
+	results['dataset_add_data_block'] = result(LOG_ROWS / best_time(add_block,repeats),'rows/s','higher')
+
+	for async_write in [False,True]:
+		def write():
+			dataset = _dataset(FakeConnection(),async_write)
+			dataset.add_data(rows)
+			def run():
+				dataset.write_data()
+				dataset.close_dataset() # waits for an async writer to finish
+			return run
+		name = 'dataset_write_data{mode}'.format(mode='_async' if async_write else '')
+		results[name] = result(LOG_ROWS / best_time(write,repeats),'rows/s','higher')
+	return results
+
+def _sweeper(batch_packets=False,max_step_size=None):
+	"""A Sweeper in sweep mode on a FakeConnection, with two swept & two recorded settings, logging to the fake data vault."""
+	s = Sweeper(connection=FakeConnection(),batch_packets=batch_packets)
+	for points in SWEEP_AXES:
+		s.add_axis(0.0,1.0,points)
+	s.add_swept_setting('dev',label='V0',setting=['dac_adc','DA_0','set_voltage'],inputs=[0],var_slot=1,max_step_size=max_step_size)
+	s.add_swept_setting('dev',label='V1',setting=['dac_adc','DA_0','set_voltage'],inputs=[1],var_slot=1,max_step_size=max_step_size)
+	s.add_recorded_setting('dev',label='A0',setting=['dac_adc','DA_0','read_voltage'],inputs=[0])
+	s.add_recorded_setting('dev',label='A1',setting=['dac_adc','DA_0','read_voltage'],inputs=[1])
+	s.generate_mesh(_lincombs(len(SWEEP_AXES)))
+	s.initialize_dataset('benchmark','benchmarks')
+	return s
+
+def bench_sweeper(repeats):
+	results = {}
+	points  = int(numpy.prod(SWEEP_AXES))
+	for batch in [False,True]:
+		mode = '_batched' if batch else ''
+
+		def set_state():
+			s = _sweeper(batch)
+			states = [numpy.array([0.1,0.2]),numpy.array([0.3,0.4])]
+			def run():
+				for n in range(points):
+					s._set_state(states[n % 2])
+			return run
+		results['sweeper_set_state'+mode] = result(best_time(set_state,repeats) / points * 1e6,'us/call')
+
+		def measure():
+			s = _sweeper(batch)
+			def run():
+				while s._mode == 'sweep':
+					s._do_measurement()
+			return run
+		results['sweeper_do_measurement'+mode] = result(best_time(measure,repeats) / points * 1e6,'us/point')
+
+		# a full sweep, with ramps of a few steps between points of the second axis
+		def advance():
+			s = _sweeper(batch,max_step_size=0.2)
+			def run():
+				while s._mode == 'sweep':
+					s.advance(1.0)
+			return run
+		results['sweeper_advance'+mode] = result(best_time(advance,repeats) / points * 1e6,'us/point')
+	return results
+
+BENCHMARKS = [bench_mesh_build,bench_mesh_next,bench_logging,bench_sweeper]
+
+def run_benchmarks(repeats=5):
+	"""Runs all the benchmarks, returning {name:{'value','unit','better'}}."""
+	results = {}
+	for bench in BENCHMARKS:
+		results.update(bench(repeats))
+	return results
+
+def save_baseline(path,results):
+	baseline = {
+		'version' :BASELINE_VERSION,
+		'time'    :time.strftime('%Y-%m-%d %H:%M:%S'),
+		'python'  :platform.python_version(),
+		'numpy'   :numpy.__version__,
+		'platform':platform.platform(),
+		'results' :results,
+		}
+	with open(path,'w') as f:
+		json.dump(baseline,f,indent=1,sort_keys=True)
+
+def load_baseline(path):
+	with open(path,'r') as f:
+		baseline = json.load(f)
+	if baseline.get('version') != BASELINE_VERSION:
+		raise ValueError("Unsupported baseline version {version} in {path}".format(version=baseline.get('version'),path=path))
+	return baseline
+
+def compare(results,baseline,tolerance=0.2):
+	"""
+	Compares results with those of a baseline. Returns [rows, regressions], where each row is
+	[name, baseline value, value, relative change (positive = better), unit], and regressions are the names
+	of the results more than <tolerance> (relative) worse than the baseline.
+	"""
+	rows,regressions = [],[]
+	for name in sorted(results):
+		new = results[name]
+		old = baseline['results'].get(name)
+		if old is None or not old['value']:
+			rows.append([name,None,new['value'],None,new['unit']])
+			continue
+		change = (new['value'] - old['value']) / float(old['value'])
+		if new['better'] == 'lower':change = -change
+		rows.append([name,old['value'],new['value'],change,new['unit']])
+		if change < -tolerance:regressions.append(name)
+	return [rows,regressions]
+
+def _fmt(value):
+	return '-' if value is None else '{value:.4g}'.format(value=value)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m benchmarks.hot_paths',description="Benchmarks of the sweeper's hot paths, on a fake LabRAD connection.")
+	parser.add_argument('--repeats'  ,type=int  ,default=5   ,help="runs of each benchmark; the best is kept (default: 5)")
+	parser.add_argument('--save'     ,metavar='PATH'         ,help="save the results as a baseline (JSON)")
+	parser.add_argument('--compare'  ,metavar='PATH'         ,help="compare the results with a saved baseline")
+	parser.add_argument('--tolerance',type=float,default=0.2 ,help="relative slowdown counted as a regression when comparing (default: 0.2)")
+	args = parser.parse_args(argv)
+
+	baseline = load_baseline(args.compare) if args.compare else None # read first, so a bad path fails before the benchmarks are run
+	results  = run_benchmarks(args.repeats)
+
+	if baseline is None:
+		for name in sorted(results):
+			print("{name:<36} {value:>12} {unit}".format(name=name,value=_fmt(results[name]['value']),unit=results[name]['unit']))
+		regressions = []
+	else:
+		rows,regressions = compare(results,baseline,args.tolerance)
+		print("Compared with the baseline of {time} (python {python}, numpy {numpy})".format(time=baseline['time'],python=baseline['python'],numpy=baseline['numpy']))
+		print("{name:<36} {old:>12} {new:>12} {change:>8}".format(name='benchmark',old='baseline',new='now',change='change'))
+		for name,old,new,change,unit in rows:
+			flag = '  REGRESSION' if name in regressions else ''
+			change = '-' if change is None else '{change:+.0%}'.format(change=change)
+			print("{name:<36} {old:>12} {new:>12} {change:>8} {unit}{flag}".format(name=name,old=_fmt(old),new=_fmt(new),change=change,unit=unit,flag=flag))
+
+	if args.save:
+		save_baseline(args.save,results)
+		print("Saved results to {path}".format(path=args.save))
+	return 1 if regressions else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Reading and writing of sweep checkpoint files.
+
+A checkpoint is a JSON file describing a sweep (axes, settings, linear combinations), how far it has
+progressed through its mesh, and any data that has not yet been written to the Data Vault.
+It is written atomically (to a temporary file which then replaces the checkpoint), so a crash
+while writing leaves the previous checkpoint intact.
+"""
+import json, os, numpy
+try:
+	from labrad.units import Value
+except ImportError:
+	Value = None # pylabrad isn't installed (e.g. when running on a FakeConnection); there are no Values to handle.
+
+CHECKPOINT_VERSION = 1
+
+def _encode(obj):
+	"""Converts objects that json can't serialize by itself."""
+	if isinstance(obj,numpy.ndarray):return obj.tolist()
+	if isinstance(obj,numpy.generic):return obj.item()
+	if type(obj) is Value           :return {'__value__':float(obj/obj.unit),'units':str(obj.unit)}
+	raise TypeError("Object of type {otype} cannot be written to a checkpoint".format(otype=type(obj)))
+
+def _decode(obj):
+	if '__value__' in obj:return Value(obj['__value__'],obj['units']) if Value is not None else obj['__value__']
+	return obj
+
+def write_checkpoint(path,checkpoint):
+	"""Atomically writes the checkpoint (a dict) to path."""
+	checkpoint = dict(checkpoint,version=CHECKPOINT_VERSION)
+	tmp_path   = path + '.tmp'
+	with open(tmp_path,'w') as f:
+		json.dump(checkpoint,f,default=_encode)
+		f.flush()
+		os.fsync(f.fileno()) # make sure the data is on disk before it replaces the previous checkpoint
+	if hasattr(os,'replace'):
+		os.replace(tmp_path,path)
+	else:
+		# python 2 has no atomic replace on Windows; the temporary file is kept until the rename succeeds.
+		if os.path.exists(path):os.remove(path)
+		os.rename(tmp_path,path)
+
+def read_checkpoint(path):
+	"""Reads a checkpoint written by write_checkpoint."""
+	with open(path,'r') as f:
+		checkpoint = json.load(f,object_hook=_decode)
+	if checkpoint.get('version') != CHECKPOINT_VERSION:
+		raise ValueError("Unsupported checkpoint version {version} in {path}".format(version=checkpoint.get('version'),path=path))
+	return checkpoint
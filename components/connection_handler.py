@@ -0,0 +1,92 @@
+"""
+Process-wide handling of the LabRAD connection.
+
+Rather than each Sweeper and DataSet opening (and authenticating) its own connection, they share one
+connection held by CONNECTION_HANDLER, and each uses its own context(s) on it. The connection is opened
+when it is first acquired, re-opened if it has been lost, and closed once the last holder has released it
+(unless keep_alive is set) or when the program exits.
+"""
+import atexit, threading
+try:
+	import labrad
+except ImportError:
+	labrad = None # without pylabrad, connections must be given explicitly (e.g. a FakeConnection)
+
+class SharedConnection(object):
+	"""
+	Stands in for a LabRAD connection held through a ConnectionHandler. Attribute access is passed on to the
+	handler's current connection, so holders keep working if it is re-opened. disconnect() releases this
+	holder's reference rather than closing the connection.
+	"""
+	def __init__(self,handler):
+		self._handler  = handler
+		self._released = False
+
+	@property
+	def generation(self):
+		return self._handler.generation
+
+	def __getattr__(self,name):
+		return getattr(self._handler.connection(),name)
+
+	def __getitem__(self,name):
+		return self._handler.connection()[name]
+
+	def disconnect(self):
+		if self._released:return
+		self._released = True
+		self._handler.release()
+
+class ConnectionHandler(object):
+	def __init__(self,keep_alive=False,**connect_kwargs):
+		self.keep_alive     = keep_alive     # whether to keep the connection open while nothing holds it (e.g. between queued sweeps)
+		self.connect_kwargs = connect_kwargs # passed to labrad.connect()
+		self._cxn  = None # the LabRAD connection, once opened
+		self._refs = 0    # number of holders (acquire() calls not yet released)
+		self.generation = 0 # number of times the connection has been opened. Contexts (and devices selected in them) belong to one connection, so must be set up again when this changes.
+		self._lock = threading.RLock()
+
+	def acquire(self):
+		"""Returns a SharedConnection, opening the connection if needed. Its disconnect() must be called once it is no longer needed."""
+		with self._lock:
+			self.connection()
+			self._refs += 1
+		return SharedConnection(self)
+
+	def release(self):
+		with self._lock:
+			if self._refs <= 0:raise ValueError("Connection released more times than it was acquired")
+			self._refs -= 1
+			if self._refs == 0 and not self.keep_alive:
+				self._disconnect()
+
+	def connection(self):
+		"""Returns the underlying connection, (re-)connecting if it isn't open."""
+		cxn = self._cxn
+		if (cxn is not None) and getattr(cxn,'connected',True):
+			return cxn
+		with self._lock:
+			if (self._cxn is None) or not getattr(self._cxn,'connected',True):
+				if self._cxn is not None:
+					print("LabRAD connection lost; reconnecting.")
+				if labrad is None:raise ValueError("pylabrad is not installed; pass a connection (e.g. components.fake_labrad.FakeConnection) instead")
+				self._cxn = labrad.connect(**self.connect_kwargs)
+				self.generation += 1
+			return self._cxn
+
+	def _disconnect(self):
+		if self._cxn is None:return
+		try:
+			self._cxn.disconnect()
+		except Exception as e:
+			print("Error closing LabRAD connection: {err}".format(err=e))
+		self._cxn = None
+
+	def shutdown(self):
+		"""Closes the connection regardless of how many holders it has. Called automatically at exit."""
+		with self._lock:
+			self._refs = 0
+			self._disconnect()
+
+CONNECTION_HANDLER = ConnectionHandler()
+atexit.register(CONNECTION_HANDLER.shutdown)
@@ -0,0 +1,166 @@
+"""
+Runs a sweep in its own thread.
+
+The engine thread calls Sweeper.advance() on a monotonic clock, at the deadlines given by Sweeper.next_deadline()
+rather than sleeping a fixed time after each call, so delays and ramps take as long as specified and blocking
+LabRAD calls don't stretch the timing of the sweep. A UI talks to it only through commands (pause/resume/abort)
+and status snapshots, so neither the sweep nor the UI has to wait for the other.
+"""
+import threading, time, collections
+
+try:
+	monotonic = time.monotonic
+except AttributeError:
+	monotonic = time.time # python 2 has no monotonic clock
+
+class SweepEngine(object):
+	def __init__(self,sweeper,interval=0.075,paused=False,eta_interval=2.0):
+		"""
+		sweeper      : Sweeper (in sweep mode) to run. Once the engine has started, it must only be used by the engine thread.
+		interval     : longest time (in seconds) the engine sleeps at once, i.e. how soon commands are handled
+		paused       : whether to start paused
+		eta_interval : time (in seconds) between updates of the estimated time remaining (see Sweeper.estimate_duration)
+		"""
+		if interval <= 0:raise ValueError("interval must be greater than zero")
+		self.sweeper  = sweeper
+		self.interval = interval
+		self.eta_interval = eta_interval
+		self.close_when_done = False # whether the engine thread closes the Sweeper (see Sweeper.close) when it stops
+
+		self._eta        = None # last estimate of the time remaining, and the time it was made
+		self._eta_time   = None
+		self._eta_ready  = threading.Event() # set once the estimate has been precomputed (see _prepare_eta)
+		self._eta_failed = False
+
+		self._commands = collections.deque()  # commands from other threads; deque append & popleft are atomic, so no lock is needed
+		self._paused   = paused
+		self._status   = self._snapshot('paused' if paused else 'running')
+		self._thread   = threading.Thread(target=self._run,name='SweepEngine')
+		self._thread.daemon = True
+
+	def start(self):
+		# estimating the time remaining first needs the whole rest of the mesh compiled, which would stall the sweep for a
+		# large mesh; it is done on its own thread, and the sweep thread only updates the estimate once that has finished.
+		if self.sweeper._mode == 'sweep':
+			self.sweeper._sweep_estimator() # created here, so that only the sweep thread creates or changes it from now on
+			eta_thread = threading.Thread(target=self._prepare_eta,name='SweepEngine estimate')
+			eta_thread.daemon = True
+			eta_thread.start()
+		self._thread.start()
+
+	# commands; these return immediately and are carried out by the engine thread before its next advance()
+	def pause(self):
+		self._commands.append('pause')
+	def resume(self):
+		self._commands.append('resume')
+	def abort(self):
+		"""Stops the sweep where it is. The Sweeper is left in sweep mode (so it can still be resumed from its checkpoint, if enabled.)"""
+		self._commands.append('abort')
+
+	def status(self):
+		"""
+		Returns the latest status snapshot (a dict, which is replaced rather than modified, so it is always consistent):
+		state       : 'running', 'paused', 'done', 'aborted', or 'error'
+		steps_done  : steps of the mesh completed
+		total_steps : total steps of the mesh
+		error       : the exception that stopped the sweep (for state 'error'), else None
+		eta         : estimated time (in seconds) remaining, or None if not yet estimated
+		rate        : points measured per second recently (see Sweeper.points_per_second), or None if not yet known
+		time        : monotonic time of the snapshot
+		"""
+		return self._status
+
+	def running(self):
+		return self._thread.is_alive()
+
+	def join(self,timeout=None):
+		self._thread.join(timeout)
+
+	def _snapshot(self,state,error=None):
+		now = monotonic()
+		if state in ['done','aborted','error']:
+			eta = 0.0 if state == 'done' else None
+		elif self._eta is None:
+			eta = None
+		elif state == 'paused' or self._eta_time is None:
+			eta = self._eta
+		else:
+			eta = max([self._eta - (now - self._eta_time),0.0]) # counts down between estimates
+		return {
+			'state'      :state,
+			'steps_done' :self.sweeper._mesh.steps_done,
+			'total_steps':self.sweeper._mesh.total_steps(),
+			'error'      :error,
+			'eta'        :eta,
+			'rate'       :self.sweeper.points_per_second(),
+			'time'       :now,
+			}
+
+	def _prepare_eta(self):
+		try:
+			self.sweeper.precompute_estimate()
+		except Exception as e:
+			print("Could not estimate the time remaining: {err}".format(err=e))
+			self._eta_failed = True
+		self._eta_ready.set()
+
+	def _update_eta(self,now):
+		try:
+			self._eta = self.sweeper.estimate_duration()
+		except Exception as e:
+			print("Could not estimate the time remaining: {err}".format(err=e))
+			self._eta = None
+		self._eta_time = now
+
+	def _run(self):
+		try:
+			self._loop()
+		finally:
+			if self.close_when_done:
+				try:
+					self.sweeper.close()
+				except Exception as e:
+					print("Error closing the sweep: {err}".format(err=e))
+
+	def _loop(self):
+		last_time = monotonic() # time of the last advance() (or of starting / resuming)
+		while True:
+			while self._commands:
+				command = self._commands.popleft()
+				if command == 'pause':
+					self._paused = True
+				elif command == 'resume' and self._paused:
+					self._paused = False
+					last_time    = monotonic()
+					self._eta_time = None # the time spent paused doesn't count
+				elif command == 'abort':
+					self._status = self._snapshot('aborted')
+					return
+
+			if self.sweeper._mode != 'sweep':
+				self._status = self._snapshot('done')
+				return
+
+			if self._paused:
+				self._status = self._snapshot('paused')
+				time.sleep(self.interval)
+				continue
+
+			try:
+				deadline = last_time + self.sweeper.next_deadline()
+				now      = monotonic()
+				if deadline > now:
+					time.sleep(min([deadline - now,self.interval]))
+					now = monotonic()
+					if deadline > now:continue # woke early to check for commands
+				self.sweeper.record_timing('slack',now - deadline)
+				# if the deadline has already passed (e.g. a slow instrument), the elapsed time is passed on so the sweep catches up.
+				self.sweeper.advance(max([now - last_time,1e-9]))
+			except Exception as e:
+				print("Sweep stopped by error: {err}".format(err=e))
+				self._status = self._snapshot('error',e)
+				return
+			last_time = now
+			if self.sweeper._mode == 'sweep' and self._eta_ready.is_set() and not self._eta_failed and (self._eta_time is None or now - self._eta_time >= self.eta_interval):
+				self._update_eta(now)
+			self._status = self._snapshot('running')
@@ -0,0 +1,354 @@
+"""
+In-process stand-in for a LabRAD connection, for running sweeps without a manager or instruments (e.g. for benchmarks.)
+
+FakeConnection implements the parts of a pylabrad connection that the sweeper uses: servers[...] (and attribute access),
+context(), settings (settings[name](...) or attribute access, with context= and wait=), select_device, list_devices,
+and packets. wait=False requests return futures whose wait() returns the response.
+It has three servers:
+	dac_adc                : a DAC-ADC (set_voltage, get_voltage, read_voltage, buffer_ramp), with the ADC inputs wired to the DAC outputs
+	virtual_device_server  : a VDS (list_channels, list_channel_details, get_channel, set_channel) with a channel per DAC & ADC port
+	data_vault             : a data vault (cd, new, open, add, add_parameter, add_comment, get) that keeps its datasets in memory
+
+Each request takes latency seconds (plus gaussian jitter), as a round trip to the manager would; a packet is one request.
+Requests sent with wait=False are in flight at the same time, so their latencies overlap.
+Use it in place of a real connection:
+	cxn = FakeConnection(latency=0.002,jitter=0.0005)
+	s   = Sweeper(connection=cxn)
+	s.add_swept_setting('dev',label='V0',setting=['dac_adc','DA_0','set_voltage'],inputs=[0],var_slot=1)
+"""
+import threading, random, time
+from components.engine import monotonic
+
+class FakeFuture(object):
+	"""Response to a wait=False request. wait() returns it (or raises the server's error) once its latency has passed."""
+	def __init__(self,result,error,ready):
+		self.result = result
+		self.error  = error
+		self.ready  = ready # monotonic time at which the response arrives
+
+	def done(self):
+		return monotonic() >= self.ready
+
+	def wait(self):
+		remaining = self.ready - monotonic()
+		if remaining > 0:
+			time.sleep(remaining)
+		if self.error is not None:raise self.error
+		return self.result
+
+class FakeServer(object):
+	"""
+	Base of the fake servers. Settings are the methods named in self.setting_names, called as method(ctx,*args).
+	Servers with devices (self.devices, a list of names) have select_device & list_devices; a device must be selected
+	in a context before its settings can be used there.
+	"""
+	name          = None
+	setting_names = []
+
+	def __init__(self,devices=None):
+		self.devices  = devices
+		self.selected = {} # context : selected device
+		if devices is not None:
+			self.setting_names = ['select_device','list_devices'] + self.setting_names
+
+	def call(self,ctx,name,args):
+		if not name in self.setting_names:raise ValueError("Server {server} has no setting {name}".format(server=self.name,name=name))
+		return getattr(self,name)(ctx,*args)
+
+	def duration(self,name,args):
+		"""Time (in seconds) that the setting takes on the device, on top of the request's latency."""
+		return 0.0
+
+	def select_device(self,ctx,device=0):
+		if isinstance(device,int):
+			if not (0 <= device < len(self.devices)):raise ValueError("Server {server} has no device {n}".format(server=self.name,n=device))
+			device = self.devices[device]
+		if not device in self.devices:raise ValueError("Server {server} has no device {device}".format(server=self.name,device=device))
+		self.selected[ctx] = device
+		return device
+
+	def list_devices(self,ctx):
+		return [(n,self.devices[n]) for n in range(len(self.devices))]
+
+	def device(self,ctx):
+		if not ctx in self.selected:raise ValueError("No device selected in context {ctx} of server {server}".format(ctx=ctx,server=self.name))
+		return self.selected[ctx]
+
+class FakeDACADC(FakeServer):
+	"""
+	DAC-ADC with n_dac outputs and n_adc inputs per device. ADC input n reads response(dac_voltages,n) (by default, DAC output n.)
+	buffer_ramp takes steps * delay on the device. With a resolution, outputs are rounded to the nearest multiple of it, like a real DAC's codes.
+	"""
+	name          = 'dac_adc'
+	setting_names = ['set_voltage','get_voltage','read_voltage','buffer_ramp']
+
+	def __init__(self,devices=('DA_0',),n_dac=4,n_adc=4,response=None,resolution=None):
+		FakeServer.__init__(self,list(devices))
+		self.resolution = resolution
+		self.n_dac    = n_dac
+		self.n_adc    = n_adc
+		self.response = response if response is not None else (lambda dac,port:dac[port % len(dac)])
+		self.dac      = dict([(device,[0.0]*n_dac) for device in devices])
+
+	def _port(self,port,count,kind):
+		if not (0 <= port < count):raise ValueError("{kind} port {port} is out of range (0 to {last})".format(kind=kind,port=port,last=count-1))
+		return port
+
+	def _output(self,voltage):
+		if self.resolution is None:return float(voltage)
+		return round(float(voltage)/self.resolution)*self.resolution
+
+	def set_voltage(self,ctx,port,voltage):
+		self.dac[self.device(ctx)][self._port(port,self.n_dac,'DAC')] = self._output(voltage)
+		return self.dac[self.device(ctx)][port]
+
+	def get_voltage(self,ctx,port):
+		return self.dac[self.device(ctx)][self._port(port,self.n_dac,'DAC')]
+
+	def read_voltage(self,ctx,port):
+		return float(self.response(list(self.dac[self.device(ctx)]),self._port(port,self.n_adc,'ADC')))
+
+	def buffer_ramp(self,ctx,dac_ports,adc_ports,ivoltages,fvoltages,steps,delay):
+		"""Ramps dac_ports from ivoltages to fvoltages in steps points, waiting delay (in microseconds) at each; returns one buffer per ADC port."""
+		dac = self.dac[self.device(ctx)]
+		buffers = [[] for port in adc_ports]
+		for n in range(steps):
+			frac = n / float(steps - 1) if steps > 1 else 1.0
+			for k in range(len(dac_ports)):
+				dac[self._port(dac_ports[k],self.n_dac,'DAC')] = self._output(ivoltages[k] + frac*(fvoltages[k] - ivoltages[k]))
+			for k in range(len(adc_ports)):
+				buffers[k].append(float(self.response(list(dac),self._port(adc_ports[k],self.n_adc,'ADC'))))
+		return buffers
+
+	def duration(self,name,args):
+		if name == 'buffer_ramp':
+			return args[4] * args[5] * 1e-6
+		return 0.0
+
+class FakeVDS(FakeServer):
+	"""Virtual device server. Each channel is [ID, name, label, get (function or None), set (function or None)]."""
+	name          = 'virtual_device_server'
+	setting_names = ['list_channels','list_channel_details','get_channel','set_channel']
+
+	def __init__(self,channels=None):
+		FakeServer.__init__(self)
+		self.channels = list(channels) if channels else []
+
+	def _channel(self,ID,name):
+		for channel in self.channels:
+			if (ID and channel[0] == ID) or ((not ID) and name and channel[1] == name):
+				return channel
+		raise ValueError("No VDS channel with ID ({ID}) / name ({name})".format(ID=ID,name=name))
+
+	def list_channels(self,ctx):
+		return [[channel[0],channel[1]] for channel in self.channels]
+
+	def list_channel_details(self,ctx,ID,name=''):
+		ID,name,label,get,set = self._channel(ID,name)
+		return [ID,name,label,'','',get is not None,set is not None]
+
+	def get_channel(self,ctx,ID,name=''):
+		channel = self._channel(ID,name)
+		if channel[3] is None:raise ValueError("VDS channel {ID} does not support get".format(ID=channel[0]))
+		return channel[3]()
+
+	def set_channel(self,ctx,value,ID,name=''):
+		channel = self._channel(ID,name)
+		if channel[4] is None:raise ValueError("VDS channel {ID} does not support set".format(ID=channel[0]))
+		channel[4](value)
+		return value
+
+class FakeDataVault(FakeServer):
+	"""Data vault keeping its directories & datasets in memory: self.datasets[(folders...)][dataset name] = dict of its contents."""
+	name          = 'data_vault'
+	setting_names = ['cd','new','open','add','add_parameter','add_comment','get','get_comments']
+
+	def __init__(self):
+		FakeServer.__init__(self)
+		self.datasets = {():{}}
+		self.path     = {} # context : current directory
+		self.open_set = {} # context : open dataset
+
+	def _dataset(self,ctx):
+		if not ctx in self.open_set:raise ValueError("No dataset open in context {ctx}".format(ctx=ctx))
+		return self.open_set[ctx]
+
+	def cd(self,ctx,path='',create=False):
+		"""path: a folder, a list of folders ('' being the root), or a backslash-delimited location."""
+		folders = list(self.path.get(ctx,()))
+		if not isinstance(path,(list,tuple)):
+			path = path.split('\\') if path else []
+		for folder in path:
+			if folder == ''  :folders = []
+			elif folder == '..':folders = folders[:-1]
+			else:
+				folders.append(folder)
+				if not tuple(folders) in self.datasets:
+					if not create:raise ValueError("Data vault directory {path} does not exist".format(path=folders))
+					self.datasets[tuple(folders)] = {}
+		self.path[ctx] = tuple(folders)
+		return [''] + folders
+
+	def new(self,ctx,name,independents,dependents):
+		folder  = self.path.get(ctx,())
+		dv_name = "{n:05d} - {name}".format(n=len(self.datasets[folder])+1,name=name)
+		self.datasets[folder][dv_name] = {'independents':list(independents),'dependents':list(dependents),'data':[],'parameters':[],'comments':[]}
+		self.open_set[ctx] = self.datasets[folder][dv_name]
+		return [[''] + list(folder),dv_name]
+
+	def open(self,ctx,dv_name):
+		folder = self.path.get(ctx,())
+		if not dv_name in self.datasets[folder]:raise ValueError("Dataset {name} does not exist".format(name=dv_name))
+		self.open_set[ctx] = self.datasets[folder][dv_name]
+		return [[''] + list(folder),dv_name]
+
+	def add(self,ctx,data):
+		dataset = self._dataset(ctx)
+		width   = len(dataset['independents']) + len(dataset['dependents'])
+		for row in data:
+			if len(row) != width:raise ValueError("Data rows must have {width} entries, got {row}".format(width=width,row=list(row)))
+			dataset['data'].append([float(v) for v in row])
+
+	def add_parameter(self,ctx,name,value):
+		self._dataset(ctx)['parameters'].append([name,value])
+
+	def add_comment(self,ctx,comment,user='anonymous'):
+		self._dataset(ctx)['comments'].append([comment,user])
+
+	def get(self,ctx):
+		return [list(row) for row in self._dataset(ctx)['data']]
+
+	def get_comments(self,ctx):
+		return [list(comment) for comment in self._dataset(ctx)['comments']]
+
+class FakeSetting(object):
+	"""A setting of a server, called as setting(*args,context=None,wait=True)."""
+	def __init__(self,connection,server,name):
+		self.connection = connection
+		self.server     = server
+		self.name       = name
+
+	def __call__(self,*args,**kwargs):
+		context = kwargs.pop('context',None)
+		wait    = kwargs.pop('wait',True)
+		if kwargs:raise TypeError("Unexpected arguments {kwargs}".format(kwargs=list(kwargs)))
+		future = self.connection._request(self.server,[[self.name,args,None]],context)
+		future.result = None if future.result is None else future.result[self.name]
+		return future.wait() if wait else future
+
+class FakePacket(object):
+	"""A packet of settings sent to one server as a single request. The response is a dict keyed by each setting's key (or name.)"""
+	def __init__(self,connection,server,context):
+		self.connection = connection
+		self.server     = server
+		self.context    = context
+		self.calls      = []
+
+	def __getitem__(self,name):
+		def add(*args,**kwargs):
+			self.calls.append([name,args,kwargs.get('key')])
+			return self
+		return add
+
+	def __getattr__(self,name):
+		if name.startswith('_'):raise AttributeError(name)
+		return self[name]
+
+	def send(self,wait=True):
+		future = self.connection._request(self.server,self.calls,self.context)
+		return future.wait() if wait else future
+
+class FakeServerWrapper(object):
+	"""A server as seen through the connection: its settings (settings[name] or attributes) and packet()."""
+	def __init__(self,connection,server):
+		self._connection = connection
+		self._server     = server
+		self.name        = server.name
+		self.settings    = dict([(name,FakeSetting(connection,server,name)) for name in server.setting_names])
+
+	def __getattr__(self,name):
+		if name.startswith('_') or not name in self.settings:raise AttributeError("Server {server} has no setting {name}".format(server=self.name,name=name))
+		return self.settings[name]
+
+	def __getitem__(self,name):
+		return self.settings[name]
+
+	def packet(self,context=None):
+		return FakePacket(self._connection,self._server,context)
+
+	def context(self):
+		return self._connection.context()
+
+class FakeConnection(object):
+	def __init__(self,latency=0.0,jitter=0.0,seed=None,dac_adc=None,extra_servers=None):
+		"""
+		latency       : time (in seconds) each request takes
+		jitter        : standard deviation (in seconds) of the gaussian noise added to each request's latency
+		seed          : seed for the jitter, for repeatable timing
+		dac_adc       : FakeDACADC to use (default: one device, 'DA_0', with 4 DACs & 4 ADCs)
+		extra_servers : other FakeServer objects to add
+		"""
+		if latency < 0 or jitter < 0:raise ValueError("latency and jitter cannot be negative")
+		self.latency   = latency
+		self.jitter    = jitter
+		self.connected = True
+		self.requests  = 0 # number of requests made (a packet counts once)
+		self._random   = random.Random(seed)
+		self._lock     = threading.Lock()
+		self._contexts = 0
+
+		dac_adc = dac_adc if dac_adc is not None else FakeDACADC()
+		self.servers = {}
+		for server in [dac_adc,FakeVDS(self._vds_channels(dac_adc)),FakeDataVault()] + list(extra_servers or []):
+			self.add_server(server)
+
+	def _vds_channels(self,dac_adc):
+		"""A VDS channel for each port of each device of dac_adc: IDs 'dac{n}'/'adc{n}' for the first device, then '{device}_dac{n}' etc."""
+		channels = []
+		for device in dac_adc.devices:
+			prefix = '' if device == dac_adc.devices[0] else device + '_'
+			for n in range(dac_adc.n_dac):
+				get = lambda device=device,n=n:dac_adc.dac[device][n]
+				set = lambda value,device=device,n=n:dac_adc.dac[device].__setitem__(n,float(value))
+				ID = '{prefix}dac{n}'.format(prefix=prefix,n=n)
+				channels.append([ID,'{device} DAC {n}'.format(device=device,n=n),ID,get,set])
+			for n in range(dac_adc.n_adc):
+				get = lambda device=device,n=n:float(dac_adc.response(list(dac_adc.dac[device]),n))
+				ID = '{prefix}adc{n}'.format(prefix=prefix,n=n)
+				channels.append([ID,'{device} ADC {n}'.format(device=device,n=n),ID,get,None])
+		return channels
+
+	def add_server(self,server):
+		self.servers[server.name] = FakeServerWrapper(self,server)
+
+	def __getattr__(self,name):
+		if name.startswith('_') or not name in self.__dict__.get('servers',{}):raise AttributeError("No server named {name}".format(name=name))
+		return self.servers[name]
+
+	def __getitem__(self,name):
+		return self.servers[name]
+
+	def context(self):
+		with self._lock:
+			self._contexts += 1
+			return (0,self._contexts)
+
+	def disconnect(self):
+		self.connected = False
+
+	def _request(self,server,calls,context):
+		"""Performs calls ([name,args,key] each) on server as one request, returning a FakeFuture of {key or name : response}."""
+		if not self.connected:raise ValueError("Connection has been closed")
+		start = monotonic()
+		ctx   = context if context is not None else (0,0)
+		result,error = {},None
+		with self._lock:
+			self.requests += 1
+			delay = max([self.latency + (self._random.gauss(0.0,self.jitter) if self.jitter else 0.0),0.0])
+			try:
+				for name,args,key in calls:
+					result[name if key is None else key] = server.call(ctx,name,args)
+					delay += server.duration(name,args)
+			except Exception as e:
+				result,error = None,e
+		return FakeFuture(result,error,start + delay)
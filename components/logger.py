@@ -1,8 +1,144 @@
-import labrad
-from labrad.units import Value
+import threading, collections, time, numpy, os, tempfile
+try:
+	from labrad.units import Value
+except ImportError:
+	Value = None # pylabrad isn't installed (e.g. when running on a FakeConnection); there are no Values to handle.
+from components.connection_handler import CONNECTION_HANDLER
+from components.stats import LatencyStats
+from components.engine import monotonic
+from components.tracing import TRACER
+try:
+	import queue
+except ImportError: # python 2
+	import Queue as queue
+
+class RowBuffer(object):
+	"""Growable (rows x columns) float array, used to hold data that has been added but not yet written."""
+	def __init__(self,columns,capacity=256):
+		self.columns = columns
+		self._array  = numpy.empty([capacity,columns])
+		self._rows   = 0
+
+	def __len__(self):
+		return self._rows
+
+	def append(self,rows):
+		"""Appends a (rows x columns) array, growing the buffer (by doubling) if needed."""
+		n = len(rows)
+		if self._rows + n > len(self._array):
+			array = numpy.empty([max([2*len(self._array),self._rows+n]),self.columns])
+			array[:self._rows] = self._array[:self._rows]
+			self._array = array
+		self._array[self._rows:self._rows+n] = rows
+		self._rows += n
+
+	def view(self):
+		"""Returns the rows in the buffer (a view, valid until the buffer is next changed.)"""
+		return self._array[:self._rows]
+
+	def chunks(self,size):
+		"""Iterates over the rows in the buffer, <size> rows at a time."""
+		for start in range(0,self._rows,size):
+			yield self._array[start:min([start+size,self._rows])]
+
+	def discard(self,n):
+		"""Removes the first n rows from the buffer."""
+		self._array[:self._rows-n] = self._array[n:self._rows]
+		self._rows = max([self._rows-n,0])
+
+	def clear(self):
+		self._rows = 0
+
+	def close(self):
+		pass
+
+class SpoolBuffer(object):
+	"""
+	Append-only file of (rows x columns) float64 values, with the same interface as RowBuffer.
+	Used to keep data that hasn't been written yet on disk rather than in memory, so that it is
+	neither limited by memory nor lost if the program crashes.
+	The file is created in <directory> (the system's temporary directory if None), unless the
+	path of an existing spool file is given, in which case rows are added to it (after dropping
+	any beyond the first <rows>, if given.)
+	"""
+	def __init__(self,columns,directory=None,path=None,offset=0,rows=None):
+		self.columns = columns
+		if path is None:
+			fd,path = tempfile.mkstemp(prefix='sweep_spool_',suffix='.f64',dir=directory)
+			os.close(fd)
+		self.path    = path
+		self._file   = open(path,'ab')
+		self._rows   = os.path.getsize(path) // (8*columns) # rows in the file. A partial row (from an interrupted write) is dropped.
+		if rows is not None:self._rows = min([self._rows,rows])
+		self._file.truncate(self._rows*8*columns)
+		self._offset = min([offset,self._rows])              # rows at the start of the file that have already been written, and are skipped
+
+	def __len__(self):
+		return self._rows - self._offset
+
+	def append(self,rows):
+		if self._offset and self._offset >= self._rows:
+			self._truncate() # every row has been written, and views of them are no longer in use
+		self._file.write(numpy.ascontiguousarray(rows,dtype=numpy.float64).tobytes())
+		self._file.flush()
+		self._rows += len(rows)
+
+	def view(self):
+		"""Returns the rows in the spool, as a read-only memory-mapped array."""
+		if not len(self):return numpy.empty([0,self.columns])
+		return numpy.memmap(self.path,dtype=numpy.float64,mode='r',shape=(self._rows,self.columns))[self._offset:]
+
+	def chunks(self,size):
+		"""Iterates over the rows in the spool, <size> rows at a time, reading them from disk as they are needed."""
+		view = self.view()
+		for start in range(0,len(view),size):
+			yield view[start:start+size]
+
+	def discard(self,n):
+		"""
+		Skips the first n rows. The file is only truncated once they have all been written, when rows are next appended:
+		a view of the file may still be in use now, and truncating a mapped file fails (Windows) or makes reading the view crash (POSIX.)
+		"""
+		self._offset = min([self._offset+n,self._rows])
+
+	def clear(self):
+		self._offset = self._rows
+
+	def _truncate(self):
+		self._file.truncate(0)
+		self._rows   = 0
+		self._offset = 0
+
+	def close(self):
+		"""Closes the spool file. It is deleted if it is empty; otherwise it is kept (so that the data isn't lost) and its location is printed."""
+		self._file.close()
+		if len(self):
+			print("Spool file {path} still holds {rows} rows that were not written to the data vault; it has been kept.".format(path=self.path,rows=len(self)))
+		else:
+			os.remove(self.path)
+
+def stored_counts(connection,location,dv_name):
+	"""Returns [rows, comments] held by an existing data vault data set. The data is read in full, so this takes a while for a large one."""
+	dv  = connection.data_vault
+	ctx = connection.context()
+	dv.cd(location,context=ctx)
+	dv.open(dv_name,context=ctx)
+	return [len(dv.get(context=ctx)),len(dv.get_comments(context=ctx))]
 
 class DataSet(object):
-	def __init__(self, independents, dependents, name=None, loc=None):
+	def __init__(self, independents, dependents, name=None, loc=None, async_write=False, max_queue=1000, flush_rows=100, flush_age=0.5, spool_dir=None, write_chunk=10000, connection=None, tracer=None):
+		"""
+		If async_write is True, data is sent to the data vault by a background thread once the dataset
+		has been created, so that write_data() doesn't wait for the data vault. Rows are queued (up to
+		max_queue batches; beyond that write_data() blocks, which is counted as backpressure), and are
+		sent together once flush_rows rows are waiting or the oldest has waited flush_age seconds.
+
+		If spool_dir is given, data that hasn't been written is kept in a spool file in that directory
+		(see SpoolBuffer) rather than in memory. Either way, it is sent to the data vault write_chunk rows at a time.
+
+		The data vault is used through the given connection, or through the shared connection (CONNECTION_HANDLER) if none is given.
+		Data vault adds are traced with the given Tracer (or TRACER, if none is given) while it is enabled.
+		"""
 		self.name         = name if name else None # name of the data set
 		self.location     = loc  if loc  else None # location of the data set in data vault
 		self.independents = independents # list of dependent variables
@@ -10,20 +146,42 @@ class DataSet(object):
 		self.variables    = independents+dependents # list of all variables
 		self.vartotal     = len(self.variables) # total length of data entries
 
-		self.connection = labrad.connect()
-		self.dv         = self.connection.data_vault
-		self.ctx        = self.connection.context()
-		# self.dv           = CONNECTION_HANDLER.dv            # connection to data vault
-		# self.ctx          = CONNECTION_HANDLER.get_context() # context to use for data vault
+		self._own_connection = connection is None # whether the connection was acquired here (and so should be released on close)
+		self.connection = CONNECTION_HANDLER.acquire() if connection is None else connection
+		self.tracer     = tracer if tracer is not None else TRACER
+		self.ctx        = self.connection.context() # context to use for data vault
 		self.ctx_expired  = False                            # whether or not this context has been expired for this data set
 		self.dataset_open = False                            # whether or not the dataset is open in this context
 		self.rdy          = (self.name is not None) and (self.location is not None)
+		self.dv_name      = None                             # name of the data set as given by the data vault (with its number), once created
 
 		self.comments   = [] # list of comments     that have been added but not yet written to the data set. Stored [ [comment, user], [comment, user], ... ]
+		self.comments_written = 0 # number of comments written to the data set
 		self.parameters = [] # list of parameters   that have been added but not yet written to the data set. Stored [ [name, value],   [name, value],   ... ]
-		self.data       = [] # list of data entries that have been added but not yet written to the data set. Stored [ [independents+dependents],        ... ]
+		self.data       = RowBuffer(self.vartotal) if spool_dir is None else SpoolBuffer(self.vartotal,spool_dir) # data entries that have been added but not yet written to the data set. Stored as rows of [independents+dependents]
+		self.write_chunk = write_chunk
 		self.tags       = [] # list of tags. Since tags can be overwritten, this list corresponds to the data set's tags.
 
+		self.async_write  = async_write
+		self.flush_rows   = flush_rows
+		self.flush_age    = flush_age
+		self._queue       = queue.Queue(maxsize=max_queue) # batches of rows (arrays) waiting for the writer thread
+		self._writer      = None                           # writer thread, started once the dataset is open
+		self.writer_error = None                           # exception raised by the writer thread, if any
+		self.failed_data  = []                             # batches of rows the writer thread could not write (once it has failed, it writes nothing more)
+		self._unsent      = collections.deque()            # batches queued for the writer thread that it hasn't written (or failed to write) yet
+		self._lock        = threading.RLock()              # held while the writer thread changes _unsent, failed_data, and rows_written
+		self._value_columns = []                           # columns that have been found to contain labrad Values, whose units are stripped when data is added
+		self.rows_written = 0                              # number of rows sent to the data vault
+		self.backpressure_events = 0                       # number of times write_data() had to wait for space in the queue
+		self.backpressure_time   = 0.0                     # total time spent waiting (seconds)
+		self.add_stats           = LatencyStats()          # times taken by the data vault's add calls (see Sweeper.stats())
+
+	@property
+	def dv(self):
+		"""The data vault server, looked up on each use so that a re-opened shared connection is picked up."""
+		return self.connection.data_vault
+
 	def set_name(self,name):
 		self.name = name if name else None
 		self.rdy  = (self.name is not None) and (self.location is not None)
@@ -38,13 +196,32 @@ class DataSet(object):
 		if self.ctx_expired : raise ValueError("Tried to use data vault with expired context")
 
 		self.dv.cd(self.location,True,context=self.ctx)                           # move to the directory & create it if it doesn't exist
-		self.dv.new(self.name,self.independents,self.dependents,context=self.ctx) # create the data set. Only info it needs immediately is the name & variables
+		path,self.dv_name = self.dv.new(self.name,self.independents,self.dependents,context=self.ctx) # create the data set. Only info it needs immediately is the name & variables
+		self.dataset_open = True
+		if self.async_write:self._start_writer()
+
+	def open_dataset(self,dv_name):
+		"""Re-opens an existing data set (by its data vault name, e.g. '00001 - name') so that more data can be added to it."""
+		if not self.rdy     : raise ValueError("Not ready to open dataset. Missing name ({name}) and/or location ({loc})".format(name=self.name,loc=self.location))
+		if self.dataset_open: raise ValueError("Error: tried to open a dataset while one is already open")
+		if self.ctx_expired : raise ValueError("Tried to use data vault with expired context")
+
+		self.dv.cd(self.location,context=self.ctx)
+		self.dv.open(dv_name,context=self.ctx)
+		self.dv_name      = dv_name
 		self.dataset_open = True
+		if self.async_write:self._start_writer()
 
 	def close_dataset(self):
+		if self._writer is not None:
+			self._queue.put(None) # tells the writer to send what it has and stop
+			self._writer.join()
+			self._writer = None
 		self.dataset_open = False
 		self.ctx_expired  = True
-		self.connection.disconnect()
+		self.data.close()
+		if self._own_connection:
+			self.connection.disconnect()
 		print("LabRAD connection closed for DataSet object with name ({name})".format(name=self.name))
 
 	def add_comments(self,comments,write=False):
@@ -68,6 +245,7 @@ class DataSet(object):
 			comment = self.comments.pop()
 			try:
 				self.dv.add_comment(comment[0],comment[1],context=self.ctx)
+				self.comments_written += 1
 			except:
 				print("Error writing comment with author '{auth}' and content '{cont}'".format(aut = comment[0], cont = comment[1]))
 				print("This could be acused by invalid author or content, or by an issue with the installation of LabRAD or Data Vault")
@@ -92,25 +270,187 @@ class DataSet(object):
 				continue
 			param=self.parameters.pop()
 			try:
-				self.dv.add_parameter(param[0],Value(param[2],param[1]),context=self.ctx)
+				self.dv.add_parameter(param[0],Value(param[2],param[1]) if Value is not None else param[2],context=self.ctx)
 			except:
 				print("Error writing parameter with name '{name}', units '{units}', and value '{value}'".format(name=param[0],units=param[1],value=param[2]))
 				print("This could be cause by invalid name, units, or value, or by an issue with the installaiton of LabRAD or Data Vault")
 
 	def add_data(self,data,write=False):
-		if not data:data=[]
-		data2=[]
-		for datum in data:
-			if type(datum) not in [list,tuple]: raise ValueError("Error: invalid type for data. Should be list or tuple of [independents,dependents]; got type {dtype}".format(dtype=type(datum)))
-			if len(datum) != self.vartotal:     raise ValueError("Error: got data of invalid length. Was {datalen}, should be {vartotal}".format(datalen=len(datum),vartotal=self.vartotal))
-			datum = [(float(k/k.unit) if type(k) is Value else k) for k in datum]
-			data2.append(datum)
-		self.data+=data2
+		"""
+		Adds rows of data, given either as a 2D array (rows x variables) of floats,
+		or as a list of rows (lists or tuples) whose entries are numbers or labrad Values.
+		"""
+		if data is None:data=[]
+		if isinstance(data,numpy.ndarray):
+			if data.ndim != 2 or data.shape[1] != self.vartotal:
+				raise ValueError("Error: got data array of invalid shape. Was {shape}, should be (rows, {vartotal})".format(shape=data.shape,vartotal=self.vartotal))
+			rows = data
+		elif len(data) == 0:
+			rows = None
+		else:
+			rows = self._rows_from_list(data)
+		if rows is not None:self.data.append(rows)
 		if write:self.write_data()
 
+	def _rows_from_list(self,data):
+		"""Converts a list of rows to a float array. The shape is validated once for the whole list; only columns known to hold Values are checked per row."""
+		if self._value_columns:
+			data = [self._strip_units(datum) for datum in data]
+		try:
+			rows = numpy.array(data,dtype=float)
+		except (TypeError,ValueError):
+			rows = None
+		if (rows is None) or rows.ndim != 2 or rows.shape[1] != self.vartotal:
+			# Something unexpected (Values in new columns, or invalid rows); check every entry.
+			for datum in data:
+				if type(datum) not in [list,tuple]: raise ValueError("Error: invalid type for data. Should be list or tuple of [independents,dependents]; got type {dtype}".format(dtype=type(datum)))
+				if len(datum) != self.vartotal:     raise ValueError("Error: got data of invalid length. Was {datalen}, should be {vartotal}".format(datalen=len(datum),vartotal=self.vartotal))
+				self._value_columns += [n for n in range(self.vartotal) if type(datum[n]) is Value and not (n in self._value_columns)]
+			rows = numpy.array([self._strip_units(datum) for datum in data],dtype=float)
+		return rows
+
+	def _strip_units(self,datum):
+		datum = list(datum)
+		for n in self._value_columns:
+			if n < len(datum) and type(datum[n]) is Value:datum[n] = float(datum[n]/datum[n].unit)
+		return datum
+
 	def write_data(self):
 		if not len(self.data):return
 		if not self.dataset_open:raise ValueError("Cannot write data to a dataset that hasn't been opened.")
 		if self.ctx_expired:raise ValueError("Tried to use data vault with expired context")
-		self.dv.add(self.data,context=self.ctx)
-		self.data=[]
+		if self._writer is not None:
+			self.check_writer()
+			for chunk in self.data.chunks(self.write_chunk):
+				self._enqueue(numpy.array(chunk))
+			self.data.clear()
+			return
+		written = 0
+		try:
+			for chunk in self.data.chunks(self.write_chunk):
+				self._add(chunk)
+				written += len(chunk)
+		finally:
+			self.rows_written += written
+			self.data.discard(written) # only what was written is removed, so that nothing is lost or written twice if a chunk fails
+
+	def _add(self,rows):
+		"""Sends rows to the data vault, recording the time taken."""
+		start = monotonic()
+		self.dv.add(rows,context=self.ctx)
+		end = monotonic()
+		self.add_stats.record(end - start)
+		if self.tracer.enabled:
+			self.tracer.add('dv.add','data vault',start,end,{'rows':len(rows)})
+
+	def _enqueue(self,rows):
+		"""Queues rows for the writer thread."""
+		with self._lock:
+			self._unsent.append(rows)
+		try:
+			self._queue.put(rows,block=False)
+		except queue.Full:
+			# the data vault isn't keeping up; wait for it.
+			start = time.time()
+			self._queue.put(rows)
+			self.backpressure_events += 1
+			self.backpressure_time   += time.time() - start
+
+	def attach_spool(self,path,offset=0,rows=None):
+		"""Takes the unwritten data from an existing spool file (e.g. one left by an interrupted sweep), in place of the current buffer. See SpoolBuffer."""
+		if len(self.data):raise ValueError("Cannot attach a spool file while there is unwritten data")
+		self.data.close()
+		self.data = SpoolBuffer(self.vartotal,path=path,offset=offset,rows=rows)
+
+	def spool(self):
+		"""Returns [path, offset, rows] of the spool file holding the unwritten data (see SpoolBuffer), or None if it is held in memory."""
+		if isinstance(self.data,SpoolBuffer):
+			return [self.data.path,self.data._offset,self.data._rows]
+		return None
+
+	def _start_writer(self):
+		self._writer = threading.Thread(target=self._writer_loop,name="DataSet writer ({name})".format(name=self.name))
+		self._writer.daemon = True
+		self._writer.start()
+
+	def _writer_loop(self):
+		"""Sends queued rows to the data vault, combining batches until flush_rows rows are waiting or the oldest is flush_age seconds old."""
+		rows     = []   # batches of rows waiting to be sent
+		n_rows   = 0
+		batches  = 0    # number of queue items they came from
+		oldest   = None # time the oldest waiting row was queued
+		stopping = False
+		while not stopping:
+			timeout = None if oldest is None else max([0.0, self.flush_age - (time.time() - oldest)])
+			try:
+				batch = self._queue.get(timeout=timeout)
+				if batch is None:
+					stopping = True
+				else:
+					if oldest is None:oldest = time.time()
+					rows.append(batch)
+					n_rows  += len(batch)
+				batches += 1
+			except queue.Empty:
+				pass
+
+			if rows and (stopping or n_rows >= self.flush_rows or time.time() - oldest >= self.flush_age):
+				sent = len(rows)
+				rows = numpy.concatenate(rows)
+				if self.writer_error is None:
+					try:
+						self._add(rows)
+					except Exception as e:
+						self.writer_error = e
+				with self._lock:
+					for n in range(sent):self._unsent.popleft()
+					if self.writer_error is None:
+						self.rows_written += n_rows
+					else:
+						self.failed_data.append(rows) # kept so that they aren't lost (e.g. so they can go in a checkpoint)
+				rows   = []
+				n_rows = 0
+				oldest = None
+			if not rows:
+				for n in range(batches):self._queue.task_done()
+				batches = 0
+
+	def check_writer(self):
+		"""Raises an error if the writer thread failed to write data to the data vault."""
+		if self.writer_error is not None:
+			raise ValueError("Error writing data to the data vault: {err}".format(err=self.writer_error))
+
+	def flush(self):
+		"""Waits until all data queued for the writer thread has been sent to the data vault (or has failed to be.)"""
+		if self._writer is not None:
+			self._queue.join()
+
+	def pending_data(self,spooled=True):
+		"""
+		Returns the rows that have been added but not written to the data vault, as an array, in the order they were added;
+		this includes rows queued for (or being written by) the writer thread. If spooled is False, rows in a spool file are left out.
+		"""
+		with self._lock:
+			unsent = self.failed_data + list(self._unsent)
+		if spooled or (self.spool() is None):
+			return numpy.concatenate(unsent + [numpy.array(self.data.view())])
+		return numpy.concatenate(unsent + [numpy.empty([0,self.vartotal])])
+
+	def unwritten(self):
+		"""
+		Returns [rows_written, pending_data(spooled=False)] as they were at one moment, without waiting for the writer thread
+		(e.g. for a checkpoint.) Rows that the writer is sending at the time are counted as not yet written.
+		"""
+		with self._lock:
+			return [self.rows_written,self.pending_data(spooled=False)]
+
+	def writer_status(self):
+		"""Returns a dict describing the state of the writer thread; queued is the number of batches waiting to be written."""
+		return {
+			'async'              :self._writer is not None,
+			'queued'             :self._queue.qsize(),
+			'rows_written'       :self.rows_written,
+			'backpressure_events':self.backpressure_events,
+			'backpressure_time'  :self.backpressure_time,
+			'error'              :None if self.writer_error is None else str(self.writer_error),
+			}
@@ -0,0 +1,121 @@
+"""
+Precompiled timeline of a sweep.
+
+Rather than working out each ramp step as the sweep runs, the whole sequence of events (ramp setpoints,
+delays, and measurements) is computed from the mesh ahead of time, with numpy, one chunk of points at a time.
+Each event is: wait <wait> seconds, then either set the swept settings to <setpoint> or take a measurement.
+The steps are the same as those made by Sweeper.advance() when called at Sweeper.next_deadline().
+"""
+import numpy
+
+class RampSchedule(object):
+	def __init__(self,mesh,axes,max_step_sizes,ramp_resolution,chunk_points=10000,resolutions=None):
+		"""
+		mesh            : generated SweepMesh
+		axes            : list of Axis objects of the mesh (for min_ramp_duration and post_ramp_delay, in ms)
+		max_step_sizes  : max_step_size of each swept setting (None for no limit)
+		resolutions     : resolution of each swept setting (None if unknown); ramps are stepped in whole steps of it (see Sweeper._ramp_codes)
+		ramp_resolution : longest time (in seconds) between ramp steps, and the time between steps of ramps with no duration
+		chunk_points    : number of mesh points compiled at a time
+		"""
+		if chunk_points < 1:raise ValueError("chunk_points must be at least 1")
+		self.mesh            = mesh
+		self.ramp_duration   = numpy.array([(axis.min_ramp_duration or 0.0)*0.001 for axis in axes])
+		self.delay_duration  = numpy.array([(axis.post_ramp_delay   or 0.0)*0.001 for axis in axes])
+		self.max_step_sizes  = numpy.array([numpy.inf if m is None else m for m in max_step_sizes],dtype=float)
+		self.resolutions     = numpy.array([numpy.nan if r is None else r for r in (resolutions or [None]*len(max_step_sizes))],dtype=float)
+		self.ramp_resolution = float(ramp_resolution)
+		self.chunk_points    = int(chunk_points)
+		self._totals         = {} # totals of whole chunks, by their first point (see totals())
+
+	def compile(self,start,stop):
+		"""
+		Returns the events for mesh points start to stop-1 as a dict of arrays (one entry per event):
+		wait     : time (in seconds) to wait before the event
+		setpoint : state to set (for measurement events, the state being measured)
+		measure  : whether the event is a measurement (otherwise it is a ramp step)
+		point    : the mesh step that the event belongs to
+
+		Each point's events ramp from the previous point (so start must be at least 1), wait the post_ramp_delay,
+		then measure.
+		"""
+		if start < 1:raise ValueError("The first point of the mesh has no ramp to compile")
+		positions,values,axes = self.mesh.get_block(start-1,stop)
+		last = numpy.asarray(values[:-1],dtype=float)
+		targ = numpy.asarray(values[1: ],dtype=float)
+		axes = axes[1:]
+		k    = len(axes)
+
+		# largest fraction of each ramp that can be done in one step (see Sweeper._start_ramp)
+		diff = numpy.abs(targ - last)
+		with numpy.errstate(divide='ignore'):
+			ratio = numpy.where(diff > 0, self.max_step_sizes / diff, numpy.inf)
+		max_delta = numpy.minimum(ratio.min(axis=1) if len(self.max_step_sizes) else numpy.ones(k),1.0)
+
+		duration = self.ramp_duration[axes]
+		timed    = duration > 0
+		step     = max_delta.copy()
+		step[timed] = numpy.minimum(max_delta[timed],self.ramp_resolution/duration[timed])
+
+		# whole DAC codes of the setting that crosses the most of them (see Sweeper._ramp_codes & _whole_codes);
+		# nan where a setting of unknown resolution changes, or nothing does
+		with numpy.errstate(divide='ignore',invalid='ignore'):
+			codes = numpy.where(diff > 0, diff / self.resolutions, 0.0).max(axis=1) if len(self.resolutions) else numpy.zeros(k)
+			codes[codes == 0] = numpy.nan
+			whole = numpy.minimum(numpy.maximum(numpy.floor(step*codes + 1e-9),1.0)/codes,1.0)
+		step  = numpy.where(numpy.isnan(codes) | (step >= 1.0),step,whole)
+		ticks = numpy.ceil(1.0/step - 1e-9).astype(int) # ramp steps for each point
+
+		# ramp steps: progress of each step, and the time before it
+		tick_point = numpy.repeat(numpy.arange(k),ticks)
+		tick_num   = numpy.arange(len(tick_point)) - numpy.repeat(numpy.cumsum(ticks) - ticks,ticks) + 1
+		progress   = numpy.minimum(tick_num*step[tick_point],1.0)
+		previous   = numpy.minimum((tick_num-1)*step[tick_point],1.0)
+		tick_wait  = numpy.where(timed[tick_point],(progress-previous)*duration[tick_point],numpy.where(max_delta[tick_point] < 1.0,self.ramp_resolution,0.0))
+
+		# each point's ramp steps are followed by its measurement
+		n_events = ticks + 1
+		measure_at = numpy.cumsum(n_events) - 1
+		is_measure = numpy.zeros(int(n_events.sum()),dtype=bool)
+		is_measure[measure_at] = True
+
+		wait     = numpy.empty(len(is_measure))
+		setpoint = numpy.empty([len(is_measure),targ.shape[1]])
+		point    = numpy.empty(len(is_measure),dtype=int)
+		wait[~is_measure]     = tick_wait
+		setpoint[~is_measure] = last[tick_point] + progress[:,None]*(targ-last)[tick_point]
+		point[~is_measure]    = tick_point + start
+		wait[is_measure]      = self.delay_duration[axes]
+		setpoint[is_measure]  = targ
+		point[is_measure]     = numpy.arange(k) + start
+		return {'wait':wait,'setpoint':setpoint,'measure':is_measure,'point':point}
+
+	def chunks(self,start):
+		"""Yields the compiled events from mesh point start to the end of the mesh, one chunk at a time."""
+		end = self.mesh.total_steps() + 1
+		while start < end:
+			stop = min([start + self.chunk_points,end])
+			yield self.compile(start,stop)
+			start = stop
+
+	def totals(self,start):
+		"""
+		Returns [time, ramp steps, measurements] for the events from mesh point start to the end of the mesh,
+		where time (in seconds) excludes the time taken by LabRAD calls.
+		Totals of whole chunks are kept, so repeated calls (e.g. for a running estimate) only compile the first, partial chunk.
+		"""
+		end    = self.mesh.total_steps() + 1
+		totals = numpy.zeros(3)
+		while start < end:
+			boundary = 1 + ((start - 1) // self.chunk_points + 1) * self.chunk_points # chunks are cached from point 1, chunk_points at a time
+			stop     = min([boundary,end])
+			if (start - 1) % self.chunk_points == 0 and start in self._totals:
+				totals += self._totals[start]
+			else:
+				chunk = self.compile(start,stop)
+				chunk_totals = numpy.array([chunk['wait'].sum(),(~chunk['measure']).sum(),chunk['measure'].sum()])
+				if (start - 1) % self.chunk_points == 0:
+					self._totals[start] = chunk_totals
+				totals += chunk_totals
+			start = stop
+		return [float(totals[0]),int(totals[1]),int(totals[2])]
@@ -1,19 +1,44 @@
-import time
+import time, math, numpy
+from components.stats import LatencyStats
+from components.engine import monotonic
+from components.tracing import TRACER
 
 builtins = {
 	'get':['time','zero'],
 	'set':['do nothing'],
 }
 
+# resolution (LSB, in volts) of the outputs of DAC servers, for swept settings added with resolution='auto' (see Sweeper.add_swept_setting)
+dac_resolutions = {
+	# server            : [setting, LSB]
+	'dac_adc'           :['set_voltage',20.0/2**16], # AD5764, 16 bits over +-10 V
+	'ad5764_dcbox'      :['set_voltage',20.0/2**16], # AD5764, 16 bits over +-10 V
+	'dcbox_quad_ad5780' :['set_voltage',20.0/2**18], # AD5780, 18 bits over +-10 V
+}
+
+def dac_resolution(server,setting):
+	"""Returns the resolution of the output set by <setting> of <server>, if it is listed in dac_resolutions, else None."""
+	known = dac_resolutions.get(server)
+	return known[1] if (known is not None) and (known[0] == setting) else None
+
+latency_weight = 0.2 # weight of each new measurement in a Setting's moving average latency
+
 class Setting(object):
-	def __init__(self,connection=None,max_step_size=None,label=None):
+	def __init__(self,connection=None,max_step_size=None,label=None,cache=None,tolerance=0.0,resolution=None,tracer=None):
 		self.connection     = connection
-		self.max_step_size  = max_step_size
-		if max_step_size is not None:
-			if max_step_size <= 0:raise ValueError("max_step_size cannot be zero (or less than zero)")
+		self.cache          = cache # SettingCache to get contexts & VDS details from, if any
+		self.tracer         = tracer if tracer is not None else TRACER # Tracer to record get/set spans in, while it is enabled
+		self.max_step_size  = None
+		self.resolution     = None # step between the values the device can output (e.g. a DAC's LSB), if known
+		if tolerance < 0:raise ValueError("tolerance cannot be less than zero")
+		self.tolerance  = tolerance  # values within this of the last value written are not re-sent (see needs_set)
+		self.set_resolution(resolution)
+		self.set_max_step_size(max_step_size)
+		self.last_value = None       # last value written by set(), or None if unknown
+		self.skipped    = 0          # number of writes the Sweeper skipped because the value was unchanged
 
 		self.label   = label if label else None
-		self.kind    = None  # what kind of setting this is. 'vds' or 'dev' or 'builtin'
+		self.kind    = None  # what kind of setting this is. 'vds' or 'dev' or 'builtin' or 'buffered'
 		self.setting = None  # the setting object (instance of VDSSetting, DeviceGetSetting, or DeviceSetSetting.)
 		                     # These classes have common menthods called by the Setting class.
 
@@ -21,22 +46,76 @@ class Setting(object):
 		self.has_setting = False                    # Whether or not the Setting has been given a setting
 		self.ready       = False                    # Whether or not the Setting has been completed.
 
+		self.latency = {'get':None,'set':None}      # moving average of the time (in seconds) taken by get/set calls, once measured
+		self.stats   = {'get':LatencyStats(),'set':LatencyStats()} # statistics of the get/set times (see Sweeper.stats())
+
+	def _record_latency(self,which,duration,concurrent=False):
+		"""Records a get/set that has just finished, taking duration seconds. concurrent: whether it overlapped other calls (see Tracer.add.)"""
+		last = self.latency[which]
+		self.latency[which] = duration if last is None else last + latency_weight*(duration-last)
+		self.stats[which].record(duration)
+		if self.tracer.enabled:
+			end = monotonic()
+			self.tracer.add("{which} {label}".format(which=which,label=self.label),'setting',end-duration,end,concurrent=concurrent)
+
 	def get(self):
 		if not self.ready:raise ValueError("Not ready to do get/set. Please ensure that the connection and setting have both been added.")
-		return self.setting.get()
+		start = monotonic()
+		value = self.setting.get()
+		self._record_latency('get',monotonic()-start)
+		return value
+
+	def get_async(self):
+		"""Starts a get and returns a SettingFuture; its wait() returns the value. Lets several settings be read at the same time."""
+		if not self.ready:raise ValueError("Not ready to do get/set. Please ensure that the connection and setting have both been added.")
+		future = self.setting.get_async()
+		future.record = lambda duration:self._record_latency('get',duration,True)
+		return future
 
 	def set(self,value):
 		if not self.ready:raise ValueError("Not ready to do get/set. Please ensure that the connection and setting have both been added.")
-		return self.setting.set(value)
+		self.last_value = None # unknown if the set fails
+		start = monotonic()
+		resp  = self.setting.set(value)
+		self._record_latency('set',monotonic()-start)
+		self.last_value = value
+		return resp
+
+	def needs_set(self,value):
+		"""
+		Returns whether setting value would change the output: whether it differs from the last value written by more than
+		the tolerance (or than rounding error) and, if the resolution is known, rounds to a different step of it.
+		"""
+		last = self.last_value
+		if last is None:return True
+		if abs(value - last) <= max([self.tolerance,1e-9*abs(last)]):return False
+		if self.resolution is not None:
+			return round(value/self.resolution) != round(last/self.resolution)
+		return True
+
+	def snap(self,value):
+		"""Returns value rounded to the nearest step of the resolution (the value the device will output), if it is known."""
+		if self.resolution is None:return value
+		return round(value/self.resolution)*self.resolution
 
 	def getlabel(self):
 		return self.label
 
 	def set_max_step_size(self,max_step_size):
+		"""Sets max_step_size; if the resolution is known, it is rounded down to a whole number of steps of it (at least one.)"""
 		if max_step_size is not None:
 			if max_step_size <= 0:raise ValueError("max_step_size cannot be zero (or less than zero)")
+			if self.resolution is not None:
+				max_step_size = max([math.floor(max_step_size/self.resolution + 1e-9),1])*self.resolution
 		self.max_step_size = max_step_size
 
+	def set_resolution(self,resolution):
+		"""Sets the resolution (None if unknown), rounding max_step_size to it."""
+		if resolution is not None:
+			if resolution <= 0:raise ValueError("resolution must be greater than zero")
+		self.resolution = resolution
+		self.set_max_step_size(self.max_step_size)
+
 	def connect(self,connection):
 		"""Supplies a LabRAD connection to the Setting. Not necessary if one was supplied on init."""
 		if self.connected:raise ValueError("Already connected")
@@ -45,7 +124,7 @@ class Setting(object):
 		self.connected  = True
 
 		if self.has_setting:
-			self.setting.connect(connection)
+			self.setting.connect(connection,self.cache)
 
 			if self.label is None:
 				# label detection for 'vds' kind
@@ -61,6 +140,10 @@ class Setting(object):
 				if self.kind == 'builtin':
 					self.label = self.setting.which
 
+				# label detection for 'buffered' kind
+				if self.kind == 'buffered':
+					self.label = self.setting.default_label()
+
 			self.ready = True
 
 	def vds(self,ID,name=None):
@@ -72,7 +155,7 @@ class Setting(object):
 		self.has_setting = True
 
 		if self.connected:
-			self.setting.connect(self.connection)
+			self.setting.connect(self.connection,self.cache)
 
 			if self.label is None:
 				self.label=self.setting.details[2] if self.setting.details[2] else None
@@ -89,7 +172,7 @@ class Setting(object):
 		self.has_setting = True
 
 		if self.connected:
-			self.setting.connect(self.connection)
+			self.setting.connect(self.connection,self.cache)
 
 			if self.label is None:
 				self.label = self.setting.setting[2]
@@ -105,7 +188,7 @@ class Setting(object):
 		self.has_setting = True
 
 		if self.connected:
-			self.setting.connect(self.connection)
+			self.setting.connect(self.connection,self.cache)
 			if self.label is None:
 				self.label = self.setting.setting[2]
 			self.ready = True
@@ -120,11 +203,25 @@ class Setting(object):
 		self.has_setting = True
 
 		if self.connected:
-			self.setting.connect(self.connection)
+			self.setting.connect(self.connection,self.cache)
 			if self.label is None:
 				self.label = self.setting.which
 			self.ready = True
 
+	def buffered(self,setting,port,set_setting='set_voltage',get_setting='read_voltage'):
+		"""Connects to a port of a device that can perform buffered ramps (see BufferedSetting)"""
+		if self.has_setting:raise ValueError("Setting already defined")
+
+		self.setting     = BufferedSetting(setting,port,set_setting,get_setting)
+		self.kind        = 'buffered'
+		self.has_setting = True
+
+		if self.connected:
+			self.setting.connect(self.connection,self.cache)
+			if self.label is None:
+				self.label = self.setting.default_label()
+			self.ready = True
+
 
 
 
@@ -139,9 +236,12 @@ class VDSSetting(object):
 		self.ID   = ID   if ID   else ""
 		self.name = name if name else ""
 
-	def connect(self,connection):
+	def connect(self,connection,cache=None):
 		# Ensure that the connection is valid and that the VDS is running
-		self.details    = connection.virtual_device_server.list_channel_details(self.ID,self.name)
+		if cache is not None:
+			self.details = cache.vds_details(connection,self.ID,self.name)
+		else:
+			self.details = connection.virtual_device_server.list_channel_details(self.ID,self.name)
 		self.has_get    = self.details[5]
 		self.has_set    = self.details[6]
 		
@@ -153,11 +253,26 @@ class VDSSetting(object):
 		if not self.has_get  : raise ValueError("Setting does not support get")
 		return self.connection.virtual_device_server.get_channel(self.ID,self.name)
 
+	def get_async(self):
+		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
+		if not self.has_get  : raise ValueError("Setting does not support get")
+		return SettingFuture(self.connection.virtual_device_server.get_channel(self.ID,self.name,wait=False),self.get)
+
 	def set(self,value):
 		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
 		if not self.has_set  : raise ValueError("Setting does not support set")
 		return self.connection.virtual_device_server.set_channel(value,self.ID,self.name)
 
+	# packet interface (see SettingBatch)
+	def packet_key(self):
+		return ['virtual_device_server',None]
+	def add_get(self,packet,key):
+		if not self.has_get  : raise ValueError("Setting does not support get")
+		packet.get_channel(self.ID,self.name,key=key)
+	def add_set(self,packet,value,key):
+		if not self.has_set  : raise ValueError("Setting does not support set")
+		packet.set_channel(value,self.ID,self.name,key=key)
+
 class BuiltinSetting(object):
 	def __init__(self,which):
 		if not (which in builtins['get'] + builtins['set']):
@@ -173,7 +288,7 @@ class BuiltinSetting(object):
 			self.has_get = False
 			self.has_set = True
 
-	def connect(self,connection):
+	def connect(self,connection,cache=None):
 		"""No connection is needed for builtin settings. This may change, in which case the connection should be saved as an internal property."""
 		pass
 
@@ -189,6 +304,9 @@ class BuiltinSetting(object):
 
 		raise ValueError("ERR: could not identify builtin setting <{which}>".format(which=self.which))
 
+	def get_async(self):
+		return SettingFuture(None,self.get)
+
 	def set(self,value):
 		if not self.has_set:
 			raise ValueError("Tried to perform 'set' on a 'get' type builtin")
@@ -198,6 +316,9 @@ class BuiltinSetting(object):
 
 		raise ValueError("ERR: could not identify builtin setting <{which}>".format(which=self.which))
 
+	def packet_key(self):
+		return None # builtins don't involve LabRAD, so they are performed directly.
+
 class DeviceGetSetting(object):
 	def __init__(self,setting,inputs):
 		self.setting = setting
@@ -207,11 +328,14 @@ class DeviceGetSetting(object):
 		self.has_get = True
 		self.has_set = False
 
-	def connect(self,connection):
+	def connect(self,connection,cache=None):
 
 		# ensure that the connection is valid, and the server & device are present.
-		self.ctx = connection.context()
-		connection.servers[self.setting[0]].select_device(self.setting[1],context=self.ctx)
+		if cache is not None:
+			self.ctx = cache.device_context(connection,self.setting[0],self.setting[1])
+		else:
+			self.ctx = connection.context()
+			connection.servers[self.setting[0]].select_device(self.setting[1],context=self.ctx)
 
 		self.connection = connection
 		self.connected  = True
@@ -226,10 +350,21 @@ class DeviceGetSetting(object):
 			resp = self.connection.servers[self.setting[0]].settings[self.setting[2]](*self.inputs,context=self.ctx)
 			return resp
 
+	def get_async(self):
+		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
+		future = self.connection.servers[self.setting[0]].settings[self.setting[2]](*self.inputs,context=self.ctx,wait=False)
+		return SettingFuture(future,self.get) # if the request fails, get() selects the device again and retries.
+
 	def set(self):
 		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
 		raise ValueError("Setting does not support set")
 
+	# packet interface (see SettingBatch)
+	def packet_key(self):
+		return [self.setting[0],self.setting[1]]
+	def add_get(self,packet,key):
+		packet[self.setting[2]](*self.inputs,key=key)
+
 class DeviceSetSetting(object):
 	def __init__(self,setting,inputs,var_slot):
 		if var_slot > len(inputs):raise ValueError("var_slot cannot exceed number of non-variable inputs")
@@ -242,11 +377,14 @@ class DeviceSetSetting(object):
 		self.has_get = False
 		self.has_set = True
 
-	def connect(self,connection):
+	def connect(self,connection,cache=None):
 
 		# ensure that the connection is valid, and the server & device are present.
-		self.ctx = connection.context()
-		connection.servers[self.setting[0]].select_device(self.setting[1],context=self.ctx)
+		if cache is not None:
+			self.ctx = cache.device_context(connection,self.setting[0],self.setting[1])
+		else:
+			self.ctx = connection.context()
+			connection.servers[self.setting[0]].select_device(self.setting[1],context=self.ctx)
 
 		self.connection = connection
 		self.connected  = True
@@ -255,6 +393,10 @@ class DeviceSetSetting(object):
 		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
 		raise ValueError("Setting does not support get")
 
+	def get_async(self):
+		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
+		raise ValueError("Setting does not support get")
+
 	def set(self,value):
 		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
 		inp = self.inputs[:self.var_slot] + [value] + self.inputs[self.var_slot:]
@@ -266,6 +408,234 @@ class DeviceSetSetting(object):
 			resp = self.connection.servers[self.setting[0]].settings[self.setting[2]](*inp,context=self.ctx)
 			return resp
 
+	# packet interface (see SettingBatch)
+	def packet_key(self):
+		return [self.setting[0],self.setting[1]]
+	def add_set(self,packet,value,key):
+		inp = self.inputs[:self.var_slot] + [value] + self.inputs[self.var_slot:]
+		packet[self.setting[2]](*inp,key=key)
+
+class BufferedSetting(object):
+	"""
+	A port of a device server which can perform a whole ramp itself, taking readings at each step,
+	such as the DAC-ADC's buffer_ramp(dac_ports, adc_ports, ivoltages, fvoltages, steps, delay).
+	setting = [server,device,ramp setting]. port is the DAC port (for swept settings) or ADC port (for recorded settings.)
+	Outside of buffered ramps, the port is set with set_setting(port,value) and read with get_setting(port).
+	"""
+	def __init__(self,setting,port,set_setting='set_voltage',get_setting='read_voltage'):
+		self.setting     = setting
+		self.port        = port
+		self.set_setting = set_setting
+		self.get_setting = get_setting
+		self.ctx         = None
+
+		self.has_get = True
+		self.has_set = True
+
+	def connect(self,connection,cache=None):
+
+		# ensure that the connection is valid, and the server & device are present.
+		if cache is not None:
+			self.ctx = cache.device_context(connection,self.setting[0],self.setting[1])
+		else:
+			self.ctx = connection.context()
+			connection.servers[self.setting[0]].select_device(self.setting[1],context=self.ctx)
+
+		self.connection = connection
+		self.connected  = True
+
+	def default_label(self):
+		return "{name}_{port}".format(name=self.setting[2],port=self.port)
+
+	def _call(self,name,*inputs):
+		server = self.connection.servers[self.setting[0]]
+		try:
+			return server.settings[name](*inputs,context=self.ctx)
+		except:
+			server.select_device(self.setting[1],context=self.ctx)
+			return server.settings[name](*inputs,context=self.ctx)
+
+	def get(self):
+		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
+		return self._call(self.get_setting,self.port)
+
+	def get_async(self):
+		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
+		future = self.connection.servers[self.setting[0]].settings[self.get_setting](self.port,context=self.ctx,wait=False)
+		return SettingFuture(future,self.get)
+
+	def set(self,value):
+		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
+		return self._call(self.set_setting,self.port,value)
+
+	def ramp(self,swept,recorded,start,end,steps,delay):
+		"""
+		Has the device ramp the ports of the swept BufferedSettings from start to end (one value each) in <steps> points, waiting
+		delay seconds at each, and read the ports of the recorded BufferedSettings at every point. All must be on this device.
+		Returns a (steps x len(recorded)) array of the readings.
+		"""
+		if not self.connected: raise ValueError("Setting not yet connected to LabRAD")
+		resp = self._call(self.setting[2],[s.port for s in swept],[r.port for r in recorded],[float(v) for v in start],[float(v) for v in end],int(steps),int(round(delay*1e6)))
+		return numpy.array(resp,dtype=float).reshape([len(recorded),int(steps)]).T # the device returns one buffer per recorded port
+
+	# packet interface (see SettingBatch)
+	def packet_key(self):
+		return [self.setting[0],self.setting[1]]
+	def add_get(self,packet,key):
+		packet[self.get_setting](self.port,key=key)
+	def add_set(self,packet,value,key):
+		packet[self.set_setting](self.port,value,key=key)
+
+class SettingCache(object):
+	"""
+	Contexts (with their device selected) and VDS channel details, kept so that settings connecting to the same
+	device or channel (e.g. in a series of sweeps) don't each have to set them up again.
+	Settings of the same device share its context. For use with a single connection; everything is cleared if it is
+	re-opened (see ConnectionHandler.generation), since the contexts belonged to the old one.
+	"""
+	def __init__(self):
+		self.contexts   = {}   # (server,device) : context with that device selected
+		self.details    = {}   # (ID,name)       : VDS channel details
+		self.generation = None # generation of the connection the contents were got from
+
+	def _check(self,connection):
+		generation = getattr(connection,'generation',0)
+		if generation != self.generation:
+			self.clear()
+			self.generation = generation
+
+	def device_context(self,connection,server,device):
+		self._check(connection)
+		if not (server,device) in self.contexts:
+			ctx = connection.context()
+			connection.servers[server].select_device(device,context=ctx)
+			self.contexts[(server,device)] = ctx
+		return self.contexts[(server,device)]
+
+	def vds_details(self,connection,ID,name):
+		self._check(connection)
+		if not (ID,name) in self.details:
+			self.details[(ID,name)] = connection.virtual_device_server.list_channel_details(ID,name)
+		return self.details[(ID,name)]
+
+	def clear(self):
+		self.contexts = {}
+		self.details  = {}
+
+class SettingFuture(object):
+	"""
+	The result of a get_async() call. wait() returns the value, waiting for the response if needed.
+	If the request failed, the value is instead got with fallback() (a synchronous get, which retries as needed.)
+	future is a LabRAD future (from a request made with wait=False), or None to just use fallback().
+	"""
+	def __init__(self,future,fallback):
+		self.future   = future
+		self.fallback = fallback
+		self.started  = monotonic()
+		self.record   = None # if set, called with the time taken once the value has been got
+
+	def wait(self):
+		value = self._wait()
+		if self.record is not None:
+			self.record(monotonic()-self.started)
+		return value
+
+	def _wait(self):
+		if self.future is None:
+			return self.fallback()
+		try:
+			return self.future.wait()
+		except Exception:
+			return self.fallback()
+
+class SettingBatch(object):
+	"""
+	Performs get or set on a list of (ready) Settings using one LabRAD packet per server & device, rather than one request per setting.
+	The packets for different servers/devices are sent at the same time, so the time taken scales with the number
+	of servers/devices rather than the number of settings. Settings on the same device share a context, selected to
+	that device once when the batch is created (and again if the connection is re-opened.) Builtin settings are performed directly.
+	"""
+	def __init__(self,connection,settings):
+		self.connection = connection
+		self.settings   = list(settings)
+		self.groups     = [] # [server, device, context, [indices of the settings in this group]]
+		self.local      = [] # indices of the settings performed directly
+		keys = []
+		for n in range(len(self.settings)):
+			key = self.settings[n].setting.packet_key()
+			if key is None:
+				self.local.append(n)
+			elif key in keys:
+				self.groups[keys.index(key)][3].append(n)
+			else:
+				keys.append(key)
+				self.groups.append([key[0],key[1],None,[n]])
+		self._open_contexts()
+
+	def _open_contexts(self):
+		"""Gives each group a new context, with its device selected."""
+		self.generation = getattr(self.connection,'generation',0)
+		for group in self.groups:
+			group[2] = self.connection.context()
+			if group[1] is not None:
+				self.connection.servers[group[0]].select_device(group[1],context=group[2])
+
+	def _send(self,build,which,only=None):
+		"""
+		Builds (with build(packet,n,key) for each member setting n) and sends one packet per group, then returns {n:response}.
+		If only (a list of indices) is given, only those settings are included, and groups with none of them aren't sent.
+		The time each packet takes is recorded as the <which> ('get' or 'set') latency of its member settings.
+		"""
+		if getattr(self.connection,'generation',0) != self.generation:
+			self._open_contexts() # the connection has been re-opened
+		sent  = []
+		start = monotonic()
+		for group in self.groups:
+			members = group[3] if only is None else [n for n in group[3] if n in only]
+			if members:
+				sent.append([group,members,self._packet(group,members,build,False).send(wait=False)])
+		responses = {}
+		for group,members,future in sent:
+			try:
+				resp = future.wait()
+			except Exception:
+				# As in Device*Setting.get/set: the device may have been deselected (e.g. the server restarted), so select it again and retry.
+				resp = self._packet(group,members,build,True).send()
+			duration = monotonic() - start
+			for n in members:
+				responses[n] = resp['s{n}'.format(n=n)]
+				self.settings[n]._record_latency(which,duration,True)
+		return responses
+
+	def _packet(self,group,members,build,select):
+		server,device,ctx = group[:3]
+		packet = self.connection.servers[server].packet(context=ctx)
+		if select and (device is not None):
+			packet.select_device(device)
+		for n in members:
+			build(packet,n,'s{n}'.format(n=n))
+		return packet
+
+	def get(self):
+		"""Returns the values of all the settings, in order."""
+		responses = self._send(lambda packet,n,key:self.settings[n].setting.add_get(packet,key),'get')
+		for n in self.local:
+			responses[n] = self.settings[n].get()
+		return [responses[n] for n in range(len(self.settings))]
+
+	def set(self,values,only=None):
+		"""Sets each setting to the corresponding value. If only (a list of indices) is given, only those settings are set."""
+		if len(values) != len(self.settings):raise ValueError("Number of values must equal the number of settings")
+		sent = [n for n in range(len(self.settings)) if not (n in self.local) and (only is None or n in only)]
+		for n in sent:
+			self.settings[n].last_value = None # unknown if the packet fails
+		self._send(lambda packet,n,key:self.settings[n].setting.add_set(packet,values[n],key),'set',only)
+		for n in sent:
+			self.settings[n].last_value = values[n]
+		for n in self.local:
+			if only is None or n in only:
+				self.settings[n].set(values[n])
+
 # examples
 if __name__ == '__main__':
 	import labrad
@@ -0,0 +1,73 @@
+"""
+Timing statistics of a running sweep (see Sweeper.stats()).
+
+LatencyStats keeps, for one kind of call (a setting's get/set, a data vault write, a phase of advance(), ...):
+totals over the whole sweep (count, total/min/max time), a histogram of all the times with logarithmic bins, and the
+most recent times (a rolling window) for the current mean & percentiles, so that a slowdown partway through a long
+sweep shows up rather than being averaged away. RateMeter gives the rate of points measured over a rolling window.
+"""
+import threading, collections, bisect, numpy
+
+HISTOGRAM_EDGES = [10.0**(k/4.0) for k in range(-24,9)] # 1 us to 100 s, 4 bins per decade; times outside go in the first/last bin
+
+class LatencyStats(object):
+	def __init__(self,window=256):
+		"""window : number of most recent times kept for the rolling statistics"""
+		self.count  = 0
+		self.total  = 0.0
+		self.min    = None
+		self.max    = None
+		self.counts = [0]*(len(HISTOGRAM_EDGES)+1) # counts[n] : times between HISTOGRAM_EDGES[n-1] and HISTOGRAM_EDGES[n]
+		self.recent = collections.deque(maxlen=window)
+		self._lock  = threading.Lock() # times may be recorded from other threads (e.g. the DataSet writer)
+
+	def record(self,duration):
+		"""Records one call that took <duration> seconds."""
+		with self._lock: # this is called several times per point, so it is kept to plain python (no numpy)
+			self.count += 1
+			self.total += duration
+			if self.min is None or duration < self.min:self.min = duration
+			if self.max is None or duration > self.max:self.max = duration
+			self.counts[bisect.bisect_left(HISTOGRAM_EDGES,duration)] += 1
+			self.recent.append(duration)
+
+	def summary(self):
+		"""
+		Returns a dict (suitable for JSON) of:
+		count, total, mean, min, max : over all the calls (times in seconds)
+		recent                       : mean, p50, p90, p99 & max of the most recent calls
+		histogram                    : [lower edge, upper edge, count] of each non-empty bin (None for an open end)
+		"""
+		with self._lock:
+			recent = numpy.array(self.recent,dtype=float)
+			counts = list(self.counts)
+			summary = {
+				'count':self.count,
+				'total':self.total,
+				'mean' :self.total / self.count if self.count else None,
+				'min'  :self.min,
+				'max'  :self.max,
+				}
+		if len(recent):
+			p50,p90,p99 = numpy.percentile(recent,[50,90,99])
+			summary['recent'] = {'count':len(recent),'mean':float(recent.mean()),'p50':float(p50),'p90':float(p90),'p99':float(p99),'max':float(recent.max())}
+		else:
+			summary['recent'] = None
+		edges = [None] + HISTOGRAM_EDGES + [None]
+		summary['histogram'] = [[edges[n],edges[n+1],counts[n]] for n in range(len(counts)) if counts[n]]
+		return summary
+
+class RateMeter(object):
+	def __init__(self,window=64):
+		"""window : number of most recent marks that the rate is taken over"""
+		self.marks = collections.deque(maxlen=window) # (time, total count)
+
+	def mark(self,when,total):
+		"""Records that <total> things had been done by time <when> (in seconds)."""
+		self.marks.append((when,total))
+
+	def rate(self):
+		"""Returns the rate (per second) over the window, or None until there are two marks."""
+		if len(self.marks) < 2:return None
+		(t0,n0),(t1,n1) = self.marks[0],self.marks[-1]
+		return (n1 - n0) / (t1 - t0) if t1 > t0 else None
@@ -0,0 +1,68 @@
+"""
+Sweep files: a sweep described declaratively, in JSON (or YAML, if PyYAML is installed), so that it can be run without the UI.
+
+A sweep file holds the same description as Sweeper.definition(), plus what to do with the data:
+{
+	"axes"      : [ {"start":0, "end":1, "points":11, "min_ramp_duration":0, "post_ramp_delay":0, "label":"x"}, ... ],
+	"swept"     : [ {"kind":"dev", "label":"V0", "setting":["server","device","set_voltage"], "inputs":[0], "var_slot":1, "max_step_size":0.01}, ... ],
+	"recorded"  : [ {"kind":"dev", "label":"I0", "setting":["server","device","read_current"], "inputs":[0]}, ... ],
+	"mesh"      : {"lincombs":[[0,1],...], ...other generate_mesh() arguments (optional)},
+	"dataset"   : {"name":"my sweep", "location":"\\data\\test"},   (optional; without it, nothing is logged)
+	"comments"  : [ ["comment","user"], ... ],                        (optional)
+	"parameters": [ ["name","units",value], ... ],                    (optional)
+	"sweeper"   : { Sweeper() arguments, e.g. "async_logging":true },  (optional)
+	"checkpoint": {"path":"sweep.checkpoint", "interval":60},         (optional; see Sweeper.enable_checkpoints)
+	"compile"   : false                                               (optional; see Sweeper.compile_schedule)
+}
+"""
+import json
+
+try:
+	import yaml
+except ImportError:
+	yaml = None
+
+def _to_str(obj):
+	"""python 2's json gives unicode strings, which the LabRAD settings & DataSet don't all accept."""
+	if str is bytes:
+		if isinstance(obj,dict)     :return dict([(_to_str(k),_to_str(v)) for k,v in obj.items()])
+		if isinstance(obj,list)     :return [_to_str(v) for v in obj]
+		if isinstance(obj,unicode)  :return obj.encode('utf-8')
+	return obj
+
+def load_sweep_file(path):
+	"""Reads a sweep file (.json, or .yaml/.yml) and checks that it has the required sections."""
+	with open(path,'r') as f:
+		if path.lower().endswith(('.yaml','.yml')):
+			if yaml is None:raise ValueError("Reading YAML sweep files requires PyYAML; use a JSON sweep file instead")
+			sweep = yaml.safe_load(f)
+		else:
+			sweep = json.load(f)
+	sweep = _to_str(sweep)
+
+	if not isinstance(sweep,dict):raise ValueError("Sweep file {path} must describe a sweep as a dict/object".format(path=path))
+	for key in ['axes','swept','recorded','mesh']:
+		if not key in sweep:raise ValueError("Sweep file {path} has no '{key}' section".format(path=path,key=key))
+	if not 'lincombs' in sweep['mesh']:raise ValueError("Sweep file {path} has no lincombs in its 'mesh' section".format(path=path))
+	return sweep
+
+def build_sweep(sweep,sweeper_class,**kwargs):
+	"""
+	Creates a Sweeper from a sweep file's contents (see load_sweep_file) and starts it: generates its mesh, adds the comments
+	and parameters, creates the dataset (if given), and enables checkpoints (if given).
+	kwargs are passed to Sweeper(), overriding the file's 'sweeper' section.
+	"""
+	options = dict(sweep.get('sweeper',{}))
+	options.update(kwargs)
+	s = sweeper_class.from_definition(sweep,**options)
+	s.generate_mesh(**sweep['mesh'])
+	if sweep.get('compile'):
+		s.compile_schedule()
+
+	if sweep.get('comments')  :s.add_comments(sweep['comments'])
+	if sweep.get('parameters'):s.add_parameters(sweep['parameters'])
+	if sweep.get('dataset'):
+		s.initialize_dataset(sweep['dataset']['name'],sweep['dataset']['location'])
+	if sweep.get('checkpoint'):
+		s.enable_checkpoints(sweep['checkpoint']['path'],sweep['checkpoint'].get('interval',60.0))
+	return s
@@ -13,8 +13,14 @@ class Axis(object):
 		self.values = numpy.linspace(start, end     , points)
 		self.coords = numpy.linspace(0    , points-1, points).astype(int)
 
+traversals = ['raster','serpentine']
+
 class SweepMesh(object):
-	def __init__(self):
+	def __init__(self,traversal='raster'):
+		if not (traversal in traversals):raise ValueError("traversal must be one of {traversals}; got {traversal}".format(traversals=traversals,traversal=traversal))
+		self.traversal = traversal # raster     : lower axes return to position 0 each time a higher axis is stepped.
+		                           # serpentine : lower axes reverse direction each time a higher axis is stepped,
+		                           #              so that no ramp back to the start of the axis is needed.
 		self.has_mesh = False
 		self.m        = numpy.array([])
 		self.complete = False
@@ -22,56 +28,232 @@ class SweepMesh(object):
 
 		self.first_pos = True
 
+		self.lazy       = None # None for a materialized mesh (self.m), or 'linear' / 'functions' for a lazy mesh.
+		                       # A lazy mesh only stores the axis values and the functions (or linear combinations),
+		                       # and computes the values at each position when they are requested.
+		self._axis_values = [] # values along each axis (lazy meshes only)
+		self._lincombs    = None
+		self._functions   = None
+		self._flat        = None # storage of a materialized mesh, (points x values), with points in raster order (first axis fastest).
+		                         # self.m is a view of this indexed as m[x,y,z,...][n], so that runs of points are contiguous.
+
+	def set_traversal(self,traversal):
+		"""Sets the order in which the mesh is traversed ('raster' or 'serpentine'). Must be called before the mesh is generated/loaded."""
+		if self.has_mesh:raise ValueError("Mesh already generated/loaded")
+		if not (traversal in traversals):raise ValueError("traversal must be one of {traversals}; got {traversal}".format(traversals=traversals,traversal=traversal))
+		self.traversal = traversal
+
 	def total_steps(self):
 		p=1
 		for l in self.axis_lengths:
 			p*=l
 		return p-1
 
+	def _allocate(self,axis_lengths,n_values):
+		"""Allocates storage for a materialized mesh as self._flat, with self.m as a view of it."""
+		n_axes     = len(axis_lengths)
+		self._flat = numpy.empty([int(numpy.prod(axis_lengths)),n_values])
+		self.m     = self._flat.reshape(axis_lengths[::-1]+[n_values]).transpose(list(range(n_axes))[::-1]+[n_axes])
+
 	def from_array(self,array):
 		"""Takes mesh from an arbitrary array"""
 		if self.has_mesh:raise ValueError("Mesh already generated/loaded")
-		self.m              = array
+		array = numpy.asarray(array)
+		self._allocate(list(array.shape[:-1]),array.shape[-1])
+		self.m[...]         = array
 		self.n_axes         = len(self.m.shape[:-1])
 		self.axis_lengths   = [int(self.m.shape[n]) for n in range(self.n_axes)]
 		self.axis_positions = [0 for n in range(self.n_axes)]
 		self.end_positions  = [length - 1 for length in self.axis_lengths]
+		self.directions     = [1 for n in range(self.n_axes)] # direction each axis is currently moving in
 		self.has_mesh       = True
 
-	def from_functions(self,axes,functions):
-		"""mesh[x,y,z,...][n] = functions[n](x,y,z,...)"""
+	def from_functions(self,axes,functions,lazy=False,vectorized=True):
+		"""
+		mesh[x,y,z,...][n] = functions[n](x,y,z,...)
+		If lazy is True, the mesh is not materialized; values are computed when they are requested.
+
+		Functions are called once each, with the axis values given as open grids (numpy.ix_), so they must
+		operate element-wise on arrays and return something that broadcasts to the shape of the mesh
+		(e.g. lambda x,y:x*y, or a constant.) Functions that only accept scalars can be used by passing
+		vectorized=False, at the cost of one call per mesh point.
+		"""
 		if self.has_mesh:raise ValueError("Mesh already generated/loaded")
 		n_axes       = len(axes)
 		n_functions  = len(functions)
 		axis_lengths = [axis.points for axis in axes]
-		self.m       = numpy.zeros(axis_lengths+[n_functions])
-		for inst in range(n_functions):
-			func = lambda *x:functions[inst]( *[axes[k].values[x[k].astype(int)] for k in range(len(x))] )
-			self.m[...,inst::n_functions]=numpy.fromfunction(func,axis_lengths).reshape(axis_lengths+[1])
+		if lazy:
+			self.lazy         = 'functions'
+			self._axis_values = [axis.values for axis in axes]
+			self._functions   = [func if vectorized else numpy.vectorize(func,otypes=[float]) for func in functions]
+		else:
+			grids = numpy.ix_(*[axis.values for axis in axes])
+			self._allocate(axis_lengths,n_functions)
+			for inst in range(n_functions):
+				func = functions[inst] if vectorized else numpy.vectorize(functions[inst],otypes=[float])
+				self.m[...,inst] = func(*grids) # broadcasts the result over the full mesh
 
 		self.n_axes         = n_axes
 		self.axis_lengths   = axis_lengths
 		self.axis_positions = [0 for n in range(self.n_axes)]
 		self.end_positions  = [length - 1 for length in self.axis_lengths]
+		self.directions     = [1 for n in range(self.n_axes)] # direction each axis is currently moving in
 		self.has_mesh       = True
 
-	def from_linear_functions(self,axes,lincombs):
-		"""mesh[x,y,z,...][n] = lincombs[n][0] + x*lincombs[n][1] + y*lincombs[n][2] + ..."""
+	def from_linear_functions(self,axes,lincombs,lazy=False):
+		"""
+		mesh[x,y,z,...][n] = lincombs[n][0] + x*lincombs[n][1] + y*lincombs[n][2] + ...
+		If lazy is True, the mesh is not materialized; values are computed when they are requested.
+		Memory use is then independent of the number of points in the mesh.
+		"""
 		if self.has_mesh:raise ValueError("Mesh already generated/loaded")
 		n_combs      = len(lincombs)
 		n_axes       = len(axes)
 		axis_lengths = [axis.points for axis in axes]
-		self.m       = numpy.zeros(axis_lengths+[n_combs])
-		for inst in range(n_combs):
-			func = lambda *x:lincombs[inst][0]+sum([lincombs[inst][k+1]*axes[k].values[x[k].astype(int)] for k in range(n_axes)])
-			self.m[...,inst::n_combs]=numpy.fromfunction(func,axis_lengths).reshape(axis_lengths+[1])
+		if lazy:
+			self.lazy         = 'linear'
+			self._axis_values = [axis.values for axis in axes]
+			self._lincombs    = numpy.array(lincombs,dtype=float).reshape([n_combs,n_axes+1])
+		else:
+			coeffs = numpy.array(lincombs,dtype=float).reshape([n_combs,n_axes+1])
+			self._allocate(axis_lengths,n_combs)
+			self.m[...] = coeffs[:,0]
+			for k in range(n_axes):
+				# contribution of axis k to every setting, (points_k x n_combs), broadcast along all other axes
+				shape    = [1]*n_axes + [n_combs]
+				shape[k] = axis_lengths[k]
+				self.m  += numpy.einsum('i,n->in',axes[k].values,coeffs[:,k+1]).reshape(shape)
 
 		self.n_axes         = n_axes
 		self.axis_lengths   = axis_lengths
 		self.axis_positions = [0 for n in range(self.n_axes)]
 		self.end_positions  = [length - 1 for length in self.axis_lengths]
+		self.directions     = [1 for n in range(self.n_axes)] # direction each axis is currently moving in
 		self.has_mesh       = True
 
+	def values_at(self,positions):
+		"""Returns the values of the mesh at the given (integer) axis positions."""
+		if not self.has_mesh: raise ValueError("mesh has not been generated yet")
+		if self.lazy == 'linear':
+			point = [self._axis_values[k][positions[k]] for k in range(self.n_axes)]
+			return self._lincombs[:,0] + self._lincombs[:,1:].dot(point)
+		if self.lazy == 'functions':
+			point = [self._axis_values[k][positions[k]] for k in range(self.n_axes)]
+			return numpy.array([float(func(*point)) for func in self._functions])
+		return numpy.array(tuple(self.m[tuple(positions)]))
+
+	def _positions_at(self,indices):
+		"""
+		Converts step indices (0 being the first point) to axis positions.
+		Returns [positions,digits], both (len(indices) x n_axes) integer arrays;
+		digits are the positions the steps would have in raster order.
+		"""
+		digits = numpy.array(numpy.unravel_index(indices,self.axis_lengths,order='F')).T.reshape([len(indices),self.n_axes])
+		if self.traversal == 'raster':
+			return [digits,digits]
+
+		# serpentine: axis k runs backwards on every odd pass, passes being counted by the axes above it.
+		positions = digits.copy()
+		stride    = 1
+		for k in range(self.n_axes):
+			stride *= self.axis_lengths[k]
+			odd     = (indices // stride) % 2 == 1
+			positions[odd,k] = self.axis_lengths[k] - 1 - digits[odd,k]
+		return [positions,digits]
+
+	def _directions_at(self,index):
+		"""Returns the direction each axis is moving in once the point at step <index> has been reached."""
+		if self.traversal == 'raster':
+			return [1 for n in range(self.n_axes)]
+		directions = []
+		stride     = 1
+		for k in range(self.n_axes):
+			stride *= self.axis_lengths[k]
+			directions.append(-1 if (index // stride) % 2 else 1)
+		return directions
+
+	def index_of(self,positions):
+		"""Returns the step index (0 being the first point) at which the mesh reaches the given axis positions."""
+		if not self.has_mesh: raise ValueError("mesh has not been generated yet")
+		if len(positions) != self.n_axes:raise ValueError("Expected {n_axes} axis positions, got {positions}".format(n_axes=self.n_axes,positions=positions))
+		index = 0
+		for k in reversed(range(self.n_axes)):
+			if not (0 <= positions[k] < self.axis_lengths[k]):raise ValueError("Position {pos} is outside of axis {k} (length {length})".format(pos=positions[k],k=k,length=self.axis_lengths[k]))
+			digit = positions[k]
+			if self.traversal == 'serpentine' and index % 2:
+				digit = self.axis_lengths[k] - 1 - positions[k] # odd pass, so this axis is running backwards
+			index = index*self.axis_lengths[k] + digit
+		return int(index)
+
+	def seek(self,target):
+		"""
+		Moves the mesh so that the next call to next() (or next_block()) returns the given point,
+		as the first call does. target is either a step index (0 being the first point), or a list of axis positions.
+		"""
+		if not self.has_mesh: raise ValueError("mesh has not been generated yet")
+		index = self.index_of(target) if isinstance(target,(list,tuple,numpy.ndarray)) else int(target)
+		if not (0 <= index <= self.total_steps()):raise ValueError("Step index {index} is outside of the mesh (0 to {total})".format(index=index,total=self.total_steps()))
+
+		self.axis_positions = [int(p) for p in self._positions_at(numpy.array([index]))[0][0]]
+		self.directions     = self._directions_at(index)
+		self.steps_done     = index
+		self.first_pos      = True
+		self.complete       = False
+
+	def get_block(self,start,stop):
+		"""
+		Returns [positions,values,axes] for steps start to stop-1 of the mesh, without changing the iteration state.
+		positions : (k x n_axes)   integer array of the axis positions of each point
+		values    : (k x n_values) array of the values at each point
+		axes      : (k)            integer array of the axis stepped to reach each point (-1 for the first point of the mesh)
+
+		For a materialized mesh with raster traversal, values is a view into the mesh rather than a copy.
+		"""
+		if not self.has_mesh: raise ValueError("mesh has not been generated yet")
+		if not (0 <= start <= stop <= self.total_steps()+1):raise ValueError("Steps {start} to {stop} are outside of the mesh".format(start=start,stop=stop))
+		indices = numpy.arange(start,stop)
+		positions,digits = self._positions_at(indices)
+
+		axes = numpy.argmax(digits != 0,axis=1) # the axis stepped is the lowest one that didn't wrap around
+		axes[indices == 0] = -1
+
+		if self.lazy == 'linear':
+			point  = numpy.column_stack([self._axis_values[k][positions[:,k]] for k in range(self.n_axes)])
+			values = self._lincombs[:,0] + point.dot(self._lincombs[:,1:].T)
+		elif self.lazy == 'functions':
+			point  = [self._axis_values[k][positions[:,k]] for k in range(self.n_axes)]
+			values = numpy.column_stack([numpy.broadcast_to(func(*point),[len(indices)]) for func in self._functions])
+		elif self.traversal == 'raster':
+			values = self._flat[start:stop]
+		else:
+			values = self.m[tuple(positions.T)]
+		return [positions,values,axes]
+
+	def next_block(self,k):
+		"""
+		Advances up to k positions at once; equivalent to calling next() k times, but returns arrays (see get_block.)
+		Fewer than k points are returned if the end of the mesh is reached.
+		As with next(), the first point (of the mesh, or after seek()) has axis -1, since no axis was stepped to reach it.
+		"""
+		if not self.has_mesh: raise ValueError("mesh has not been generated yet")
+		if self.complete    : raise ValueError("SweepMesh object has finished iterating")
+		if k < 1            : raise ValueError("Must advance by at least one position")
+
+		start = self.steps_done if self.first_pos else self.steps_done + 1
+		stop  = min([start + k, self.total_steps() + 1])
+		block = self.get_block(start,stop)
+		if self.first_pos:
+			block[2][0] = -1
+
+		# leave the iteration state as next() would have
+		self.first_pos      = False
+		self.steps_done     = stop - 1
+		self.axis_positions = [int(p) for p in block[0][-1]]
+		self.directions     = self._directions_at(self.steps_done)
+		if self.steps_done >= self.total_steps():
+			self.complete = True
+		return block
+
 	def next(self):
 		"""Advances the position(s), then returns [(positions),(values),axis being stepped]. First call returns the origin of the mesh."""
 		if not self.has_mesh: raise ValueError("mesh has not been generated yet")
@@ -79,12 +261,29 @@ class SweepMesh(object):
 
 		if self.first_pos:
 			# We want the first next() call to return the values at (0,0,0,...) so we don't advance on the first call.
+			# (or, after seek(), the values at the position seeked to.)
 			self.first_pos = False
-			return [list(self.axis_positions),numpy.array(tuple(self.m[tuple(self.axis_positions)])),-1]
+			if self.steps_done >= self.total_steps():
+				self.complete = True
+			return [list(self.axis_positions),self.values_at(self.axis_positions),-1]
 
 		axis = 0
 		done = False
 		while not done:
+			if self.traversal == 'serpentine':
+				self.axis_positions[axis] += self.directions[axis]
+				if 0 <= self.axis_positions[axis] < self.axis_lengths[axis]:
+					done = True
+				else:
+					# this axis stays at its end, and runs back the other way once the next axis has stepped.
+					self.axis_positions[axis] -= self.directions[axis]
+					self.directions[axis]      = -self.directions[axis]
+					axis+=1
+					if axis >= self.n_axes:
+						self.complete=True
+						done=True
+				continue
+
 			self.axis_positions[axis] += 1
 			if self.axis_positions[axis] >= self.axis_lengths[axis]:
 				self.axis_positions[axis]=0
@@ -98,7 +297,9 @@ class SweepMesh(object):
 					self.complete = True
 
 		self.steps_done += 1
-		return [list(self.axis_positions),numpy.array(tuple(self.m[tuple(self.axis_positions)])),axis]
+		if self.steps_done >= self.total_steps():
+			self.complete = True # the serpentine end position depends on the parity of the axis lengths, so count steps instead.
+		return [list(self.axis_positions),self.values_at(self.axis_positions),axis]
 
 # examples
 if __name__ == '__main__':
@@ -120,6 +321,21 @@ if __name__ == '__main__':
 	for inst in range(6):print(g.next())
 	print("")
 
+	l = SweepMesh() # same mesh as above, but evaluated as each point is reached rather than stored
+	l.from_linear_functions([a1,a2],[ [1,0,0],[0,0,1],[0,1,0],[0,1,1] ],lazy=True)
+	for inst in range(6):print(l.next())
+	print("")
+
+	r = SweepMesh('serpentine') # every other pass along the first axis runs backwards
+	r.from_linear_functions([a1,a2],[ [1,0,0],[0,0,1],[0,1,0],[0,1,1] ])
+	for inst in range(6):print(r.next())
+	print("")
+
+	b = SweepMesh() # points can also be taken several at a time, as arrays
+	b.from_linear_functions([a1,a2],[ [1,0,0],[0,0,1],[0,1,0],[0,1,1] ])
+	while not b.complete:print(b.next_block(4))
+	print("")
+
 	a = SweepMesh()
 	a.from_array(numpy.random.random_integers(0,7,[2,2,4]))
 	for inst in range(4):print(a.next())
@@ -0,0 +1,222 @@
+"""
+Timeline of the LabRAD calls made during a sweep, for finding where calls are serialized or stall
+(e.g. a select_device retry after a failed get.)
+
+Spans are recorded in a Tracer, which is off unless started. Each Sweeper has its own (started if it is given a trace_path),
+so sweeps running at the same time don't mix or clear each other's spans; TRACER is used by whatever isn't given one.
+While it is on, spans are kept in a ring buffer of capacity events, so memory use is bounded however long the sweep; once
+it is full the oldest are dropped.
+Spans are recorded for:
+	every request on a TracedConnection (server, setting, context; requests sent with wait=False last until their wait() returns)
+	each Setting's get/set (components/settings.py), and each data vault add (components/logger.py)
+	each advance() phase and measurement of the Sweeper
+Each span has the index of the mesh step being worked on (Tracer.step, kept up to date by the Sweeper.)
+write() saves them as a Chrome trace-event JSON file, which can be opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+import threading, collections, itertools, json, os
+from components.engine import monotonic
+
+class Tracer(object):
+	def __init__(self,capacity=65536):
+		"""capacity : number of spans kept; older ones are dropped"""
+		self.capacity = capacity
+		self.enabled  = False
+		self.step     = None # index of the mesh step being worked on, recorded with each span
+		self.events   = collections.deque(maxlen=capacity) # (name, category, start, end, thread id, step, args, id of concurrent spans or None)
+		self.threads  = {}   # thread id : thread name
+		self.origin   = monotonic()
+		self._count   = itertools.count() # number of spans recorded; next() on it is atomic, so spans can be recorded from any thread
+		self.recorded = 0
+
+	def start(self,capacity=None):
+		"""Clears any previous spans and starts recording."""
+		if capacity is not None:self.capacity = capacity
+		self.events   = collections.deque(maxlen=self.capacity)
+		self.threads  = {}
+		self.origin   = monotonic()
+		self._count   = itertools.count()
+		self.recorded = 0
+		self.step     = None
+		self.enabled  = True
+
+	def stop(self):
+		self.enabled = False
+
+	def add(self,name,category,start,end,args=None,concurrent=False):
+		"""
+		Records a span from start to end (monotonic times, in seconds.)
+		Spans that overlap others on the same thread without nesting in them (e.g. requests in flight at the same time)
+		must be marked concurrent, so that they are shown on their own tracks.
+		"""
+		thread = threading.current_thread()
+		self.threads[thread.ident] = thread.name
+		self.recorded = next(self._count) + 1
+		self.events.append((name,category,start,end,thread.ident,self.step,args,self.recorded if concurrent else None))
+
+	def dropped(self):
+		"""Number of spans recorded but no longer kept."""
+		return self.recorded - len(self.events)
+
+	def trace_events(self):
+		"""Returns the spans as a list of Chrome trace events (complete events, or async begin/end pairs for concurrent spans.)"""
+		pid    = os.getpid()
+		us     = lambda t:(t - self.origin)*1e6
+		events = [{'ph':'M','name':'thread_name','pid':pid,'tid':tid,'args':{'name':name}} for tid,name in self.threads.items()]
+		for name,category,start,end,tid,step,args,span_id in list(self.events):
+			args = dict(args or {},step=step)
+			if span_id is None:
+				events.append({'ph':'X','name':name,'cat':category,'ts':us(start),'dur':us(end)-us(start),'pid':pid,'tid':tid,'args':args})
+			else:
+				events.append({'ph':'b','name':name,'cat':category,'ts':us(start),'id':span_id,'pid':pid,'tid':tid,'args':args})
+				events.append({'ph':'e','name':name,'cat':category,'ts':us(end)  ,'id':span_id,'pid':pid,'tid':tid})
+		return events
+
+	def write(self,path):
+		"""Writes the spans to path as a Chrome trace-event JSON file."""
+		trace = {
+			'traceEvents'    :self.trace_events(),
+			'displayTimeUnit':'ms',
+			'otherData'      :{'recorded':self.recorded,'dropped':self.dropped(),'capacity':self.capacity},
+			}
+		with open(path,'w') as f:
+			json.dump(trace,f)
+
+class TracedFuture(object):
+	"""Wraps the future of a wait=False request; the request's span ends when wait() returns."""
+	def __init__(self,future,tracer,name,start,args):
+		self._future = future
+		self._tracer = tracer
+		self._name   = name
+		self._start  = start
+		self._args   = args
+		self._done   = False
+
+	def wait(self):
+		try:
+			return self._future.wait()
+		except Exception as e:
+			self._args['error'] = str(e)
+			raise
+		finally:
+			if not self._done:
+				self._done = True
+				self._tracer.add(self._name,'labrad',self._start,monotonic(),self._args,concurrent=True)
+
+	def __getattr__(self,name):
+		return getattr(self._future,name)
+
+class TracedSetting(object):
+	"""Wraps a setting of a server, recording a span for each call."""
+	def __init__(self,setting,tracer,server,name):
+		self._setting = setting
+		self._tracer  = tracer
+		self._span    = "{server}.{name}".format(server=server,name=name)
+		self._server  = server
+		self._name    = name
+
+	def __call__(self,*args,**kwargs):
+		if not self._tracer.enabled:
+			return self._setting(*args,**kwargs)
+		info  = {'server':self._server,'setting':self._name,'context':str(kwargs.get('context'))}
+		start = monotonic()
+		try:
+			result = self._setting(*args,**kwargs)
+		except Exception as e:
+			info['error'] = str(e)
+			self._tracer.add(self._span,'labrad',start,monotonic(),info)
+			raise
+		if kwargs.get('wait',True) is False:
+			return TracedFuture(result,self._tracer,self._span,start,info)
+		self._tracer.add(self._span,'labrad',start,monotonic(),info)
+		return result
+
+class TracedPacket(object):
+	"""Wraps a packet, recording a span (with the settings it contains) when it is sent."""
+	def __init__(self,packet,tracer,server,context):
+		self._packet   = packet
+		self._tracer   = tracer
+		self._server   = server
+		self._context  = context
+		self._settings = []
+
+	def __getitem__(self,name):
+		def add(*args,**kwargs):
+			self._packet[name](*args,**kwargs)
+			self._settings.append(name)
+			return self
+		return add
+
+	def __getattr__(self,name):
+		if name.startswith('_'):raise AttributeError(name)
+		return self[name]
+
+	def send(self,wait=True):
+		if not self._tracer.enabled:
+			return self._packet.send(wait=wait)
+		span  = "{server}.packet".format(server=self._server)
+		info  = {'server':self._server,'settings':list(self._settings),'context':str(self._context)}
+		start = monotonic()
+		try:
+			result = self._packet.send(wait=wait)
+		except Exception as e:
+			info['error'] = str(e)
+			self._tracer.add(span,'labrad',start,monotonic(),info)
+			raise
+		if not wait:
+			return TracedFuture(result,self._tracer,span,start,info)
+		self._tracer.add(span,'labrad',start,monotonic(),info)
+		return result
+
+class TracedServer(object):
+	"""Wraps a server, so that its settings (settings[name] or attributes) and packets are traced."""
+	def __init__(self,server,tracer,name):
+		self._server   = server
+		self._tracer   = tracer
+		self._name     = name
+		self.settings  = TracedSettings(self)
+
+	def packet(self,context=None,**kwargs):
+		return TracedPacket(self._server.packet(context=context,**kwargs),self._tracer,self._name,context)
+
+	def __getattr__(self,name):
+		attr = getattr(self._server,name)
+		if name.startswith('_') or name == 'context' or not callable(attr):return attr
+		return TracedSetting(attr,self._tracer,self._name,name)
+
+	def __getitem__(self,name):
+		return self.settings[name]
+
+class TracedSettings(object):
+	def __init__(self,server):
+		self._server = server
+	def __getitem__(self,name):
+		server = self._server
+		return TracedSetting(server._server.settings[name],server._tracer,server._name,name)
+
+class TracedServers(object):
+	def __init__(self,connection):
+		self._connection = connection
+	def __getitem__(self,name):
+		connection = self._connection
+		return TracedServer(connection._connection.servers[name],connection._tracer,name)
+
+class TracedConnection(object):
+	"""
+	Stands in for a LabRAD connection (or SharedConnection, FakeConnection, ...), recording a span for every request made
+	through it while the tracer is enabled. Anything else is passed on to the connection.
+	"""
+	def __init__(self,connection,tracer=None):
+		self._connection = connection
+		self._tracer     = tracer if tracer is not None else TRACER
+		self.servers     = TracedServers(self)
+
+	def __getattr__(self,name):
+		attr = getattr(self._connection,name)
+		if hasattr(attr,'settings') and hasattr(attr,'packet'): # a server, e.g. connection.data_vault
+			return TracedServer(attr,self._tracer,name)
+		return attr
+
+	def __getitem__(self,name):
+		return self.servers[name]
+
+TRACER = Tracer()
@@ -682,6 +682,17 @@ class Ui_setup(object):
         self.cb_no_log.setObjectName(_fromUtf8("cb_no_log"))
         self.horizontalLayout_5.addWidget(self.cb_no_log)
         self.verticalLayout_31.addLayout(self.horizontalLayout_5)
+        self.horizontalLayout_32 = QtGui.QHBoxLayout()
+        self.horizontalLayout_32.setSpacing(0)
+        self.horizontalLayout_32.setObjectName(_fromUtf8("horizontalLayout_32"))
+        self.status_lbl_estimate = QtGui.QLineEdit(self.verticalLayoutWidget_19)
+        self.status_lbl_estimate.setReadOnly(True)
+        self.status_lbl_estimate.setObjectName(_fromUtf8("status_lbl_estimate"))
+        self.horizontalLayout_32.addWidget(self.status_lbl_estimate)
+        self.status_btn_estimate = QtGui.QPushButton(self.verticalLayoutWidget_19)
+        self.status_btn_estimate.setObjectName(_fromUtf8("status_btn_estimate"))
+        self.horizontalLayout_32.addWidget(self.status_btn_estimate)
+        self.verticalLayout_31.addLayout(self.horizontalLayout_32)
         self.verticalLayoutWidget_22 = QtGui.QWidget(self.centralwidget)
         self.verticalLayoutWidget_22.setGeometry(QtCore.QRect(0, 570, 571, 193))
         self.verticalLayoutWidget_22.setObjectName(_fromUtf8("verticalLayoutWidget_22"))
@@ -861,6 +872,9 @@ class Ui_setup(object):
         self.status_cb_start_paused.setText(_translate("setup", "Start Paused", None))
         self.cb_no_log.setToolTip(_translate("setup", "<html><head/><body><p>If this box is checked, no DataVault file will be created for this sweep, and the data created will not be logged anywhere.</p><p>This is intended to be used on sweeps for testing purposes.</p></body></html>", None))
         self.cb_no_log.setText(_translate("setup", "Do not log", None))
+        self.status_lbl_estimate.setToolTip(_translate("setup", "<html><head/><body><p>Estimated duration of the sweep, including the time taken to set and read each setting.</p></body></html>", None))
+        self.status_lbl_estimate.setPlaceholderText(_translate("setup", "Estimated duration", None))
+        self.status_btn_estimate.setText(_translate("setup", "Estimate", None))
         self.com_lbl_comments.setText(_translate("setup", "Comments", None))
         self.com_inp_author.setPlaceholderText(_translate("setup", "Comment author", None))
         self.com_btn_add.setText(_translate("setup", "Add Comment", None))
@@ -60,11 +60,29 @@ class Ui_MainWindow(object):
         self.lbl_steps_total.setReadOnly(True)
         self.lbl_steps_total.setObjectName(_fromUtf8("lbl_steps_total"))
         self.gridLayout.addWidget(self.lbl_steps_total, 1, 1, 1, 1)
+        self.lineEdit_2 = QtGui.QLineEdit(self.horizontalLayoutWidget_2)
+        self.lineEdit_2.setStyleSheet(_fromUtf8("QLineEdit { background-color: rgb(224,224,224) }"))
+        self.lineEdit_2.setReadOnly(True)
+        self.lineEdit_2.setObjectName(_fromUtf8("lineEdit_2"))
+        self.gridLayout.addWidget(self.lineEdit_2, 0, 2, 1, 1)
+        self.lbl_eta = QtGui.QLineEdit(self.horizontalLayoutWidget_2)
+        self.lbl_eta.setReadOnly(True)
+        self.lbl_eta.setObjectName(_fromUtf8("lbl_eta"))
+        self.gridLayout.addWidget(self.lbl_eta, 1, 2, 1, 1)
         self.verticalLayout.addLayout(self.gridLayout)
+        self.horizontalLayout_progress = QtGui.QHBoxLayout()
+        self.horizontalLayout_progress.setObjectName(_fromUtf8("horizontalLayout_progress"))
         self.bar_progress = QtGui.QProgressBar(self.horizontalLayoutWidget_2)
         self.bar_progress.setProperty("value", 0)
         self.bar_progress.setObjectName(_fromUtf8("bar_progress"))
-        self.verticalLayout.addWidget(self.bar_progress)
+        self.horizontalLayout_progress.addWidget(self.bar_progress)
+        self.lbl_rate = QtGui.QLabel(self.horizontalLayoutWidget_2)
+        self.lbl_rate.setMinimumSize(QtCore.QSize(90, 0))
+        self.lbl_rate.setText(_fromUtf8(""))
+        self.lbl_rate.setAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignTrailing|QtCore.Qt.AlignVCenter)
+        self.lbl_rate.setObjectName(_fromUtf8("lbl_rate"))
+        self.horizontalLayout_progress.addWidget(self.lbl_rate)
+        self.verticalLayout.addLayout(self.horizontalLayout_progress)
         self.verticalLayout_4.addLayout(self.verticalLayout)
         self.horizontalLayout = QtGui.QHBoxLayout()
         self.horizontalLayout.setSpacing(0)
@@ -118,6 +136,7 @@ class Ui_MainWindow(object):
         MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow", None))
         self.lineEdit.setText(_translate("MainWindow", "Steps complete", None))
         self.lineEdit_3.setText(_translate("MainWindow", "Steps total", None))
+        self.lineEdit_2.setText(_translate("MainWindow", "Time remaining", None))
         self.btn_pause.setText(_translate("MainWindow", "Pause", None))
         self.btn_unpause.setText(_translate("MainWindow", "Unpause", None))
         self.lineEdit_6.setText(_translate("MainWindow", "DataVault filename", None))
@@ -1,14 +1,22 @@
-import sys,labrad,time
+import sys
 from PyQt4 import QtGui as gui, QtCore as core
 from qtdesigner import setup,sweep_runner
 from qtdesigner.setup_widgets import AxisBar,InputDialogSwept,InputDialogRecorded
 from labrad_exclude import SERVERS,SETTINGS
 from components.settings import builtins as BUILTINS
+from components.connection_handler import CONNECTION_HANDLER
+from components.engine import SweepEngine
 import sweeper
 
 strn   = lambda s:str(s)   if s is not None else ""
 floatn = lambda s:float(s) if s is not None else None
 
+def format_duration(seconds):
+	"""Formats a duration in seconds as h:mm:ss"""
+	if seconds is None:return "unknown"
+	seconds = int(round(seconds))
+	return "{h}:{m:02d}:{s:02d}".format(h=seconds//3600,m=(seconds//60)%60,s=seconds%60)
+
 class proto_swept_setting(object):
 	"""Houses the data associated with a swept setting that hasn't been added to a sweep yet"""
 	def __init__(self,n,_cxn):
@@ -157,38 +165,45 @@ class SweepWindow(gui.QMainWindow,sweep_runner.Ui_MainWindow):
 
 		self.bar_progress.setRange(0,self.steps_total)
 
+		# The sweep runs in its own thread (see SweepEngine); the timer only refreshes the display.
+		self.engine = SweepEngine(self._sweep,paused=paused)
+		self.engine.start()
+
 		self.timer = core.QTimer(self)
-		self.timer.setInterval(75) # 75 ms ~ device communication latency
-		self.timer_first_call = True # whether or not the call of the timer event loop is the first one.
+		self.timer.setInterval(100)
 		self.timer.timeout.connect(self.timer_event)
 		self.timer.start()
 
 	def timer_event(self):
 		if self.done:return
-		if self.paused:return
 
-		if self._sweep._mode == 'sweep':
-		
-			if self.timer_first_call == True:
-				self.timer_first_call = False
-				self._sweep.advance(0.075) # on first call, assume exactly 75ms have passed
-				self.last_time = time.time()
-				
-			else:
-				this_time = time.time()
-				self._sweep.advance(this_time - self.last_time) # on subsequent calls, advance by the time elapsed since last call of this function
-				self.last_time = this_time
-				
-		if self._sweep._mode == 'done':
+		status = self.engine.status()
+		if status['state'] in ['done','aborted','error']:
 			self.done = True
+			self.timer.stop()
 
-		self.lbl_steps_complete.setText(str(self._sweep._mesh.steps_done))
-		self.bar_progress.setValue(self._sweep._mesh.steps_done)
+		self.lbl_steps_complete.setText(str(status['steps_done']))
+		self.lbl_eta.setText(format_duration(status['eta']))
+		self.bar_progress.setValue(status['steps_done'])
+		self.lbl_rate.setText("" if status['rate'] is None else "{rate:.3g} points/s".format(rate=status['rate']))
 
 	def pause(self):
 		self.paused=True
+		self.engine.pause()
 	def unpause(self):
 		self.paused=False
+		self.engine.resume()
+
+	def closeEvent(self,event):
+		# the Sweeper must be closed (finishing its data & releasing its connection) by whichever thread is last to use it:
+		# here once the engine has stopped, or by the engine thread itself if it doesn't stop in time.
+		self.engine.close_when_done = True
+		if self.engine.running():
+			self.engine.abort()
+			self.engine.join(1.0)
+		if not self.engine.running():
+			self._sweep.close()
+		event.accept()
 
 
 
@@ -243,7 +258,7 @@ class SetupWindow(gui.QMainWindow,setup.Ui_setup):
 
 
 	def labrad_connect(self):
-		self._cxn = labrad.connect()
+		self._cxn = CONNECTION_HANDLER.acquire() # shared with the sweeps started from this window, so they don't have to connect themselves
 	def refresh_lists(self):
 		"""Fetches servers, devices, settings, etc. from LabRAD"""
 		# Called once upon start-up, will later be added as hotkey (ctrl+r probably.)
@@ -331,6 +346,7 @@ class SetupWindow(gui.QMainWindow,setup.Ui_setup):
 
 		# sweep start
 		self.status_btn_start.clicked.connect(self.start_sweep)
+		self.status_btn_estimate.clicked.connect(self.estimate_sweep)
 
 		# swept settings
 		self.swp_btn_add.clicked.connect(self.add_swept_setting)
@@ -400,9 +416,9 @@ class SetupWindow(gui.QMainWindow,setup.Ui_setup):
 		self.vis_rec(False)
 
 	#
-	def start_sweep(self):
-		"""Initializes a sweeper object with user-provided details"""
-		s = sweeper.Sweeper()
+	def build_sweeper(self,**kwargs):
+		"""Returns a Sweeper (in setup mode) with the axes and settings entered. kwargs are passed to Sweeper()"""
+		s = sweeper.Sweeper(**kwargs)
 
 		for axis in self.axes:
 			start     = float(str(axis.inp_start.text()))
@@ -430,8 +446,25 @@ class SetupWindow(gui.QMainWindow,setup.Ui_setup):
 				s.add_recorded_setting('dev',rec.label,setting=rec.rad_strings,inputs=rec.rad_inputs)
 			if rec.type == 'Builtin':
 				s.add_recorded_setting('builtin',rec.label,which_builtin=rec.builtin_type)
+		return s
+
+	def lincombs(self):
+		return [ [float(k) for k in swp.coeff[:1+len(self.axes)]] for swp in self.swept_settings ]
+
+	def estimate_sweep(self):
+		"""Shows the estimated duration of the sweep entered, with latencies measured by reading each setting a few times."""
+		s = self.build_sweeper()
+		try:
+			s.measure_latencies()
+			self.status_lbl_estimate.setText(format_duration(s.estimate_duration(self.lincombs())))
+		except Exception as e:
+			self.status_lbl_estimate.setText("error: {err}".format(err=e))
+		s.close()
 
-		s.generate_mesh([ [float(k) for k in swp.coeff[:1+len(self.axes)]] for swp in self.swept_settings ])
+	def start_sweep(self):
+		"""Initializes a sweeper object with user-provided details"""
+		s = self.build_sweeper(async_logging=True)
+		s.generate_mesh(self.lincombs())
 
 		s.add_comments([ [c[1],c[0]] for c in self.comments ])
 		s.add_parameters(self.parameters)
@@ -1029,6 +1062,7 @@ class SetupWindow(gui.QMainWindow,setup.Ui_setup):
 		"""Updates availability of sweep start based on existence of issues. Also updates UI list of issues."""
 		ready = not any(self.sweep_checks.values())
 		self.status_btn_start.setEnabled(ready)
+		self.status_btn_estimate.setEnabled(ready)
 		self.status_lbl_status.setText("ready" if ready else "not ready")
 		self.update_check_list()
 
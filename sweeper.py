@@ -1,16 +1,78 @@
 from components.sweep_mesh import SweepMesh, Axis
-from components.settings   import Setting
-from components.logger     import DataSet
-import labrad, time
+from components.settings   import Setting, SettingBatch, SettingCache, dac_resolution
+from components.logger     import DataSet, stored_counts
+from components.checkpoint import write_checkpoint, read_checkpoint
+from components.connection_handler import CONNECTION_HANDLER
+from components.engine     import monotonic
+from components.schedule   import RampSchedule
+from components.stats      import LatencyStats, RateMeter
+from components.tracing    import Tracer, TracedConnection
+try:
+	from labrad.units import Value
+except ImportError:
+	Value = None # pylabrad isn't installed (e.g. when running on a FakeConnection); there are no Values to handle.
+import time, json, math, numpy
+
+TIMED_PHASES = ['pre_sweep','ramp','delay','schedule','post_sweep'] # phases of advance() timed separately (see Sweeper.stats())
 
 class Sweeper(object):
-	def __init__(self):
-		self._cxn  = labrad.connect()
+	def __init__(self,async_logging=False,spool_dir=None,connection=None,batch_packets=False,ramp_resolution=0.075,setting_cache=None,stats_path=None,trace_path=None):
+		"""
+		If async_logging is True, data is written to the data vault by a background thread (see DataSet) rather than as each point is measured.
+		If spool_dir is given, data that hasn't been written to the data vault (e.g. before initialize_dataset is called) is kept in a file in
+		that directory rather than in memory.
+
+		The settings and the data set use the given LabRAD connection (or a stand-in such as components.fake_labrad.FakeConnection),
+		or the shared connection (CONNECTION_HANDLER) if none is given.
+
+		If batch_packets is True, the swept (and recorded) settings are set (and read) each step with one LabRAD packet
+		per server & device, sent concurrently, rather than one request per setting (see SettingBatch.)
+
+		ramp_resolution is the longest time (in seconds) between the steps of a ramp, and the time between the steps of
+		the pre-sweep and post-sweep (which have no duration of their own.) See next_deadline().
+
+		If a SettingCache is given, the settings take their contexts and VDS channel details from it (see SweepQueue.)
+
+		If stats_path is given, the timing statistics of the sweep (see stats()) are written to it as JSON when the sweep is closed.
+
+		If trace_path is given, every LabRAD call of the sweep is traced (see components/tracing.py), and the timeline is
+		written to trace_path as a Chrome trace-event file when the sweep is closed.
+		"""
+		if ramp_resolution <= 0:raise ValueError("ramp_resolution must be greater than zero")
+		self._own_connection = connection is None
+		self._closed = False # whether close() has been called
+		self._cxn  = CONNECTION_HANDLER.acquire() if connection is None else connection
+		self._trace_path = trace_path
+		self._tracer     = Tracer() # this sweep's own, so that sweeps traced at the same time (e.g. in a SweepQueue) keep their own spans
+		if trace_path:
+			self._tracer.start()
+			self._cxn = TracedConnection(self._cxn,self._tracer)
+		self._async_logging = async_logging
+		self._spool_dir     = spool_dir
+		self._batch_packets = batch_packets
+		self._setting_cache = setting_cache
+		self._ramp_resolution = float(ramp_resolution)
+		self._measured      = 0    # number of points measured so far
+		self._schedule      = None # RampSchedule, if compile_schedule() has been called
+		self._estimator     = None # RampSchedule used by estimate_duration() during the sweep
+		self._swp_batch     = None # SettingBatch objects for the swept/recorded settings, created when the sweep starts if batch_packets is set.
+		self._rec_batch     = None
+		self._stats_path    = stats_path
+		self._timings       = dict([(name,LatencyStats()) for name in TIMED_PHASES+['measure','mesh','slack']]) # see stats()
+		self._rate          = RateMeter() # rate of points measured
 		self._mesh = SweepMesh() # starts not generated. Can be generated once all axes / settings are defined.
 		self._axes = []          # list of axes (just stored as their lengths.)
 		self._swp  = []          # list of settings (SettingObject instances) to be set each step
 		self._rec  = []          # list of settings (SettingObject instances) to be recorded each step
 		self._axes_labels = []   # list of axis labels
+		self._swp_defs    = []   # arguments each swept    setting was added with, so that the sweep can be re-created (see definition())
+		self._rec_defs    = []   # arguments each recorded setting was added with
+
+		self._checkpoint_path     = None # file to periodically save the progress of the sweep to (see enable_checkpoints())
+		self._checkpoint_interval = None
+		self._checkpoint_time     = None # time at which the last checkpoint was written
+		self._last_set_state      = None # state most recently sent to the swept settings
+		self._buffered            = False # whether lines of the first axis are performed as buffered ramps (see _check_buffered())
 
 		self._mode  = 'setup'    # Current mode/status of the Sweeper object.
 		                         # setup = currently setting up for the sweep. Not ready to set/take data.
@@ -39,7 +101,7 @@ class Sweeper(object):
 		self._axes.append(Axis(start,end,points,min_ramp_duration,post_ramp_delay))
 		self._axes_labels.append("" if label is None else label)
 
-	def add_swept_setting(self, kind, label=None, max_step_size=None, ID=None, name=None, setting=None, inputs=None, var_slot=None, which_builtin=None):
+	def add_swept_setting(self, kind, label=None, max_step_size=None, ID=None, name=None, setting=None, inputs=None, var_slot=None, which_builtin=None, port=None, tolerance=0.0, resolution=None):
 		"""
 		Adds a setting to be swept.
 		kind is either 'vds' for a Virtual Device Server setting,
@@ -53,6 +115,12 @@ class Sweeper(object):
 		inputs   = all non-varied inputs to the setting,
 		var_slot = what position the varied input is put in.
 
+		In the case of kind='buffered', specify:
+		setting = [server,device,ramp setting] of a device that can perform buffered ramps (e.g. the DAC-ADC's buffer_ramp),
+		port    = the DAC port to sweep.
+		If the swept and recorded settings are all 'buffered' settings on the same device, each line of the first axis is
+		performed by the device as a single buffered ramp (see _measure_line), rather than one step at a time.
+
 		'label' is the axis label that this setting will take, as well as its name in the data vault file.
 		If it is not specified, it takes the default value of the setting name for 'dev' settings, or the
 		label specified in the registry for 'vds' settings. For 'vds' settings, if no label is specified
@@ -62,8 +130,25 @@ class Sweeper(object):
 		This will limit the speed at which the sweep will take place. If it is set to None, there will be no
 		limit enforced for this setting; if all swept settings have None for max_step_size, there will be no
 		limit enforced at all.
+
+		The setting is only sent a new value when it has changed (e.g. a setting that only depends on the slow axis
+		isn't re-sent at every step of the fast axis): by more than 'tolerance' and, if 'resolution' (the step between
+		the values the device can output, such as a DAC's LSB) is known, to a different step. See Setting.needs_set.
+
+		Giving a 'resolution' also quantizes the setting: values are rounded to the nearest step before they are sent (and
+		logged), max_step_size is rounded down to a whole number of steps (so that the output never changes by more than it),
+		and ramps are made in whole steps, so that ramp steps which wouldn't change the output are merged with the next
+		(see _ramp_codes.) This assumes that the device rounds to the nearest step too, so that its output is unchanged.
+		resolution='auto' takes it from components.settings.dac_resolutions, for the outputs of the DAC servers listed there.
 		"""
 		if self._mode != 'setup':raise ValueError("This function is only available in setup mode")
+		if resolution == 'auto':
+			# 'buffered' settings are set with set_voltage (see BufferedSetting)
+			if kind in ['dev','buffered'] and setting is not None:
+				resolution = dac_resolution(setting[0],setting[2] if kind == 'dev' else 'set_voltage')
+			else:
+				resolution = None
+			if resolution is None:raise ValueError("The resolution of {setting} is not known (see components.settings.dac_resolutions); give it explicitly".format(setting=setting if setting is not None else label))
 
 		if kind == 'vds':
 			if not ((setting is None) and (inputs is None) and (var_slot is None)):
@@ -71,7 +156,7 @@ class Sweeper(object):
 			if not (which_builtin is None):
 				print("Warning: specified which_builtin for a 'vds' type setting. This property is for 'builtin' type settings, and will be ignored.")
 			
-			s = Setting(self._cxn,max_step_size=max_step_size)
+			s = Setting(self._cxn,max_step_size=max_step_size,cache=self._setting_cache,tracer=self._tracer,tolerance=tolerance,resolution=resolution)
 			s.vds(ID,name)      # Since a connection has been passed, this will error if ID/name don't point to a valid channel.
 			                    # So, no need to check for that here.
 			
@@ -87,7 +172,7 @@ class Sweeper(object):
 			if not (which_builtin is None):
 				print("Warning: specified which_builtin for a 'dev' type setting. This property is for 'builtin' type settings, and will be ignored.")
 			
-			s = Setting(self._cxn,max_step_size=max_step_size,label=label)
+			s = Setting(self._cxn,max_step_size=max_step_size,label=label,cache=self._setting_cache,tracer=self._tracer,tolerance=tolerance,resolution=resolution)
 			s.dev_set(setting,inputs,var_slot)
 			self._swp.append(s)
 
@@ -99,16 +184,28 @@ class Sweeper(object):
 			if not ((name is None) and (ID is None)):
 				print("Warning: specified name and/or ID for a 'builtin' type setting. These are properties for the 'vds' type setting, and will be ignored.")
 
-			s = Setting(self._cxn,max_step_size=max_step_size,label=label)
+			s = Setting(self._cxn,max_step_size=max_step_size,label=label,cache=self._setting_cache,tracer=self._tracer,tolerance=tolerance,resolution=resolution)
 			s.builtin(which_builtin)
 			if s.setting.has_set is False:
 				raise ValueError("Cannot use builtin <{which_builtin}> as swept setting; it is a get-only builtin".format(which_builtin=which_builtin))
 			self._swp.append(s)
 
+		elif kind == 'buffered':
+			if (setting is None) or (port is None):
+				raise ValueError("For a 'buffered' type setting: setting and port must be specified.")
+			if not ((name is None) and (ID is None) and (inputs is None) and (var_slot is None) and (which_builtin is None)):
+				print("Warning: specified at least one of name,ID,inputs,var_slot,which_builtin for a 'buffered' type setting. These will be ignored.")
+
+			s = Setting(self._cxn,max_step_size=max_step_size,label=label,cache=self._setting_cache,tracer=self._tracer,tolerance=tolerance,resolution=resolution)
+			s.buffered(setting,port)
+			self._swp.append(s)
+
 		else:
-			raise ValueError("'kind' must be 'vds' (for a Virtual Device Server setting) or 'dev' (for a LabRAD Device Server setting) or 'builtin' (for a builtin setting). Got {kind} instead.".format(kind=kind))
+			raise ValueError("'kind' must be 'vds' (for a Virtual Device Server setting) or 'dev' (for a LabRAD Device Server setting) or 'builtin' (for a builtin setting) or 'buffered' (for a port of a device that can perform buffered ramps). Got {kind} instead.".format(kind=kind))
 
-	def add_recorded_setting(self, kind, label=None, ID=None, name=None, setting=None, inputs=None, which_builtin=None):
+		self._swp_defs.append({'kind':kind,'label':label,'max_step_size':max_step_size,'ID':ID,'name':name,'setting':setting,'inputs':inputs,'var_slot':var_slot,'which_builtin':which_builtin,'port':port,'tolerance':tolerance,'resolution':resolution})
+
+	def add_recorded_setting(self, kind, label=None, ID=None, name=None, setting=None, inputs=None, which_builtin=None, port=None):
 		"""
 		Adds a setting to be recorded.
 		kind is either 'vds' for a Virtual Device Server setting,
@@ -121,6 +218,10 @@ class Sweeper(object):
 		setting = [server,device,setting],
 		inputs  = all inputs to the setting
 
+		In the case of kind='buffered', specify:
+		setting = [server,device,ramp setting] (see add_swept_setting),
+		port    = the ADC port to record.
+
 		'label' is the axis label that this setting will take, as well as its name in the data vault file.
 		If it is not specified, it takes the default value of the setting name for 'dev' settings, or the
 		label specified in the registry for 'vds' settings. For 'vds' settings, if no label is specified
@@ -134,7 +235,7 @@ class Sweeper(object):
 			if not (which_builtin is None):
 				print("Warning: specified which_builtin for a 'vds' type setting. This property is for 'builtin' type settings, and will be ignored.")
 			
-			s = Setting(self._cxn)
+			s = Setting(self._cxn,cache=self._setting_cache,tracer=self._tracer)
 			s.vds(ID,name)      # Since a connection has been passed, this will error if ID/name don't point to a valid channel.
 			                    # So, no need to check for that here.
 			
@@ -150,7 +251,7 @@ class Sweeper(object):
 			if not (which_builtin is None):
 				print("Warning: specified which_builtin for a 'dev' type setting. This property is for 'builtin' type settings, and will be ignored.")
 
-			s = Setting(self._cxn,label=label)
+			s = Setting(self._cxn,label=label,cache=self._setting_cache,tracer=self._tracer)
 			s.dev_get(setting,inputs)
 			self._rec.append(s)
 
@@ -162,27 +263,85 @@ class Sweeper(object):
 			if not ((name is None) and (ID is None)):
 				print("Warning: specified name and/or ID for a 'builtin' type setting. These are properties for the 'vds' type setting, and will be ignored.")
 
-			s = Setting(self._cxn,label=label)
+			s = Setting(self._cxn,label=label,cache=self._setting_cache,tracer=self._tracer)
 			s.builtin(which_builtin)
 			if s.setting.has_get is False:
 				raise ValueError("Cannot use builtin <{which_builtin}> as recorded setting; it is a set-only builtin".format(which_builtin=which_builtin))
 			self._rec.append(s)
 
+		elif kind == 'buffered':
+			if (setting is None) or (port is None):
+				raise ValueError("For a 'buffered' type setting: setting and port must be specified.")
+			if not ((name is None) and (ID is None) and (inputs is None) and (which_builtin is None)):
+				print("Warning: specified at least one of name,ID,inputs,which_builtin for a 'buffered' type setting. These will be ignored.")
+
+			s = Setting(self._cxn,label=label,cache=self._setting_cache,tracer=self._tracer)
+			s.buffered(setting,port)
+			self._rec.append(s)
 
 		else:
-			raise ValueError("'kind' must be 'vds' (for a Virtual Device Server setting) or 'dev' (for a LabRAD Device Server setting) or 'builtin' (for a builtin setting). Got {kind} instead.".format(kind=kind))
+			raise ValueError("'kind' must be 'vds' (for a Virtual Device Server setting) or 'dev' (for a LabRAD Device Server setting) or 'builtin' (for a builtin setting) or 'buffered' (for a port of a device that can perform buffered ramps). Got {kind} instead.".format(kind=kind))
+
+		self._rec_defs.append({'kind':kind,'label':label,'ID':ID,'name':name,'setting':setting,'inputs':inputs,'which_builtin':which_builtin,'port':port})
 
 	def clear_axes(self):
 		if self._mode != 'setup':raise ValueError("This function is only available in setup mode")
 		self._axes=[]
+		self._axes_labels=[]
 	def clear_swept_settings(self):
 		if self._mode != 'setup':raise ValueError("This function is only available in setup mode")
 		self._swp=[]
+		self._swp_defs=[]
 	def clear_recorded_settings(self):
 		if self._mode != 'setup':raise ValueError("This function is only available in setup mode")
 		self._rec=[]
+		self._rec_defs=[]
 
-	def generate_mesh(self,lincombs,do_pre_sweep=False,do_post_sweep=False,start_rampfrom=None,end_rampto=None):
+	def definition(self):
+		"""
+		Returns a description of the sweep (as a dict of plain values) from which it can be re-created with from_definition().
+		Once the mesh has been generated, this includes the linear combinations and the other generate_mesh() arguments.
+		"""
+		definition = {
+			'axes'    :[{'start':axis.start,'end':axis.end,'points':axis.points,'min_ramp_duration':axis.min_ramp_duration,'post_ramp_delay':axis.post_ramp_delay,'label':label} for axis,label in zip(self._axes,self._axes_labels)],
+			'swept'   :[dict(d) for d in self._swp_defs],
+			'recorded':[dict(d) for d in self._rec_defs],
+			}
+		if self._mode != 'setup':
+			definition['mesh'] = {
+				'lincombs'      :[[float(c) for c in comb] for comb in self._lincombs],
+				'do_pre_sweep'  :self._do_pre_sweep,
+				'do_post_sweep' :self._do_post_sweep,
+				'start_rampfrom':None if self._start_rampfrom is None else list(self._start_rampfrom),
+				'end_rampto'    :None if self._end_rampto     is None else list(self._end_rampto),
+				'lazy'          :self._mesh.lazy is not None,
+				'traversal'     :self._mesh.traversal,
+				'start_index'   :self._start_index,
+				}
+		return definition
+
+	@classmethod
+	def from_definition(cls,definition,**kwargs):
+		"""Creates a Sweeper (in setup mode) with the axes and settings of a definition, as returned by definition(). kwargs are passed to Sweeper()."""
+		s = cls(**kwargs)
+		for axis in definition['axes']    :s.add_axis(**axis)
+		for swp  in definition['swept']   :s.add_swept_setting(**swp)
+		for rec  in definition['recorded']:s.add_recorded_setting(**rec)
+		return s
+
+	def enable_checkpoints(self,path,interval=60.0):
+		"""
+		Periodically saves the progress of the sweep to a checkpoint file at path, at most every <interval> seconds
+		(and whenever the dataset is initialized or the sweep completes.) An interrupted sweep can be continued with Sweeper.resume(path).
+		"""
+		if self._mode == 'done':raise ValueError("This function is not available once the sweep is done")
+		if interval <= 0       :raise ValueError("Checkpoint interval must be greater than zero")
+		self._checkpoint_path     = path
+		self._checkpoint_interval = float(interval)
+		if self._mode == 'sweep':
+			self._write_checkpoint()
+
+	def generate_mesh(self,lincombs,do_pre_sweep=False,do_post_sweep=False,start_rampfrom=None,end_rampto=None,lazy=True,traversal='raster',start_index=0):
 		"""
 		Generates the mesh from linear combinations of the axes.
 		One linear combination is required for each swept setting,
@@ -192,6 +351,22 @@ class Sweeper(object):
 		[constant, coeff_0, coeff_1, ...]
 		It starts with a constant offset term, and has one
 		additional coefficient for each axis present.
+
+		If lazy is True (default), the mesh is not materialized in memory; the state at each
+		point is computed from the axis positions and the linear combinations as it is reached.
+
+		traversal is the order in which the mesh is visited:
+		'raster'     : each axis returns to its first point whenever the next axis is stepped.
+		'serpentine' : each axis reverses direction whenever the next axis is stepped, which
+		               avoids ramping back across the full range of an axis at the end of every pass.
+
+		start_index is the step (0 being the first point of the mesh), or the list of axis positions, at which the
+		sweep begins, e.g. to resume an interrupted sweep. The settings are ramped to that point by the pre-sweep,
+		which is required for any start_index other than 0, so that the ramp keeps to their max_step_size.
+		If do_pre_sweep is True and start_rampfrom is not given, the ramp starts from the current values
+		of the swept settings, which must then all support 'get'. Values of start_rampfrom can also be None
+		for settings whose starting values aren't known: those that support 'get' are read, and the others
+		start at their first point (so they are set there directly, rather than ramped.)
 		"""
 		if self._mode != 'setup':raise ValueError("This function is only available in setup mode")
 		if len(lincombs) != len(self._swp):
@@ -201,16 +376,55 @@ class Sweeper(object):
 				raise ValueError("Length of a linear combination must be (1 + number_of_axes); one constant term plus a coefficient for each axis. Expected length: {len1}, got length {len2} from linear combination {comb}".format(len1=len(self._axes)+1,len2=len(comb),comb=comb))
 			comb = [float(c) for c in comb] # ensure that values in each combination are valid as floats
 
-		self._mesh.from_linear_functions(self._axes,lincombs)
-		self._lincombs = lincombs
+		if do_pre_sweep and (start_rampfrom is None):
+			start_rampfrom = self._current_state()
+		for name,state in [['start_rampfrom',start_rampfrom],['end_rampto',end_rampto]]:
+			if (state is not None) and len(state) != len(self._swp):
+				raise ValueError("{name} must have one value per swept setting. Number of swept settings is {_swp}".format(name=name,_swp=len(self._swp)))
+		if do_post_sweep and (end_rampto is None):
+			raise ValueError("end_rampto must be specified to do a post-sweep")
+		buffered = self._check_buffered(lincombs)
+
+		self._mesh.set_traversal(traversal)
+		self._mesh.from_linear_functions(self._axes,lincombs,lazy=lazy)
+		self._mesh.seek(start_index) # raises ValueError if start_index is not in the mesh
+		if self._mesh.steps_done and not do_pre_sweep:
+			raise ValueError("A sweep that starts part way through the mesh (start_index {index}) must ramp there with the pre-sweep; set do_pre_sweep (and start_rampfrom, for settings that don't support 'get')".format(index=start_index))
+		if (start_rampfrom is not None) and (None in list(start_rampfrom)):
+			start_rampfrom = self._fill_state(start_rampfrom,self._mesh.values_at(self._mesh.axis_positions))
+		self._lincombs    = lincombs
+		self._start_index = self._mesh.steps_done # start_index may have been given as axis positions
 		self._mode = 'sweep'
 
 		self._do_pre_sweep   = do_pre_sweep
 		self._do_post_sweep  = do_post_sweep
-		self._start_rampfrom = start_rampfrom
-		self._end_rampto     = end_rampto
+		self._start_rampfrom = None if start_rampfrom is None else numpy.array(start_rampfrom,dtype=float)
+		self._end_rampto     = None if end_rampto     is None else numpy.array(end_rampto    ,dtype=float)
+		self._buffered       = buffered
 
 		self._configure_sweep()
+		if self._checkpoint_path:
+			self._write_checkpoint()
+
+	def _check_buffered(self,lincombs):
+		"""
+		Returns whether the sweep can be performed with buffered ramps: all swept and recorded settings must be 'buffered'
+		settings on the same device, and each step along the first axis must be within the swept settings' max_step_size.
+		Raises ValueError if only some of the settings are 'buffered'.
+		"""
+		kinds = [setting.kind for setting in self._swp + self._rec]
+		if not ('buffered' in kinds):return False
+		if not all([kind == 'buffered' for kind in kinds]):
+			raise ValueError("'buffered' settings can only be used if all swept and recorded settings are 'buffered' settings on the same device")
+		if len(set([tuple(setting.setting.setting) for setting in self._swp + self._rec])) > 1:
+			raise ValueError("'buffered' settings can only be used if all swept and recorded settings are on the same device (and use the same ramp setting)")
+
+		axis = self._axes[0]
+		step = abs(axis.end - axis.start) / float(axis.points - 1) if axis.points > 1 else 0.0
+		for setting,comb in zip(self._swp,lincombs):
+			if (setting.max_step_size is not None) and abs(float(comb[1]))*step > setting.max_step_size:
+				raise ValueError("Steps of {label} along the first axis exceed its max_step_size, which cannot be enforced during buffered ramps".format(label=setting.getlabel()))
+		return True
 
 	# sweep mode functions
 	def _configure_sweep(self):
@@ -223,7 +437,10 @@ class Sweeper(object):
 
 		comments = [
 			["Created by LabRAD-Sweeper-2","computer"],
+			["Mesh traversal: {traversal}".format(traversal=self._mesh.traversal),"computer"],
 			]
+		if self._start_index:
+			comments.append(["Sweep started at step {index} of the mesh".format(index=self._start_index),"computer"])
 
 		axis_pos_indep = [ ['axis_{n}_pos'.format(n=n),'i'] for n in range(len(self._axes)) ] # independent variables representing the positions for each axis
 		axis_val_indep = [ ['axis_{n}_val'.format(n=n),'v'] for n in range(len(self._axes)) ] # independent variables representing the values    for each axis
@@ -233,6 +450,10 @@ class Sweeper(object):
 		self._dataset = DataSet(           # we don't include the name & location yet so that the user can choose when to specify them.
 			axis_pos_indep+settings_indep, # independent variables. For now we don't include the axis_val_indeps
 			dependents,                    # dependent   variables.
+			async_write = self._async_logging,
+			spool_dir   = self._spool_dir,
+			connection  = self._cxn,       # the data set uses this Sweeper's connection (and so is traced with it), which is released once the data set is closed.
+			tracer      = self._tracer,
 			)
 		self._dataset.add_comments(comments)
 		self._dataset.add_parameters(axis_parameter+comb_parameter)
@@ -241,8 +462,12 @@ class Sweeper(object):
 
 		# internal sweep properties
 		self._ds_ready   = False # whether or not the dataset has been initialized (and is ready to be written to)
+		if self._batch_packets:
+			self._swp_batch = SettingBatch(self._cxn,self._swp)
+			self._rec_batch = SettingBatch(self._cxn,self._rec)
 		
 		self._axes_loc, self._targ_state, axis = self._mesh.next()
+		if self._tracer.enabled:self._tracer.step = self._mesh.steps_done
 		# _axes_loc   : set of integer positions along each axis
 		# _targ_state : the state (list of swept setting values) that the next measurement will be taken.
 
@@ -256,6 +481,7 @@ class Sweeper(object):
 					if abs(self._targ_state[n]-self._start_rampfrom[n]) > 0:
 						self._pre_sweep_max_delta_progress = min([self._pre_sweep_max_delta_progress, self._swp[n].max_step_size/abs(self._targ_state[n]-self._start_rampfrom[n])])
 			
+			self._pre_sweep_max_delta_progress = self._whole_codes(self._pre_sweep_max_delta_progress,self._ramp_codes(self._start_rampfrom,self._targ_state))
 			if self._pre_sweep_max_delta_progress == 1.0:
 				self._do_pre_sweep = False
 				#If the pre-sweep can be done in one step, it will be taken care of below.
@@ -268,6 +494,30 @@ class Sweeper(object):
 			self._set_state(self._targ_state)
 
 
+	def _current_state(self):
+		"""Reads the current value of each swept setting. Used as the starting point of the pre-sweep when none is given."""
+		state = []
+		for setting in self._swp:
+			if not setting.setting.has_get:
+				raise ValueError("Cannot read the current value of swept setting {label} (it does not support 'get'); start_rampfrom must be specified for the pre-sweep.".format(label=setting.getlabel()))
+			value = setting.get()
+			state.append(float(value/value.unit) if type(value) is Value else float(value))
+		return state
+
+	def _fill_state(self,state,first):
+		"""Returns state with its None values replaced by the current values of the settings if they support 'get', else by their values in first."""
+		filled = []
+		for n in range(len(self._swp)):
+			if state[n] is not None:
+				filled.append(float(state[n]))
+			elif self._swp[n].setting.has_get:
+				value = self._swp[n].get()
+				filled.append(float(value/value.unit) if type(value) is Value else float(value))
+			else:
+				print("Warning: the current value of swept setting {label} is unknown (it does not support 'get'), so it will be set directly to its first value rather than ramped.".format(label=self._swp[n].getlabel()))
+				filled.append(float(first[n]))
+		return filled
+
 	def initialize_dataset(self,dataset_name,dataset_location):
 		"""Ininitializes the dataset & makes it ready to take data/comments/parameters. Name and location must both be specified at this time."""
 		if self._mode == 'setup': raise ValueError("This function is only usable after the sweep has been started. It can still be used after the sweep is complete.")
@@ -289,6 +539,9 @@ class Sweeper(object):
 		self._dataset.write_parameters()
 		self._dataset.write_comments()
 
+		if self._checkpoint_path:
+			self._write_checkpoint()
+
 		if self._mode == 'done':
 			self.close()
 
@@ -300,6 +553,58 @@ class Sweeper(object):
 		self._dataset.add_parameters(parameters,self._ds_ready)
 	def done(self):
 		return bool(self._mode == 'done')
+	def dataset_ready(self):
+		"""Returns whether the dataset has been initialized, so that data is logged as it is measured (and close() is called when the sweep ends.)"""
+		return self._mode != 'setup' and self._ds_ready
+	def last_set_state(self):
+		"""Returns the values most recently sent to the swept settings (as a list), or None if none have been sent."""
+		return None if self._last_set_state is None else [float(v) for v in self._last_set_state]
+	def writer_status(self):
+		"""Returns the status of the data vault writer (see DataSet.writer_status); useful to watch for backpressure/errors with async_logging."""
+		if self._mode == 'setup':raise ValueError("This function is only usable after the sweep has been started.")
+		return self._dataset.writer_status()
+
+	def points_per_second(self):
+		"""Returns the rate at which points have recently been measured, or None until there have been at least two measurements."""
+		return self._rate.rate()
+
+	def stats(self):
+		"""
+		Returns timing statistics of the sweep so far, as a dict (suitable for JSON.) Each timing is a LatencyStats summary
+		(see components/stats.py: counts, totals, rolling mean & percentiles, and a histogram), with times in seconds.
+		points, points_per_second : points measured, and the recent rate
+		swept, recorded           : times of the set (get) calls of each swept (recorded) setting, by label; for swept settings,
+		                            'skipped' is the number of writes skipped because the value was unchanged
+		dv_add                    : times of the data vault add calls
+		advance                   : times of advance() calls in each phase: pre_sweep, ramp, delay, schedule (compiled sweeps), post_sweep
+		measure                   : times of measurements (reading the recorded settings & logging), part of the delay/schedule phases
+		mesh                      : times of advancing the mesh to the next point
+		slack                     : how late advance() was called by step() (or a SweepEngine) compared to its deadline (timer slack, or overrunning calls)
+		writer                    : status of the data vault writer (see writer_status)
+		"""
+		started = self._mode != 'setup'
+		return {
+			'points'           :self._measured,
+			'points_per_second':self.points_per_second(),
+			'swept'            :dict([(setting.getlabel(),dict(setting.stats['set'].summary(),skipped=setting.skipped)) for setting in self._swp]),
+			'recorded'         :dict([(setting.getlabel(),setting.stats['get'].summary()) for setting in self._rec]),
+			'dv_add'           :self._dataset.add_stats.summary() if started else None,
+			'advance'          :dict([(phase,self._timings[phase].summary()) for phase in TIMED_PHASES]),
+			'measure'          :self._timings['measure'].summary(),
+			'mesh'             :self._timings['mesh'].summary(),
+			'slack'            :self._timings['slack'].summary(),
+			'writer'           :self._dataset.writer_status() if started else None,
+			}
+
+	def dump_stats(self,path):
+		"""Writes stats() to path as JSON."""
+		with open(path,'w') as f:
+			json.dump(self.stats(),f,indent=1,sort_keys=True)
+
+	def record_timing(self,name,duration):
+		"""Records a time (in seconds) for one of the timings of stats() that is measured outside the Sweeper, i.e. 'slack' by whatever calls advance()."""
+		if not name in self._timings:raise ValueError("Unknown timing {name}; expected one of {names}".format(name=name,names=sorted(self._timings)))
+		self._timings[name].record(duration)
 
 
 	def _set_state(self,state):
@@ -308,20 +613,71 @@ class Sweeper(object):
 
 		if len(state) != len(self._swp):
 			raise ValueError("Length of state must equal number of swept settings")
+		# values are rounded to the settings' resolutions, and only those that have changed are sent (see add_swept_setting)
+		state   = [self._swp[n].snap(state[n]) for n in range(len(self._swp))]
+		changed = []
 		for n in range(len(self._swp)):
-			self._swp[n].set(state[n])
+			if self._swp[n].needs_set(state[n]):
+				changed.append(n)
+			else:
+				self._swp[n].skipped += 1
+		if self._swp_batch is not None:
+			if changed:self._swp_batch.set(state,changed)
+		else:
+			for n in changed:
+				self._swp[n].set(state[n])
+		self._last_set_state = numpy.array(state,dtype=float)
 
 	def _do_measurement(self,output=False):
 		"""Takes a measurement and advances the mesh. This should not be called except by the Sweeper class itself."""
 		if self._mode != 'sweep':raise ValueError("This function is only usable in sweep mode")
 
 		if output:print("measurement at {_targ_state}".format(_targ_state=self._targ_state))
-		measurements = [setting.get() for setting in self._rec]
-		self._dataset.add_data([ self._axes_loc + list(self._targ_state) + measurements ],self._ds_ready)
-
+		self._measure()
+		next_axis_step = self._next_target()
+		if next_axis_step is None:return
+		if self._schedule is None:
+			self._start_ramp(next_axis_step)
+		elif self._ramp_cycle != 'schedule':
+			self._start_schedule()
+
+	def _measure(self):
+		"""Measures the recorded settings at the current target (or, for buffered sweeps, the rest of its line) and logs the data."""
+		start = monotonic()
+		line_rest = self._axes[0].points - 1 - self._mesh.steps_done % self._axes[0].points # points after this one in the current line of the first axis
+		if self._buffered and line_rest > 0:
+			self._measure_line(line_rest)
+		else:
+			if self._rec_batch is not None:
+				measurements = self._rec_batch.get()
+			else:
+				# start all the reads, then collect them, so the time taken is that of the slowest rather than the sum.
+				futures      = [setting.get_async() for setting in self._rec]
+				measurements = [future.wait() for future in futures]
+			setpoints = [setting.snap(value) for setting,value in zip(self._swp,self._targ_state)] # the values sent (see _set_state)
+			self._dataset.add_data([ self._axes_loc + setpoints + measurements ],self._ds_ready)
+			self._measured += 1
+		self._rate.mark(self._record_timing('measure',start),self._measured)
+
+	def _record_timing(self,name,start):
+		"""Records the time taken since start (see stats(), and the trace if enabled), and returns the current time."""
+		end = monotonic()
+		self._timings[name].record(end - start)
+		if self._tracer.enabled:
+			self._tracer.add(name,'sweeper',start,end)
+		return end
+
+	def _next_target(self):
+		"""
+		Advances the mesh to the next target, and returns the axis stepped to reach it.
+		Once the mesh is complete, this instead starts the post-sweep (or ends the sweep) and returns None.
+		"""
 		self._last_state = self._targ_state.copy()
 		if not self._mesh.complete:
+			start = monotonic()
 			self._axes_loc, self._targ_state, next_axis_step = self._mesh.next()
+			self._record_timing('mesh',start)
+			if self._tracer.enabled:self._tracer.step = self._mesh.steps_done
 		else:
 			if self._do_post_sweep:
 				self._sweep_phase = 'post_sweep'
@@ -330,14 +686,23 @@ class Sweeper(object):
 				for n in range(len(self._swp)):
 					if self._swp[n].max_step_size is not None:
 						if abs(self._end_rampto[n]-self._targ_state[n]) > 0:
-							self._post_sweep_max_delta_progress = min([self._post_sweep_max_delta_progress, self._swp[n].max_step_sizes/abs(self._end_rampto[n]-self._targ_state[n])])
+							self._post_sweep_max_delta_progress = min([self._post_sweep_max_delta_progress, self._swp[n].max_step_size/abs(self._end_rampto[n]-self._targ_state[n])])
+				self._post_sweep_max_delta_progress = self._whole_codes(self._post_sweep_max_delta_progress,self._ramp_codes(self._targ_state,self._end_rampto))
 
 
 			else:
 				self._terminate_sweep()
 
-			return
+			if self._checkpoint_path and self._mode == 'sweep':
+				self._write_checkpoint() # all points have been measured; a crash during the post-sweep leaves nothing to resume.
+			return None
+
+		if self._checkpoint_path and (time.time() - self._checkpoint_time >= self._checkpoint_interval):
+			self._write_checkpoint()
+		return next_axis_step
 
+	def _start_ramp(self,next_axis_step):
+		"""Sets up the ramp from the last target to the current one, followed by the delay. Not used when the schedule is compiled."""
 		# reset _progress, calculate new _duration
 		self._delay_progress = 0.0
 		self._delay_duration = self._axes[next_axis_step].post_ramp_delay * 0.001
@@ -351,27 +716,279 @@ class Sweeper(object):
 			if self._swp[n].max_step_size is not None:
 				if abs(self._targ_state[n]-self._last_state[n]) > 0:
 					self._ramp_max_delta_progress = min([self._ramp_max_delta_progress, self._swp[n].max_step_size/abs(self._targ_state[n]-self._last_state[n])])
+		self._ramp_n_codes = self._ramp_codes(self._last_state,self._targ_state)
+		self._ramp_max_delta_progress = self._whole_codes(self._ramp_max_delta_progress,self._ramp_n_codes)
 
+	def _ramp_codes(self,start,end):
+		"""
+		Returns the number of steps of its resolution (DAC codes) crossed by the swept setting that crosses the most of them
+		ramping from start to end, or None if a setting of unknown resolution changes (or none does.)
+		Ramps are made in whole codes of that setting (see _whole_codes): any finer, and some ramp steps would only re-send
+		the same codes. Each step then changes the output, and the ramp takes as long as before with fewer, longer steps.
+		"""
+		codes = 0.0
+		for n in range(len(self._swp)):
+			diff = abs(end[n]-start[n])
+			if diff == 0:continue
+			if self._swp[n].resolution is None:return None
+			codes = max([codes,diff/self._swp[n].resolution])
+		return codes or None
+
+	def _whole_codes(self,step,codes):
+		"""Rounds step (a fraction of a ramp across <codes> codes, see _ramp_codes) down to a whole number of codes, but no less than one."""
+		if codes is None or step >= 1.0:return step
+		return min([max([math.floor(step*codes + 1e-9),1.0])/codes,1.0])
+
+	def _ramp_done(self):
+		"""Fraction of the current ramp that has been set: its progress, rounded down to a whole number of codes (see _ramp_codes.)"""
+		if self._ramp_n_codes is None or self._ramp_progress >= 1.0:return self._ramp_progress
+		return math.floor(self._ramp_progress*self._ramp_n_codes + 1e-9)/self._ramp_n_codes
+
+	def _ramp_step(self):
+		"""Fraction of the current ramp made by each of its steps."""
+		step = self._ramp_max_delta_progress
+		if self._ramp_duration:
+			step = self._whole_codes(min([step,self._ramp_resolution/self._ramp_duration]),self._ramp_n_codes)
+		return step
+
+	def compile_schedule(self,chunk_points=10000):
+		"""
+		Precompiles the rest of the sweep (ramp steps, delays, and measurements) into arrays (see RampSchedule), compiled
+		<chunk_points> mesh points at a time, so that advance() only has to step through them rather than work out each ramp.
+		The current point is finished as before; the schedule is used from the next point on.
+		Not available for buffered sweeps, whose lines are ramped by the device.
+		"""
+		if self._mode != 'sweep':raise ValueError("This function is only usable in sweep mode")
+		if self._buffered       :raise ValueError("Buffered sweeps cannot use a compiled schedule")
+		self._schedule = RampSchedule(self._mesh,self._axes,[setting.max_step_size for setting in self._swp],self._ramp_resolution,chunk_points,self._resolutions())
 
+	def measure_latencies(self,repeats=3):
+		"""
+		Times <repeats> gets of each recorded setting, and of each swept setting that supports get (as a stand-in for its set,
+		which can't be tried without changing it), for estimate_duration(). Latencies are otherwise measured as the sweep runs.
+		"""
+		for setting in self._swp + self._rec:
+			if setting.kind == 'builtin' or not setting.setting.has_get:continue
+			for n in range(repeats):
+				setting.get()
+			if setting in self._swp and setting.latency['set'] is None:
+				setting.latency['set'] = setting.latency['get']
+
+	def estimate_duration(self,lincombs=None,do_pre_sweep=False,do_post_sweep=False,start_rampfrom=None,end_rampto=None,lazy=True,traversal='raster',start_index=0):
+		"""
+		Estimates the time (in seconds) that the sweep will take: the ramps, delays, and step limits of every point (see RampSchedule),
+		the pre-sweep and post-sweep, and the time taken by each set/get, using the latencies measured so far (see measure_latencies.)
+
+		Before the mesh is generated, the sweep described by lincombs and the other generate_mesh() arguments is estimated.
+		Once it has been generated, the time remaining from the current point of the sweep is estimated (and the arguments are ignored.)
+		lazy is accepted so that the same arguments can be passed as to generate_mesh(), but the estimate always uses a lazy mesh.
+		For buffered sweeps, the time per point is estimated as for an ordinary sweep.
+		"""
+		if self._mode == 'done':return 0.0
+		if self._mode == 'setup':
+			if lincombs is None:raise ValueError("lincombs must be given to estimate the duration of a sweep before its mesh is generated")
+			mesh = SweepMesh()
+			mesh.set_traversal(traversal)
+			mesh.from_linear_functions(self._axes,lincombs,lazy=True)
+			mesh.seek(start_index)
+			if do_pre_sweep and (start_rampfrom is None):
+				start_rampfrom = self._current_state()
+			estimator = RampSchedule(mesh,self._axes,[setting.max_step_size for setting in self._swp],self._ramp_resolution,resolutions=self._resolutions())
+
+			# the pre-sweep (if any) and the delay before the first point; a pre-sweep that fits in one step is just done as the first point is set.
+			sets  = self._ramp_steps(start_rampfrom,mesh.values_at(mesh.axis_positions)) if do_pre_sweep else 1
+			wait  = (sets*self._ramp_resolution if sets > 1 else 0.0) + (self._axes[0].post_ramp_delay or 0.0)*0.001
+			post  = self._ramp_steps(self._final_state(mesh),end_rampto) if do_post_sweep else 0
+			measures,post_sweep = 1,False
+		else:
+			mesh      = self._mesh
+			estimator = self._sweep_estimator()
+
+			# what's left of the current phase
+			post_sweep = self._sweep_phase == 'post_sweep'
+			if post_sweep:
+				sets,wait,measures = 0,0.0,0
+				post = int(numpy.ceil((1.0-self._post_sweep_progress)/self._post_sweep_max_delta_progress - 1e-9))
+			else:
+				sets,wait = self._remaining_current()
+				post      = self._ramp_steps(self._final_state(mesh),self._end_rampto) if self._do_post_sweep else 0
+				measures  = 1
+
+		if not post_sweep:
+			# the rest of the mesh
+			ramp_time,ramp_steps,points = estimator.totals(mesh.steps_done + 1)
+			wait     += ramp_time
+			sets     += ramp_steps
+			measures += points
+		wait += post*self._ramp_resolution
+		sets += post
+
+		latency = lambda which,settings:[setting.latency[which] or 0.0 for setting in settings]
+		set_latency = (max if self._batch_packets else sum)(latency('set',self._swp) or [0.0])
+		get_latency = max(latency('get',self._rec) or [0.0]) # recorded settings are read concurrently
+		return float(wait + sets*set_latency + measures*get_latency)
+
+	def _sweep_estimator(self):
+		"""The RampSchedule that estimate_duration() uses during the sweep."""
+		if self._estimator is None:
+			self._estimator = self._schedule if self._schedule is not None else RampSchedule(self._mesh,self._axes,[setting.max_step_size for setting in self._swp],self._ramp_resolution,resolutions=self._resolutions())
+		return self._estimator
+
+	def precompute_estimate(self):
+		"""
+		Compiles the totals of the rest of the mesh (see RampSchedule.totals), which estimate_duration() otherwise does on its
+		first call during the sweep; for a large mesh this takes a while (about 0.5 s per million points.) Afterwards, each
+		estimate only compiles the part of a chunk that it starts in. This only reads the mesh, so it can run on another thread
+		while the sweep runs (see SweepEngine), once the estimator has been created by calling it (or estimate_duration) first.
+		"""
+		if self._mode != 'sweep':raise ValueError("This function is only usable in sweep mode")
+		self._sweep_estimator().totals(self._mesh.steps_done + 1)
+
+	def _resolutions(self):
+		return [setting.resolution for setting in self._swp]
+
+	def _final_state(self,mesh):
+		"""State at the last point of the mesh."""
+		return mesh.get_block(mesh.total_steps(),mesh.total_steps()+1)[1][0]
+
+	def _ramp_steps(self,start,end):
+		"""Number of steps (of the pre-sweep or post-sweep) to ramp from start to end within the swept settings' max_step_size."""
+		max_delta = 1.0
+		for n in range(len(self._swp)):
+			if self._swp[n].max_step_size is not None:
+				if abs(end[n]-start[n]) > 0:
+					max_delta = min([max_delta, self._swp[n].max_step_size/abs(end[n]-start[n])])
+		max_delta = self._whole_codes(max_delta,self._ramp_codes(start,end))
+		return int(numpy.ceil(1.0/max_delta - 1e-9))
+
+	def _remaining_current(self):
+		"""For estimate_duration(): returns [set calls, time] remaining up to the current point's measurement (during the pre-sweep or sweep.)"""
+		if self._sweep_phase == 'pre_sweep':
+			steps = int(numpy.ceil((1.0-self._pre_sweep_progress)/self._pre_sweep_max_delta_progress - 1e-9))
+			return [steps,steps*self._ramp_resolution + (self._axes[0].post_ramp_delay or 0.0)*0.001]
+
+		if self._ramp_cycle == 'schedule':
+			events = self._events
+			rest   = (numpy.arange(len(events['wait'])) >= self._event) & (events['point'] == events['point'][self._event])
+			return [int((rest & ~events['measure']).sum()),float(events['wait'][rest].sum()) - self._event_time]
+
+		if self._ramp_cycle == 'delay':
+			return [0,(1.0-self._delay_progress)*self._delay_duration]
+
+		# ramping; see next_deadline()
+		steps = int(numpy.ceil((1.0-self._ramp_done())/self._ramp_step() - 1e-9))
+		if self._ramp_duration:
+			ramp_time = (1.0-self._ramp_progress)*self._ramp_duration
+		else:
+			ramp_time = steps*self._ramp_resolution if self._ramp_max_delta_progress < 1.0 else 0.0
+		return [steps,ramp_time + self._delay_duration]
+
+	def _start_schedule(self):
+		"""Starts following the compiled schedule from the current target."""
+		self._schedule_chunks = self._schedule.chunks(self._mesh.steps_done) # compiled chunks, generated as they are reached
+		self._events     = next(self._schedule_chunks)
+		self._event      = 0   # index of the current event in the current chunk
+		self._event_time = 0.0 # time waited so far for the current event
+		self._ramp_cycle = 'schedule'
+
+	def _next_event(self):
+		"""Moves to the next event of the compiled schedule, compiling the next chunk when needed."""
+		self._event      += 1
+		self._event_time  = 0.0
+		if self._event >= len(self._events['wait']):
+			self._events = next(self._schedule_chunks)
+			self._event  = 0
+
+	def _advance_schedule(self,time_elapsed):
+		"""advance() for points covered by the compiled schedule: performs the current event once its wait has passed."""
+		self._event_time += time_elapsed
+		if self._event_time < self._events['wait'][self._event] - 1e-9:return
+
+		if self._events['measure'][self._event]:
+			self._do_measurement()
+			if self._mode == 'sweep' and self._sweep_phase == 'sweep':self._next_event()
+		else:
+			self._set_state(self._events['setpoint'][self._event])
+			self._next_event()
+
+	def _measure_line(self,rest):
+		"""
+		Measures the current point and the <rest> points after it in the current line of the first axis with one buffered ramp
+		performed by the device, and advances the mesh to the end of the line. Only used for sweeps of 'buffered' settings.
+		"""
+		positions,values,axes = self._mesh.next_block(rest)
+		if self._tracer.enabled:self._tracer.step = self._mesh.steps_done
+		axis  = self._axes[0]
+		delay = ((axis.min_ramp_duration or 0.0) + (axis.post_ramp_delay or 0.0)) * 0.001 # time spent at each point, in seconds
+		for setting in self._swp:
+			setting.last_value = None # unknown if the ramp fails
+		readings = self._swp[0].setting.ramp(
+			[setting.setting for setting in self._swp],
+			[setting.setting for setting in self._rec],
+			self._targ_state,values[-1],rest+1,delay,
+			)
+
+		rows = numpy.column_stack([
+			numpy.vstack([self._axes_loc,positions]),
+			numpy.vstack([self._targ_state,values]),
+			readings,
+			])
+		self._dataset.add_data(rows,self._ds_ready)
+		self._measured += rest + 1
+
+		self._axes_loc   = [int(p) for p in positions[-1]]
+		self._targ_state = numpy.array(values[-1],dtype=float)
+		self._last_set_state = self._targ_state.copy()
+		for n in range(len(self._swp)):
+			self._swp[n].last_value = self._targ_state[n] # the device ends the ramp at the end of the line
+
+	def next_deadline(self):
+		"""
+		Returns the time (in seconds, counted from the last advance() call) at which advance() should next be called:
+		when the current delay ends, or when the next step of the current ramp is due. Calling advance() at these times,
+		rather than at a fixed interval, means delays and ramps take as long as specified rather than a whole number of intervals.
+		"""
+		if self._mode != 'sweep': raise ValueError("This function is only usable in sweep mode")
+
+		if self._sweep_phase in ['pre_sweep','post_sweep']:
+			return self._ramp_resolution # these steps have no duration; they are only limited by max_step_size
+
+		if self._ramp_cycle == 'schedule':
+			return max([self._events['wait'][self._event]-self._event_time,0.0])
+
+		if self._ramp_cycle == 'delay':
+			return max([(1.0-self._delay_progress)*self._delay_duration,0.0])
+
+		if not self._ramp_duration:
+			# without a duration, each advance() makes the largest step allowed; with no step limit, the ramp is done in one.
+			return self._ramp_resolution if self._ramp_max_delta_progress < 1.0 else 0.0
+		# the next step is due once the progress reaches a step past what has been set (see _ramp_done)
+		step_time = (self._ramp_done() + self._ramp_step() - self._ramp_progress)*self._ramp_duration
+		return max([min([step_time,(1.0-self._ramp_progress)*self._ramp_duration]),0.0])
 
 	def advance(self,time_elapsed,output=False):
 		if self._mode != 'sweep': raise ValueError("This function is only usable in sweep mode")
 		if time_elapsed <= 0    : raise ValueError("time_elapsed must be greater than zero")
+		start = monotonic()
+		phase = self._ramp_cycle if self._sweep_phase == 'sweep' else self._sweep_phase
 
 		if self._sweep_phase == 'pre_sweep':
 			self._pre_sweep_progress += self._pre_sweep_max_delta_progress # we don't have a min ramp duration here, so just do the maximum delta progress.
-			self._pre_sweep_progress = min([self._pre_sweep_progress,1.0])
+			self._pre_sweep_progress = min([self._pre_sweep_progress,1.0]) if self._pre_sweep_progress < 1.0 - 1e-9 else 1.0 # so that rounding errors don't leave a negligible extra step
 			self._set_state(self._targ_state*self._pre_sweep_progress + self._start_rampfrom*(1-self._pre_sweep_progress))
 
 			if self._pre_sweep_progress >= 1.0:
 				self._sweep_phase = 'sweep'
 				self._ramp_cycle = 'delay' # start in the delay cycle so that the first measurement is preceeded by an interval with unchanging settings
-				self._delay_duration = self._axes[0].post_ramp_delay if self._axes[0].post_ramp_delay else 0.0
+				self._delay_duration = self._axes[0].post_ramp_delay*0.001 if self._axes[0].post_ramp_delay else 0.0
 				self._delay_progress = 0.0
 
 		elif self._sweep_phase == 'sweep':
 
-			if self._ramp_cycle == 'delay':
+			if self._ramp_cycle == 'schedule':
+				self._advance_schedule(time_elapsed)
+
+			elif self._ramp_cycle == 'delay':
 				self._delay_progress += time_elapsed / self._delay_duration if self._delay_duration else 1.0
 				if self._delay_progress >= 1.0:
 					self._do_measurement()
@@ -382,57 +999,52 @@ class Sweeper(object):
 
 
 				self._ramp_progress += ramp_delta_progress
-				self._ramp_progress = min([self._ramp_progress,1.0])
+				self._ramp_progress = min([self._ramp_progress,1.0]) if self._ramp_progress < 1.0 - 1e-9 else 1.0
 
-				self._set_state(self._targ_state*self._ramp_progress + self._last_state*(1-self._ramp_progress))
+				done = self._ramp_done()
+				self._set_state(self._targ_state*done + self._last_state*(1-done))
 				if self._ramp_progress >= 1.0:
 					self._ramp_cycle = 'delay'
 					self._delay_progress = 0.0
 
 		elif self._sweep_phase == 'post_sweep':
 			self._post_sweep_progress += self._post_sweep_max_delta_progress
-			self._post_sweep_progress = min([self._post_sweep_progress,1.0])
+			self._post_sweep_progress = min([self._post_sweep_progress,1.0]) if self._post_sweep_progress < 1.0 - 1e-9 else 1.0
 			self._set_state(self._end_rampto*self._post_sweep_progress + self._targ_state*(1-self._post_sweep_progress))
 			if self._post_sweep_progress >= 1.0:
 				self._terminate_sweep()
 
+		self._record_timing(phase,start)
+
 
 	def step(self,stepsize=0.1):
 		"""
 		Performs one step in the sweep.
 
-		If there is no speed limit, this simply performs the next measurement.
-		Once the target state has been reached, a measurement will be taken, recorded, and the next target will be set.
-
-		If there is a speed limit, this ramps at the appropriate speed until it gets to the target state.
-		Delay between steps will be equal to stepsize (0.1 seconds by default), enforced with time.sleep()
+		This ramps to the target state (at the appropriate speed, if there is a speed limit), waits for the delay,
+		and then takes and records a measurement, after which the next target will be set.
+		advance() is called at the times given by next_deadline() (but at least every stepsize seconds),
+		with the waiting done by time.sleep().
 		In general this is only the right way to perform the sweep if it is being performed in the Python Shell.
 		If this is the case then the best way would be to call Sweeper.autosweep(), which will call step() until
 		the end of the mesh is reached.
 
-		Timing the sweep with time.sleep() is not always reliable, and so the best way to use the Sweeper is to
-		have it managed by a program that keeps its own internal time (such as a PyQt application,) and using the
-		advance(time_elapsed) method with accurate timing.
+		For a program that has to stay responsive while sweeping (such as a PyQt application,) run the sweep
+		with a SweepEngine (components/engine.py) instead.
 		"""
 		if self._mode != 'sweep':raise ValueError("This function is only usable in sweep mode")
 
-		if self._speedlimit:
-			
-			while self._progress < 1:
-
-				timeleft = (1-self._progress) * self._duration
-				
-				if timeleft > stepsize:
-					time.sleep(stepsize)
-					self.advance(stepsize)
-
-				else:
-					time.sleep(timeleft)
-					self._do_measurement
-					break
-		else:
-			# no speed limit
-			self._do_measurement()
+		measured  = self._measured
+		last_time = monotonic()
+		while self._mode == 'sweep' and self._measured == measured:
+			wait = min([self.next_deadline(),stepsize])
+			now  = monotonic()
+			if last_time + wait > now:
+				time.sleep(last_time + wait - now)
+				now = monotonic()
+			self.record_timing('slack',max([now - (last_time + wait),0.0]))
+			self.advance(max([now - last_time,1e-9]))
+			last_time = now
 
 	def autosweep(self,stepsize=0.1,output=False):
 		while self._mode == 'sweep':
@@ -441,9 +1053,118 @@ class Sweeper(object):
 			self.step(stepsize)
 			
 
+	def _write_checkpoint(self):
+		"""Saves the progress of the sweep to the checkpoint file. The point at self._targ_state is the next one to be measured."""
+		measured = (self._mode == 'done') or (self._sweep_phase == 'post_sweep')
+		rows_written,data = self._dataset.unwritten() # rows queued for the data vault count as unwritten, rather than waiting for them to be written
+		write_checkpoint(self._checkpoint_path,{
+			'definition'         :self.definition(),
+			'checkpoint_interval':self._checkpoint_interval,
+			'complete'           :measured,
+			'next_index'         :None if measured else self._mesh.steps_done,
+			'state'              :None if self._last_set_state is None else list(self._last_set_state),
+			'dataset'            :{
+				'created' :self._ds_ready,
+				'name'    :self._dataset.name,
+				'location':self._dataset.location,
+				'dv_name' :self._dataset.dv_name,
+				},
+			'rows_written'       :rows_written,                  # rows and comments in the data vault dataset, so that those written after
+			'comments_written'   :self._dataset.comments_written, # the checkpoint can be told apart on resume
+			'data'               :data.tolist(),                 # data, comments, and parameters not yet written to the data vault
+			'spool'              :self._dataset.spool(),         # spool file holding the rest of the unwritten data (after data), if any
+			'comments'           :self._dataset.comments,
+			'parameters'         :self._dataset.parameters,
+			'time'               :time.time(),
+			})
+		self._checkpoint_time = time.time()
+
+	@classmethod
+	def resume(cls,checkpoint_path,**kwargs):
+		"""
+		Re-creates an interrupted sweep from its checkpoint file, and continues it from the first point that was not yet measured.
+		The swept settings are ramped (with the pre-sweep) from the last state that was set to that point.
+		If the dataset had been created, data continues to be added to the same data vault dataset; otherwise
+		the data taken so far is kept until initialize_dataset() is called, as usual.
+
+		Points measured (and comments written) after the checkpoint that already reached the dataset aren't measured (written) again:
+		the rows and comments in the dataset are counted, and those beyond the checkpoint's counts are skipped. Points measured after
+		the checkpoint whose rows didn't reach the dataset are measured again.
+		Checkpoints continue to be written to the same file. kwargs are passed to Sweeper().
+		"""
+		checkpoint = read_checkpoint(checkpoint_path)
+		if checkpoint['complete']:raise ValueError("All points of the sweep in checkpoint {path} have already been measured".format(path=checkpoint_path))
+
+		definition = checkpoint['definition']
+		mesh       = definition['mesh']
+		dataset    = checkpoint['dataset']
+		data       = numpy.array(checkpoint['data'],dtype=float).reshape([-1,len(definition['axes'])+len(definition['swept'])+len(definition['recorded'])])
+		spool      = checkpoint['spool']
+		comments   = checkpoint['comments']
+		next_index = checkpoint['next_index']
+		state      = checkpoint['state']
+		s = cls.from_definition(definition,**kwargs)
+
+		if dataset['created']:
+			stored_rows,stored_comments = stored_counts(s._cxn,dataset['location'],dataset['dv_name'])
+			# rows written after the checkpoint are the first of those it holds as unwritten (data, then the spool file), then those of the next points.
+			extra = max([stored_rows - checkpoint.get('rows_written',stored_rows),0])
+			skip  = min([extra,len(data)])
+			data,extra = data[skip:],extra-skip
+			if spool is not None:
+				skip  = min([extra,spool[2]-spool[1]])
+				spool = [spool[0],spool[1]+skip,spool[2]]
+				extra -= skip
+			if extra:
+				points = SweepMesh(mesh['traversal'])
+				points.from_linear_functions(s._axes,mesh['lincombs'],lazy=True)
+				if next_index + extra > points.total_steps():
+					s.close()
+					raise ValueError("All points of the sweep in checkpoint {path} have already been written to the dataset".format(path=checkpoint_path))
+				next_index += extra
+				state = [float(v) for v in points.get_block(next_index-1,next_index)[1][0]] # the last point measured
+			# write_comments() writes the most recently added comments first
+			comments = comments[:max([len(comments) - (stored_comments - checkpoint.get('comments_written',stored_comments)),0])]
+
+		s.generate_mesh(
+			mesh['lincombs'],
+			do_pre_sweep   = state is not None,
+			do_post_sweep  = mesh['do_post_sweep'],
+			start_rampfrom = state,
+			end_rampto     = mesh['end_rampto'],
+			lazy           = mesh['lazy'],
+			traversal      = mesh['traversal'],
+			start_index    = next_index,
+			)
+
+		# the dataset keeps the comments/parameters/data of the original sweep, rather than those of a new one
+		s._dataset.comments   = comments
+		s._dataset.parameters = checkpoint['parameters']
+		s._dataset.add_data(data) # these were added before the rows in the spool file
+		s._dataset.add_comments([ ["Sweep resumed from checkpoint at step {index}".format(index=next_index),"computer"] ])
+		if dataset['created']:
+			s._dataset.set_name(dataset['name'])
+			s._dataset.set_location(dataset['location'])
+			s._dataset.open_dataset(dataset['dv_name'])
+			s._dataset.rows_written     = stored_rows
+			s._dataset.comments_written = stored_comments
+			s._ds_ready = True
+			s._dataset.write_data()
+		if spool is not None:
+			s._dataset.attach_spool(*spool)
+		if dataset['created']:
+			s._dataset.write_data()
+			s._dataset.write_parameters()
+			s._dataset.write_comments()
+
+		s.enable_checkpoints(checkpoint_path,checkpoint['checkpoint_interval'])
+		return s
+
 	def _terminate_sweep(self):
 		if self._mode != 'sweep':raise ValueError("This function is only usable in sweep mode")
 		self._mode = 'done'
+		if self._checkpoint_path:
+			self._write_checkpoint()
 		print("Sweep completed.")
 		if not (self._ds_ready):
 			print("Warning: although the sweep has been completed, the dataset has not been created yet (and so the data has not been recorded.) To create the dataset, use Sweeper.initalize_dataset(name,location) and the data will be written automatically.")
@@ -451,29 +1172,151 @@ class Sweeper(object):
 			self.close()
 
 	def close(self):
+		"""Finishes writing the data and releases the connection. Only the first call does anything, so it is safe to call again."""
+		if self._closed:return
+		self._closed = True
+		if self._mode == 'setup':
+			# nothing was started (e.g. the Sweeper was only used to estimate_duration()); just release the connection.
+			if self._own_connection:
+				self._cxn.disconnect()
+			if self._trace_path:
+				self._tracer.stop()
+			return
 		print("Sweep and log completed, closing LabRAD Connections")
-		self._cxn.disconnect()
-		self._dataset.close_dataset()
+		self._dataset.close_dataset()  # finishes writing the data before the connection is released
+		if self._own_connection:
+			self._cxn.disconnect() # releases this Sweeper's hold on the shared connection
 		print("Connections closed.")
+		if self._stats_path:
+			self.dump_stats(self._stats_path)
+		if self._trace_path:
+			self._tracer.stop()
+			self._tracer.write(self._trace_path)
+
+class SweepQueue(object):
+	"""
+	Runs a series of sweeps (each described as in a sweep file; see components/sweep_file.py) one after another.
+
+	The sweeps share one LabRAD connection, which is kept open for the whole queue, and a SettingCache, so
+	each device is only selected (and each VDS channel only looked up) once. Each sweep after the first ramps
+	straight from where the previous one ended to its own first point (with its pre-sweep, so within the
+	max_step_size of its settings), and the sweeps before the last skip their post-sweeps. Settings that the previous
+	sweep didn't sweep start from the sweep file's start_rampfrom, if it gives one, or else from their current values
+	(see generate_mesh.)
+	"""
+	def __init__(self,sweeps=None,ramp_between=True):
+		"""
+		sweeps       : list of sweeps (sweep file contents, as returned by load_sweep_file)
+		ramp_between : whether to ramp directly from each sweep to the next, as above. If False, each sweep is run as described.
+		"""
+		self.sweeps       = list(sweeps) if sweeps else []
+		self.ramp_between = ramp_between
+		self.cache        = SettingCache()
+		self.completed    = 0 # number of sweeps completed
+
+	def add(self,sweep):
+		self.sweeps.append(sweep)
+
+	def run(self,output=True):
+		"""Runs the queued sweeps in order (see Sweeper.step), returning once they have all completed."""
+		from components.sweep_file import build_sweep
+		cxn  = CONNECTION_HANDLER.acquire()
+		last = None # [definitions of the swept settings, last state set] of the previous sweep
+		try:
+			for n in range(self.completed,len(self.sweeps)):
+				if output:print("Starting sweep {n} of {total}".format(n=n+1,total=len(self.sweeps)))
+				sweep = self._linked(self.sweeps[n],last,n == len(self.sweeps)-1)
+				s = build_sweep(sweep,Sweeper,connection=cxn,setting_cache=self.cache)
+				while not s.done():
+					s.step()
+				if not s.dataset_ready():
+					s.close() # nothing was logged, so it hasn't been closed yet.
+				last = [s.definition()['swept'],s.last_set_state()]
+				self.completed += 1
+		finally:
+			cxn.disconnect()
+			self.cache.clear() # its contexts were made on the connection just released
+
+	def _linked(self,sweep,last,is_last):
+		"""Returns the sweep with its pre-sweep starting from the previous sweep's last state, and its post-sweep skipped unless it is the last."""
+		if not self.ramp_between:return sweep
+		mesh = dict(sweep['mesh'])
+		if not is_last:
+			mesh['do_post_sweep'] = False
+		if last is not None:
+			defs,state = last
+			identity   = lambda d:[d.get(key) for key in ['kind','ID','name','setting','inputs','var_slot','which_builtin','port']]
+			previous   = [identity(d) for d in defs]
+			given      = mesh.get('start_rampfrom') or [None]*len(sweep['swept'])
+			start      = []
+			for n,d in enumerate(sweep['swept']):
+				if identity(d) in previous:
+					start.append(float(state[previous.index(identity(d))]))
+				else:
+					start.append(given[n]) # not swept by the previous sweep; None is filled in by generate_mesh
+			mesh['do_pre_sweep']   = True
+			mesh['start_rampfrom'] = start
+		return dict(sweep,mesh=mesh)
+
+def main(argv=None):
+	"""
+	Headless command line interface (no Qt needed):
+	python -m sweeper run      sweep.json    runs the sweep described by a sweep file (see components/sweep_file.py)
+	python -m sweeper estimate sweep.json    prints the estimated duration of the sweep, without starting it
+	python -m sweeper resume   <checkpoint>  continues an interrupted sweep from its checkpoint file
+	python -m sweeper queue    a.json b.json runs several sweeps one after another (see SweepQueue)
+	"""
+	import argparse
+	from components.sweep_file import load_sweep_file, build_sweep
+
+	parser = argparse.ArgumentParser(prog='python -m sweeper',description="Runs LabRAD-Sweeper-2 sweeps without the user interface.")
+	parser.add_argument('command',choices=['run','estimate','resume','queue'])
+	parser.add_argument('path',nargs='+',help="sweep file (.json, .yaml) for run/estimate, checkpoint file for resume, or sweep files for queue")
+	parser.add_argument('--quiet',action='store_true',help="don't print progress")
+	parser.add_argument('--progress-interval',type=float,default=10.0,help="seconds between progress reports (default 10)")
+	parser.add_argument('--stats',metavar='PATH',help="write timing statistics of the sweep (see Sweeper.stats) to PATH as JSON when it ends (run/resume)")
+	parser.add_argument('--trace',metavar='PATH',help="trace the LabRAD calls of the sweep, and write the timeline to PATH as a Chrome trace file when it ends (run/resume)")
+	args = parser.parse_args(argv)
+	if args.command != 'queue' and len(args.path) != 1:
+		parser.error("{command} takes one file".format(command=args.command))
+
+	if args.command == 'queue':
+		SweepQueue([load_sweep_file(path) for path in args.path]).run(output=not args.quiet)
+		return 0
+
+	args.path = args.path[0]
+	if args.command == 'estimate':
+		sweep = load_sweep_file(args.path)
+		s = Sweeper.from_definition(sweep,**sweep.get('sweeper',{}))
+		s.measure_latencies()
+		print("Estimated duration: {duration:.0f} s".format(duration=s.estimate_duration(**sweep['mesh'])))
+		s.close()
+		return 0
+
+	if args.command == 'run':
+		s = build_sweep(load_sweep_file(args.path),Sweeper,stats_path=args.stats,trace_path=args.trace)
+	else:
+		s = Sweeper.resume(args.path,stats_path=args.stats,trace_path=args.trace)
+
+	last_report = time.time()
+	try:
+		while not s.done():
+			s.step()
+			if (not args.quiet) and time.time() - last_report >= args.progress_interval and not s.done():
+				last_report = time.time()
+				print("Step {done} of {total}, about {eta:.0f} s remaining".format(done=s._mesh.steps_done,total=s._mesh.total_steps(),eta=s.estimate_duration()))
+	except KeyboardInterrupt:
+		print("Sweep interrupted at step {done} of {total}.".format(done=s._mesh.steps_done,total=s._mesh.total_steps()))
+		if s._checkpoint_path:
+			s._write_checkpoint()
+			print("It can be continued with: python -m sweeper resume {path}".format(path=s._checkpoint_path))
+		s.close()
+		return 1
+
+	if not s.dataset_ready():
+		s.close() # nothing was logged, so the connection hasn't been closed yet.
+	return 0
 
-# example usage
 if __name__ == '__main__':
-
-	s = Sweeper()
-	s.add_axis(0,1,11)
-	s.add_swept_setting(    'dev', label="SET QUAD 0", setting=['dcbox_quad_ad5780','dcbox_quad_ad5780 (COM20)','set_voltage'],inputs=[0],var_slot=1)
-	s.add_swept_setting(    'dev', label="SET QUAD 1", setting=['dcbox_quad_ad5780','dcbox_quad_ad5780 (COM20)','set_voltage'],inputs=[1],var_slot=1)
-	s.add_recorded_setting( 'dev', label="GET QUAD 0", setting=['dcbox_quad_ad5780','dcbox_quad_ad5780 (COM20)','get_voltage'],inputs=[0])
-	s.add_recorded_setting( 'dev', label="GET QUAD 1", setting=['dcbox_quad_ad5780','dcbox_quad_ad5780 (COM20)','get_voltage'],inputs=[1])
-	s.generate_mesh([[0,1],[0,2]])
-
-	s.autosweep(output=True)
-
-	# s.initalize_dataset('ds_test_3','\\data\\test\\')
-	# ^
-	# |
-	# this would create the appropriate data set. It's commented out to prevent unnecessary files.
-	# the dataset initializeation can be called ay any point before during or after the sweep.
-	# Before it is called, all data (and comments, and parameters) are stored but not written
-	# When it is called, all stored data (and comments, and parametrs) will be written
-	# Once is has been called, all data and comments and parameteres are written as they are acquired.
+	import sys
+	sys.exit(main())
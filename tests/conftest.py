@@ -0,0 +1,52 @@
+"""
+Shared fixtures. The tests run against components.fake_labrad.FakeConnection, so they need neither pylabrad nor a LabRAD manager.
+Run from the repository root with: python -m pytest tests
+"""
+import json, os, sys
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components import connection_handler
+from components.connection_handler import CONNECTION_HANDLER
+from components.fake_labrad import FakeConnection
+
+class FakeLabrad(object):
+	"""Stands in for the labrad module, so that CONNECTION_HANDLER (and so the CLI) connects to one FakeConnection."""
+	def __init__(self,cxn):
+		self.cxn = cxn
+	def connect(self,**kwargs):
+		self.cxn.connected = True
+		return self.cxn
+
+@pytest.fixture
+def shared_fake(monkeypatch):
+	"""A FakeConnection that Sweepers created without a connection (e.g. by the CLI) share through CONNECTION_HANDLER."""
+	cxn = FakeConnection()
+	monkeypatch.setattr(connection_handler,'labrad',FakeLabrad(cxn))
+	CONNECTION_HANDLER.shutdown()
+	yield cxn
+	CONNECTION_HANDLER.shutdown()
+
+def dac_sweep(swept=('V0',),points=(5,3),mesh=None,dataset=True):
+	"""Contents of a sweep file sweeping DAC outputs (named V<port>) of the fake DAC-ADC, and reading ADC input 0."""
+	ports = [int(label[1:]) for label in swept]
+	sweep = {
+		'axes'    :[{'start':0.0,'end':1.0,'points':n} for n in points],
+		'swept'   :[{'kind':'dev','label':label,'setting':['dac_adc','DA_0','set_voltage'],'inputs':[port],'var_slot':1} for label,port in zip(swept,ports)],
+		'recorded':[{'kind':'dev','label':'A0','setting':['dac_adc','DA_0','read_voltage'],'inputs':[0]}],
+		'mesh'    :dict({'lincombs':[[0.1*n,1.0]+[0.5]*(len(points)-1) for n in range(len(swept))]},**(mesh or {})),
+		}
+	if dataset:
+		sweep['dataset'] = {'name':'test','location':'\\tests'}
+	return sweep
+
+def write_sweep(tmpdir,name,sweep):
+	path = str(tmpdir.join(name))
+	with open(path,'w') as f:
+		json.dump(sweep,f)
+	return path
+
+def datasets(cxn,folder=('tests',)):
+	"""The datasets written to the fake data vault in folder, by name."""
+	return cxn.servers['data_vault']._server.datasets.get(tuple(folder),{})
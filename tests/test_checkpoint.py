@@ -0,0 +1,115 @@
+"""Checkpoints, and resuming interrupted sweeps from them."""
+import time
+import pytest
+from components.checkpoint import read_checkpoint
+from components.fake_labrad import FakeConnection
+from components.sweep_file import build_sweep
+from conftest import dac_sweep, datasets
+from sweeper import Sweeper
+
+POINTS = (6,4)
+
+def start(cxn,tmpdir,dataset=True,**kwargs):
+	sweep = dac_sweep(swept=('V0','V1'),points=POINTS,dataset=dataset)
+	sweep['checkpoint'] = {'path':str(tmpdir.join('sweep.checkpoint')),'interval':1e9} # only the checkpoints written by checkpoint()
+	return build_sweep(sweep,Sweeper,connection=cxn,**kwargs)
+
+def measure(s,points):
+	"""Advances the sweep until <points> points have been measured in all."""
+	while s._measured < points:
+		s.advance(1.0)
+
+def checkpoint(s):
+	s.enable_checkpoints(s._checkpoint_path,1e9)
+	return s._checkpoint_path
+
+def crash(s):
+	"""Abandons the sweep as a crash would: without closing it, and with nothing more written to the data vault."""
+	s._dataset.writer_error = ValueError("crashed")
+
+def finish(s):
+	while not s.done():
+		s.advance(1.0)
+
+def check_rows(rows):
+	"""Every point of the mesh was logged once, in order."""
+	assert [row[:2] for row in rows] == [[float(x),float(y)] for y in range(POINTS[1]) for x in range(POINTS[0])]
+	for row in rows:
+		assert row[4] == pytest.approx(row[2]) # A0 reads back V0
+
+@pytest.mark.parametrize('points',[1,7,23])
+def test_resume_into_created_dataset(tmpdir,points):
+	cxn = FakeConnection()
+	s   = start(cxn,tmpdir)
+	measure(s,points)
+	path = checkpoint(s)
+	crash(s)
+	s = Sweeper.resume(path,connection=cxn)
+	assert s._mesh.steps_done == points
+	finish(s)
+	data = datasets(cxn)
+	assert list(data) == ['00001 - test'] # resumed into the same dataset
+	check_rows(data['00001 - test']['data'])
+	assert [comment[0] for comment in data['00001 - test']['comments']].count("Created by LabRAD-Sweeper-2") == 1
+	with pytest.raises(ValueError):
+		Sweeper.resume(path,connection=cxn) # already complete
+
+def test_points_logged_after_the_checkpoint_are_skipped(tmpdir):
+	cxn = FakeConnection()
+	s   = start(cxn,tmpdir)
+	measure(s,5)
+	path = checkpoint(s)
+	measure(s,12)
+	crash(s)
+	s = Sweeper.resume(path,connection=cxn)
+	assert s._mesh.steps_done == 12
+	assert list(s._start_rampfrom) == pytest.approx(datasets(cxn)['00001 - test']['data'][-1][2:4]) # ramps from the last point logged
+	finish(s)
+	check_rows(datasets(cxn)['00001 - test']['data'])
+
+def wait_written(s,rows):
+	"""Waits for the writer thread to have written <rows> rows."""
+	deadline = time.time() + 10.0
+	while s._dataset.rows_written < rows and time.time() < deadline:
+		time.sleep(0.001)
+	assert s._dataset.rows_written == rows
+
+def test_async_writer(tmpdir):
+	cxn = FakeConnection()
+	s   = start(cxn,tmpdir,async_logging=True)
+	s._dataset.flush_rows,s._dataset.flush_age = 8,60.0 # rows are written 8 at a time
+	measure(s,12)
+	wait_written(s,8)
+	started = time.time()
+	path = checkpoint(s)
+	assert time.time() - started < 1.0 # the checkpoint doesn't wait for the writer
+	saved = read_checkpoint(path)
+	assert (saved['rows_written'],len(saved['data'])) == (8,4) # rows queued for the writer are in the checkpoint
+	measure(s,18)
+	wait_written(s,16)
+	crash(s)
+	s = Sweeper.resume(path,connection=cxn,async_logging=True)
+	assert s._mesh.steps_done == 16
+	finish(s)
+	check_rows(datasets(cxn)['00001 - test']['data'])
+
+def test_resume_before_dataset_created(tmpdir):
+	cxn = FakeConnection()
+	s   = start(cxn,tmpdir,dataset=False,spool_dir=str(tmpdir))
+	measure(s,10)
+	path = checkpoint(s)
+	assert s._dataset.spool() is not None and read_checkpoint(path)['data'] == [] # unwritten data is in the spool file, rather than in the checkpoint
+	s = Sweeper.resume(path,connection=cxn,spool_dir=str(tmpdir))
+	finish(s)
+	s.initialize_dataset('test','\\tests')
+	s.close()
+	check_rows(datasets(cxn)['00001 - test']['data'])
+
+def test_resume_ramps_from_last_state(tmpdir):
+	cxn = FakeConnection()
+	s   = start(cxn,tmpdir)
+	measure(s,9)
+	path = checkpoint(s)
+	last = list(cxn.servers['dac_adc']._server.dac['DA_0'][:2])
+	s = Sweeper.resume(path,connection=cxn)
+	assert list(s._start_rampfrom) == pytest.approx(last)
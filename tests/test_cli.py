@@ -0,0 +1,49 @@
+"""The headless command line interface (sweeper.main)."""
+from conftest import dac_sweep, write_sweep, datasets
+import sweeper
+
+def test_run(shared_fake,tmpdir):
+	path = write_sweep(tmpdir,'sweep.json',dac_sweep(points=(4,3)))
+	assert sweeper.main(['run',path,'--quiet']) == 0
+	data = list(datasets(shared_fake).values())
+	assert len(data) == 1
+	assert len(data[0]['data']) == 12
+
+def test_estimate(shared_fake,tmpdir,capsys):
+	path = write_sweep(tmpdir,'sweep.json',dac_sweep(mesh={'do_post_sweep':True,'end_rampto':[0.0]}))
+	assert sweeper.main(['estimate',path]) == 0
+	assert "Estimated duration" in capsys.readouterr().out
+	assert datasets(shared_fake) == {} # nothing is run or logged
+
+def test_estimate_accepts_every_mesh_argument(shared_fake,tmpdir,capsys):
+	# generate_mesh() arguments that don't affect the estimate (e.g. lazy) must still be accepted, as run accepts them
+	path = write_sweep(tmpdir,'sweep.json',dac_sweep(mesh={'lazy':False,'traversal':'serpentine','start_index':2,'do_pre_sweep':True,'start_rampfrom':[0.0]}))
+	assert sweeper.main(['estimate',path]) == 0
+	assert "Estimated duration" in capsys.readouterr().out
+	assert sweeper.main(['run',path,'--quiet']) == 0
+
+def test_queue_adding_a_setting(shared_fake,tmpdir):
+	# the second sweep adds a DAC output (which can't be read back) that the first didn't sweep
+	first  = write_sweep(tmpdir,'first.json' ,dac_sweep(swept=('V0',)))
+	second = write_sweep(tmpdir,'second.json',dac_sweep(swept=('V0','V1'),mesh={'do_post_sweep':True,'end_rampto':[0.0,0.0]}))
+	assert sweeper.main(['queue',first,second,'--quiet']) == 0
+	data = datasets(shared_fake)
+	assert len(data) == 2
+	assert all([len(dataset['data']) == 15 for dataset in data.values()])
+	assert shared_fake.servers['dac_adc']._server.dac['DA_0'][:2] == [0.0,0.0] # the last sweep's post-sweep
+
+def test_queue_links_start_per_setting():
+	queue = sweeper.SweepQueue()
+	first = dac_sweep(swept=('V0',))
+	last  = [[dict(d,max_step_size=None) for d in first['swept']],[0.75]]
+	sweep = dac_sweep(swept=('V1','V0'))
+	assert queue._linked(sweep,last,True)['mesh']['start_rampfrom'] == [None,0.75] # V1 is filled in by generate_mesh
+	sweep['mesh']['start_rampfrom'] = [0.25,0.0]
+	assert queue._linked(sweep,last,True)['mesh']['start_rampfrom'] == [0.25,0.75]
+
+def test_queue_without_datasets(shared_fake):
+	queue = sweeper.SweepQueue([dac_sweep(dataset=False),dac_sweep(dataset=False)])
+	queue.run(output=False)
+	assert queue.completed == 2
+	assert queue.cache.contexts == {} # cleared, as the connection was released
+	assert not shared_fake.connected
@@ -0,0 +1,72 @@
+"""ConnectionHandler: sharing, reference counting and re-opening of the LabRAD connection, and the caches of contexts made on it."""
+import pytest
+from components import connection_handler
+from components.connection_handler import ConnectionHandler
+from components.fake_labrad import FakeConnection
+from components.settings import Setting, SettingBatch, SettingCache
+
+class Connections(object):
+	"""Stands in for the labrad module, opening a new FakeConnection (with new servers) each time."""
+	def __init__(self):
+		self.opened = []
+	def connect(self,**kwargs):
+		self.opened.append(FakeConnection())
+		return self.opened[-1]
+
+@pytest.fixture
+def connections(monkeypatch):
+	fake = Connections()
+	monkeypatch.setattr(connection_handler,'labrad',fake)
+	return fake
+
+def dac(cxn,port,cache=None):
+	s = Setting(cxn,cache=cache)
+	s.dev_set(['dac_adc','DA_0','set_voltage'],[port],1)
+	return s
+
+def test_refcount(connections):
+	h = ConnectionHandler()
+	a,b = h.acquire(),h.acquire()
+	a.dac_adc
+	b.data_vault
+	assert len(connections.opened) == 1 # shared
+	a.disconnect()
+	a.disconnect() # only released once
+	assert connections.opened[0].connected
+	b.disconnect()
+	assert not connections.opened[0].connected
+	with pytest.raises(ValueError):
+		h.release()
+	h.acquire()
+	assert len(connections.opened) == 2
+
+def test_keep_alive(connections):
+	h = ConnectionHandler(keep_alive=True)
+	h.acquire().disconnect()
+	assert connections.opened[0].connected
+	h.acquire()
+	h.shutdown()
+	assert len(connections.opened) == 1 and not connections.opened[0].connected
+
+def test_reconnect(connections):
+	h = ConnectionHandler()
+	a = h.acquire()
+	assert a.generation == 1
+	connections.opened[0].disconnect() # lost
+	assert a.context() == (0,1) # on a new connection
+	assert (len(connections.opened),a.generation) == (2,2)
+
+def test_caches_follow_reconnect(connections):
+	h = ConnectionHandler()
+	cxn,cache = h.acquire(),SettingCache()
+	batch = SettingBatch(cxn,[dac(cxn,0,cache),dac(cxn,1,cache)])
+	batch.set([0.5,0.25])
+	connections.opened[0].disconnect()
+	batch.set([1.0,2.0]) # the device is selected again, in a context on the new connection
+	new = connections.opened[1]
+	assert new.servers['dac_adc']._server.dac['DA_0'][:2] == [1.0,2.0]
+	assert new.servers['dac_adc']._server.selected == {batch.groups[0][2]:'DA_0'}
+	assert new.requests == 2 # select_device, then the packet: nothing failed
+	ctx = cache.device_context(cxn,'dac_adc','DA_0')
+	assert new.servers['dac_adc']._server.selected[ctx] == 'DA_0'
+	assert list(cache.contexts) == [('dac_adc','DA_0')] and cache.generation == 2
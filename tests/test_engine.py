@@ -0,0 +1,72 @@
+"""SweepEngine: running a sweep on its own thread, with pause / resume / abort."""
+import time
+import pytest
+from components.engine import SweepEngine
+from components.fake_labrad import FakeConnection
+from components.sweep_file import build_sweep
+from conftest import dac_sweep, datasets
+from sweeper import Sweeper
+
+def engine(post_ramp_delay=0,**kwargs):
+	sweep = dac_sweep()
+	sweep['axes'][0]['post_ramp_delay'] = post_ramp_delay # ms
+	cxn = FakeConnection()
+	return cxn,SweepEngine(build_sweep(sweep,Sweeper,connection=cxn),interval=0.005,**kwargs)
+
+def wait_for(condition):
+	deadline = time.time() + 10.0
+	while not condition() and time.time() < deadline:
+		time.sleep(0.001)
+	assert condition()
+
+def test_runs_to_the_end():
+	cxn,e = engine()
+	e.close_when_done = True
+	e.start()
+	e.join(10.0)
+	status = e.status()
+	assert (status['state'],status['steps_done'],status['total_steps'],status['eta']) == ('done',14,14,0.0) # steps between the 15 points
+	assert len(datasets(cxn)['00001 - test']['data']) == 15
+	assert e.sweeper._closed
+
+def test_pause_and_resume():
+	cxn,e = engine(post_ramp_delay=10,paused=True)
+	e.start()
+	time.sleep(0.05)
+	assert (e.status()['state'],e.status()['steps_done']) == ('paused',0)
+	e.resume()
+	wait_for(lambda:e.status()['steps_done'] >= 3)
+	e.pause()
+	wait_for(lambda:e.status()['state'] == 'paused')
+	steps = e.status()['steps_done']
+	time.sleep(0.1)
+	assert e.status()['steps_done'] == steps < 14
+	e.resume()
+	e.join(10.0)
+	assert e.status()['state'] == 'done' and not e.running()
+	assert len(datasets(cxn)['00001 - test']['data']) == 15
+
+def test_abort():
+	cxn,e = engine(post_ramp_delay=10)
+	e.start()
+	wait_for(lambda:e.status()['steps_done'] >= 2)
+	e.abort()
+	e.join(10.0)
+	assert e.status()['state'] == 'aborted' and e.status()['steps_done'] < 14
+	assert e.sweeper._mode == 'sweep' # left as it was, e.g. to be resumed from its checkpoint
+	e.sweeper.close()
+
+def test_error_stops_the_engine():
+	cxn,e = engine()
+	def fail(ctx,port,voltage):
+		raise ValueError("DAC error")
+	cxn.servers['dac_adc']._server.set_voltage = fail
+	e.start()
+	e.join(10.0)
+	status = e.status()
+	assert status['state'] == 'error' and str(status['error']) == "DAC error"
+	e.sweeper.close()
+
+def test_interval():
+	with pytest.raises(ValueError):
+		SweepEngine(None,interval=0.0)
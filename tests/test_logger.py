@@ -0,0 +1,132 @@
+"""DataSet: writing to the (fake) data vault, synchronously or with the background writer thread."""
+import os, time
+import numpy
+import pytest
+from components.fake_labrad import FakeConnection
+from components.logger import DataSet, RowBuffer, SpoolBuffer
+from conftest import datasets
+
+def dataset(cxn,**kwargs):
+	d = DataSet([['x','v']],[['y','y','v']],name='test',loc=['','tests'],connection=cxn,**kwargs)
+	d.create_dataset()
+	return d
+
+def stored(cxn):
+	return datasets(cxn)['00001 - test']['data']
+
+def wait_for(condition):
+	deadline = time.time() + 10.0
+	while not condition() and time.time() < deadline:
+		time.sleep(0.001)
+	assert condition()
+
+def test_sync_write():
+	cxn = FakeConnection()
+	d   = dataset(cxn)
+	d.add_data([[0.0,1.0],[1.0,2.0]],True)
+	assert stored(cxn) == [[0.0,1.0],[1.0,2.0]]
+	assert (len(d.data),d.rows_written,d.writer_status()['async']) == (0,2,False)
+
+def test_async_writes_in_batches():
+	cxn = FakeConnection()
+	d   = dataset(cxn,async_write=True,flush_rows=10,flush_age=60.0)
+	for n in range(25):
+		d.add_data([[n,2.0*n]],True)
+	wait_for(lambda:d.rows_written == 20) # two batches of flush_rows; the rest wait for more, or their age
+	assert len(stored(cxn)) == 20
+	assert len(d.pending_data()) == 5
+	d.close_dataset() # sends the rest
+	assert stored(cxn) == [[float(n),2.0*n] for n in range(25)]
+	assert d.writer_status()['async'] is False
+
+def test_async_writes_old_rows():
+	cxn = FakeConnection()
+	d   = dataset(cxn,async_write=True,flush_rows=1000,flush_age=0.01)
+	d.add_data([[0.0,0.0],[1.0,1.0]],True)
+	wait_for(lambda:d.rows_written == 2)
+	d.close_dataset()
+
+def test_writer_failure_keeps_rows():
+	cxn = FakeConnection()
+	d   = dataset(cxn,async_write=True,flush_rows=1)
+	def fail(ctx,data):
+		raise ValueError("data vault error")
+	cxn.servers['data_vault']._server.add = fail
+	d.add_data([[0.0,1.0]],True)
+	wait_for(lambda:d.writer_error is not None)
+	with pytest.raises(ValueError,match='data vault error'):
+		d.add_data([[1.0,2.0]],True)
+	assert d.writer_status()['error'] == "data vault error"
+	assert numpy.array_equal(d.pending_data(),[[0.0,1.0],[1.0,2.0]]) # nothing is lost
+	d.close_dataset()
+
+def test_backpressure():
+	cxn = FakeConnection(latency=0.01)
+	d   = dataset(cxn,async_write=True,max_queue=1,flush_rows=1)
+	for n in range(5):
+		d.add_data([[n,n]],True)
+	d.close_dataset()
+	assert d.backpressure_events > 0 and d.backpressure_time > 0.0
+	assert len(stored(cxn)) == 5
+
+def test_row_buffer_grows():
+	b = RowBuffer(2,capacity=2)
+	for n in range(5):
+		b.append([[n,-n]])
+	b.append(numpy.zeros([10,2]))
+	assert len(b) == 15 and len(b._array) >= 15
+	assert b.view()[:5].tolist() == [[n,-n] for n in range(5)]
+	assert [len(chunk) for chunk in b.chunks(4)] == [4,4,4,3]
+	b.discard(3)
+	assert b.view()[:2].tolist() == [[3,-3],[4,-4]] and len(b) == 12
+
+def test_add_data_array_and_lists():
+	d = DataSet([['x','v']],[['y','y','v']],connection=FakeConnection())
+	d.add_data(numpy.array([[0.0,1.0],[1.0,2.0]]))
+	d.add_data([[2,3.0],(3.0,4)])
+	d.add_data([])
+	assert d.pending_data().tolist() == [[0.0,1.0],[1.0,2.0],[2.0,3.0],[3.0,4.0]]
+	for bad in [numpy.zeros([2,3]),numpy.zeros(2),[[0.0,1.0,2.0]],[[0.0]],[0.0,1.0],[['a',1.0]]]:
+		with pytest.raises(ValueError):
+			d.add_data(bad)
+	assert len(d.pending_data()) == 4 # invalid data isn't added
+
+def test_spool_buffer(tmpdir):
+	b = SpoolBuffer(2,directory=str(tmpdir))
+	b.append([[0.0,1.0],[2.0,3.0]])
+	b.append(numpy.array([[4.0,5.0]]))
+	view = b.view()
+	assert view.tolist() == [[0.0,1.0],[2.0,3.0],[4.0,5.0]]
+	b.discard(3)
+	assert len(b) == 0 and view.tolist()[2] == [4.0,5.0] # views can still be read; the file isn't truncated yet
+	b.append([[6.0,7.0]])
+	assert os.path.getsize(b.path) == 16 and b.view().tolist() == [[6.0,7.0]]
+	b.discard(1)
+	b.close()
+	assert not os.path.exists(b.path) # deleted once everything was written
+
+def test_spool_file_reopened(tmpdir):
+	b = SpoolBuffer(2,directory=str(tmpdir))
+	b.append(numpy.arange(10.0).reshape([5,2]))
+	with open(b.path,'ab') as f:
+		f.write(b'\0'*12) # a partial row, as from a write that was interrupted
+	b = SpoolBuffer(2,path=b.path,offset=1,rows=4)
+	assert b.view().tolist() == [[2.0,3.0],[4.0,5.0],[6.0,7.0]]
+	assert SpoolBuffer(2,path=b.path,offset=9).view().tolist() == []
+	b.close()
+	assert os.path.exists(b.path) # kept, since it holds rows that weren't written
+
+def test_spooled_dataset(tmpdir):
+	cxn = FakeConnection()
+	d   = DataSet([['x','v']],[['y','y','v']],name='test',loc=['','tests'],connection=cxn,spool_dir=str(tmpdir),write_chunk=3)
+	d.add_data(numpy.arange(20.0).reshape([10,2]))
+	path = d.spool()[0]
+	assert os.path.getsize(path) == 160
+	d.create_dataset()
+	d.write_data() # streamed from the file in chunks
+	assert stored(cxn) == numpy.arange(20.0).reshape([10,2]).tolist()
+	assert d.spool()[1:] == [10,10]
+	d.add_data([[20.0,21.0]],True)
+	assert len(stored(cxn)) == 11 and os.path.getsize(path) == 16
+	d.close_dataset()
+	assert not os.path.exists(path)
@@ -0,0 +1,67 @@
+"""Compiled schedules (RampSchedule) against the live ramping of Sweeper.advance(), and the totals used for estimates."""
+import numpy
+import pytest
+from components.fake_labrad import FakeConnection
+from components.sweep_file import build_sweep
+from conftest import dac_sweep, datasets
+from sweeper import Sweeper
+
+def ramped_sweep(compile=False,chunk_points=None):
+	"""Two DAC outputs; the first axis' ramps have a duration, and V0 has a step limit that the second axis' ramps exceed."""
+	sweep = dac_sweep(swept=('V0','V1'),points=(5,3))
+	sweep['axes'][0].update(min_ramp_duration=20,post_ramp_delay=5)
+	sweep['axes'][1].update(post_ramp_delay=10)
+	sweep['swept'][0]['max_step_size'] = 0.1
+	sweep['compile'] = compile
+	cxn = FakeConnection()
+	s   = build_sweep(sweep,Sweeper,connection=cxn)
+	if chunk_points:
+		s.compile_schedule(chunk_points)
+	return cxn,s
+
+def run(s):
+	"""Runs the sweep, calling advance() at each deadline; returns the states set after the first measurement, and the time from it to the end."""
+	states,elapsed = [],0.0
+	set_state = s._set_state
+	def record(state):
+		set_state(state)
+		if s._measured:states.append(list(s._last_set_state))
+	s._set_state = record
+	while s._mode == 'sweep':
+		dt = max([s.next_deadline(),1e-6])
+		if s._measured:elapsed += dt
+		s.advance(dt)
+	return states,elapsed
+
+@pytest.mark.parametrize('chunk_points',[None,1,4])
+def test_compiled_matches_live(chunk_points):
+	live_cxn,live = ramped_sweep()
+	comp_cxn,comp = ramped_sweep(compile=True,chunk_points=chunk_points)
+	assert comp._schedule is not None
+	live_states,live_time = run(live)
+	comp_states,comp_time = run(comp)
+	assert numpy.allclose(comp_states,live_states)
+	assert comp_time == pytest.approx(live_time)
+	assert numpy.allclose(datasets(comp_cxn)['00001 - test']['data'],datasets(live_cxn)['00001 - test']['data'])
+
+@pytest.mark.parametrize('compile',[False,True])
+def test_totals_match_a_run(compile):
+	cxn,s  = ramped_sweep(compile=compile)
+	totals = s._sweep_estimator().totals(s._mesh.steps_done + 1)
+	estimate = s.estimate_duration()
+	states,elapsed = run(s)
+	assert totals[0] == pytest.approx(elapsed) # from the first measurement
+	assert totals[1] == len(states)
+	assert totals[2] == 15 - 1 # points after the first
+	assert estimate >= totals[0]
+
+def test_totals_are_cached_per_chunk():
+	cxn,s = ramped_sweep(chunk_points=4)
+	whole = s._schedule.totals(1)
+	assert sorted(s._schedule._totals) == [1,5,9,13]
+	for start in range(1,15):
+		rest = s._schedule.totals(start) # a partial first chunk, then the cached ones
+		assert rest[2] == 15 - start
+	assert s._schedule.totals(1) == pytest.approx(whole)
+	with pytest.raises(ValueError):
+		s._schedule.compile(0,2)
@@ -0,0 +1,177 @@
+"""
+Settings: batched get/set (SettingBatch), asynchronous get, and skipping writes that wouldn't change a swept setting (needs_set),
+and quantizing settings to their resolution.
+"""
+import numpy
+import pytest
+from components.engine import monotonic
+from components.fake_labrad import FakeConnection, FakeDACADC
+from components.settings import Setting, SettingBatch, dac_resolution
+from components.sweep_file import build_sweep
+from conftest import dac_sweep, datasets
+from sweeper import Sweeper
+
+LSB = 20.0/2**16
+
+def dac(cxn,port):
+	s = Setting(cxn)
+	s.dev_set(['dac_adc','DA_0','set_voltage'],[port],1)
+	return s
+
+def adc(cxn,port):
+	s = Setting(cxn)
+	s.dev_get(['dac_adc','DA_0','read_voltage'],[port])
+	return s
+
+def vds(cxn,ID):
+	s = Setting(cxn)
+	s.vds(ID)
+	return s
+
+def builtin(cxn,which):
+	s = Setting(cxn)
+	s.builtin(which)
+	return s
+
+def test_batch_set_and_get():
+	cxn   = FakeConnection()
+	swept = [dac(cxn,0),vds(cxn,'dac2'),dac(cxn,1),builtin(cxn,'do nothing')]
+	batch = SettingBatch(cxn,swept)
+	assert [group[:2] for group in batch.groups] == [['dac_adc','DA_0'],['virtual_device_server',None]]
+	assert (batch.groups[0][3],batch.local) == ([0,2],[3])
+	requests = cxn.requests
+	batch.set([0.5,0.25,-1.0,7.0])
+	assert cxn.requests - requests == 2 # one packet per server & device
+	assert cxn.servers['dac_adc']._server.dac['DA_0'][:3] == [0.5,-1.0,0.25]
+	assert [s.last_value for s in swept] == [0.5,0.25,-1.0,7.0]
+	batch.set([0.0,0.0,2.0,0.0],only=[2])
+	assert cxn.servers['dac_adc']._server.dac['DA_0'][:3] == [0.5,2.0,0.25]
+	assert cxn.requests - requests == 3 # groups with nothing to set aren't sent
+	with pytest.raises(ValueError):
+		batch.set([0.0])
+
+	recorded = SettingBatch(cxn,[adc(cxn,0),vds(cxn,'dac1'),builtin(cxn,'zero')])
+	assert recorded.get() == pytest.approx([adc(cxn,0).get(),2.0,0.0])
+	assert [s.stats['get'].count for s in recorded.settings[:2]] == [1,1]
+
+def test_batch_reselects_device():
+	cxn   = FakeConnection()
+	batch = SettingBatch(cxn,[dac(cxn,0),dac(cxn,1)])
+	cxn.servers['dac_adc']._server.selected.clear() # as if the server had restarted
+	batch.set([1.0,2.0])
+	assert cxn.servers['dac_adc']._server.dac['DA_0'][:2] == [1.0,2.0]
+
+def test_batched_sweep():
+	runs = []
+	for batch_packets in [False,True]:
+		cxn = FakeConnection()
+		s   = build_sweep(dac_sweep(swept=('V0','V1','V2')),Sweeper,connection=cxn,batch_packets=batch_packets)
+		requests = cxn.requests
+		while s._mode == 'sweep':
+			s.advance(1.0)
+		runs.append([cxn.requests-requests,numpy.array(datasets(cxn)['00001 - test']['data'])])
+	assert numpy.allclose(runs[0][1],runs[1][1])
+	assert runs[1][0] < runs[0][0]
+
+def test_get_async():
+	cxn = FakeConnection(latency=0.05)
+	dac(cxn,1).set(0.5)
+	recorded = [adc(cxn,0),vds(cxn,'dac1'),builtin(cxn,'zero')]
+	expected = [s.get() for s in recorded]
+	start    = monotonic()
+	futures  = [s.get_async() for s in recorded]
+	values   = [future.wait() for future in futures]
+	assert monotonic() - start < 0.09 # the reads overlap
+	assert values == pytest.approx(expected) and values[1] == 0.5
+	assert recorded[0].stats['get'].count == 2
+	with pytest.raises(ValueError):
+		dac(cxn,0).get_async()
+
+def test_get_async_falls_back_to_get():
+	cxn = FakeConnection()
+	s   = adc(cxn,0)
+	cxn.servers['dac_adc']._server.selected.clear() # the request fails; get() selects the device again
+	assert s.get_async().wait() == pytest.approx(s.get())
+
+def test_needs_set():
+	s = Setting(tolerance=0.01)
+	assert s.needs_set(1.0) # nothing written yet
+	s.last_value = 1.0
+	assert not s.needs_set(1.005)
+	assert s.needs_set(1.02)
+
+	s = Setting(resolution=0.1)
+	s.last_value = 1.0
+	assert not s.needs_set(1.0 + 1e-12)
+	assert not s.needs_set(1.04) # rounds to the same step
+	assert s.needs_set(1.06)
+	with pytest.raises(ValueError):
+		Setting(tolerance=-1.0)
+
+def record_sets(cxn):
+	"""Records the [port, voltage] of each set_voltage call."""
+	calls  = []
+	server = cxn.servers['dac_adc']._server
+	set_voltage = server.set_voltage
+	def record(ctx,port,voltage):
+		calls.append([port,voltage])
+		return set_voltage(ctx,port,voltage)
+	server.set_voltage = record
+	return calls
+
+def test_unchanged_settings_are_not_resent():
+	sweep = dac_sweep(swept=('V0','V1'))
+	sweep['mesh']['lincombs'] = [[0.0,1.0,0.0],[0.0,0.0,1.0]] # V1 only changes along the second axis
+	cxn   = FakeConnection()
+	calls = record_sets(cxn)
+	s     = build_sweep(sweep,Sweeper,connection=cxn)
+	while s._mode == 'sweep':
+		s.advance(1.0)
+	assert [voltage for port,voltage in calls if port == 1] == [0.0,0.5,1.0]
+	assert s._swp[1].skipped > 0 and s._swp[0].skipped == 0
+	data = numpy.array(datasets(cxn)['00001 - test']['data'])
+	assert numpy.array_equal(data[:,3],data[:,1]*0.5) # still logged at every point
+
+def test_snap_and_max_step_size():
+	s = Setting(max_step_size=0.25,resolution=0.1)
+	assert s.max_step_size == pytest.approx(0.2) # rounded down to whole steps
+	assert s.snap(0.26) == pytest.approx(0.3)
+	s.set_max_step_size(0.05)
+	assert s.max_step_size == pytest.approx(0.1) # at least one step
+	assert Setting(max_step_size=0.25).snap(0.26) == 0.26
+	with pytest.raises(ValueError):
+		Setting(resolution=0.0)
+
+def fine_sweep(resolution):
+	"""A sweep of V0 over a few LSBs of a fake DAC that rounds to them, so that most points don't change its output."""
+	cxn   = FakeConnection(dac_adc=FakeDACADC(resolution=LSB))
+	calls = record_sets(cxn)
+	sweep = dac_sweep(points=(41,))
+	sweep['axes'][0]['end'] = 10*LSB
+	sweep['mesh']['lincombs'] = [[0.0,1.0]]
+	sweep['swept'][0]['resolution'] = resolution
+	s = build_sweep(sweep,Sweeper,connection=cxn)
+	while s._mode == 'sweep':
+		s.advance(1.0)
+	return calls,s._swp[0],numpy.array(datasets(cxn)['00001 - test']['data'])
+
+def test_quantized_sweep():
+	calls,setting,data = fine_sweep('auto')
+	assert setting.resolution == dac_resolution('dac_adc','set_voltage')
+	assert len(calls) == 11 # once per LSB
+	assert setting.skipped == 41 - 11
+	assert numpy.array_equal(data[:,1],data[:,2]) # the logged setpoints are what the DAC output
+
+def test_no_quantization_without_resolution():
+	calls,setting,data = fine_sweep(None)
+	assert setting.resolution is None
+	assert len(calls) == 41
+	assert not numpy.allclose(data[:,1],data[:,2],rtol=0.0,atol=1e-3*LSB) # the requested values are logged, not the DAC's
+
+def test_auto_resolution_unknown():
+	s = Sweeper(connection=FakeConnection())
+	s.add_axis(0.0,1.0,5)
+	with pytest.raises(ValueError,match='resolution'):
+		s.add_swept_setting('dev',label='X',setting=['other_dac','DA_0','set_voltage'],inputs=[0],var_slot=1,resolution='auto')
+	with pytest.raises(ValueError,match='resolution'):
+		s.add_swept_setting('builtin',label='N',which_builtin='do nothing',resolution='auto')
@@ -0,0 +1,52 @@
+"""Timing statistics: LatencyStats, RateMeter, and Sweeper.stats()."""
+import json
+import pytest
+from components.fake_labrad import FakeConnection
+from components.stats import LatencyStats, RateMeter
+from components.sweep_file import build_sweep
+from conftest import dac_sweep
+from sweeper import Sweeper
+
+def test_latency_stats():
+	stats = LatencyStats(window=4)
+	assert stats.summary()['mean'] is None and stats.summary()['recent'] is None
+	for duration in [0.001,0.001,0.001,0.002,0.002,0.002]:
+		stats.record(duration)
+	summary = stats.summary()
+	assert (summary['count'],summary['min'],summary['max']) == (6,0.001,0.002)
+	assert summary['mean'] == pytest.approx(0.0015)
+	assert summary['recent']['count'] == 4 and summary['recent']['mean'] == pytest.approx(0.00175) # the last 4 only
+	assert sum([count for low,high,count in summary['histogram']]) == 6
+	assert all([low < 0.0025 and high >= 0.001 for low,high,count in summary['histogram']])
+	stats.record(1e-9)
+	stats.record(1e9)
+	assert [stats.summary()['histogram'][n][k] for n,k in [(0,0),(-1,1)]] == [None,None] # outside the bins
+
+def test_rate_meter():
+	rate = RateMeter(window=3)
+	rate.mark(0.0,0)
+	assert rate.rate() is None
+	for n in range(1,6):
+		rate.mark(0.5*n,n)
+	assert rate.rate() == pytest.approx(2.0)
+
+def test_sweeper_stats(tmpdir):
+	cxn = FakeConnection(latency=0.001)
+	s   = build_sweep(dac_sweep(swept=('V0','V1')),Sweeper,connection=cxn)
+	assert s.stats()['points'] == 0
+	while not s.done():
+		s.step()
+	stats = s.stats()
+	assert stats['points'] == 15 and stats['points_per_second'] > 0
+	assert sorted(stats['swept']) == ['V0','V1'] and list(stats['recorded']) == ['A0']
+	assert stats['recorded']['A0']['count'] == 15 and stats['recorded']['A0']['min'] >= 0.001
+	assert stats['swept']['V0']['count'] + stats['swept']['V0']['skipped'] >= 15
+	assert stats['dv_add']['count'] == 15 and stats['measure']['count'] == 15
+	assert stats['advance']['delay']['count'] > 0 and stats['slack']['count'] > 0
+	assert stats['writer']['rows_written'] == 15
+	path = str(tmpdir.join('stats.json'))
+	s.dump_stats(path)
+	with open(path) as f:
+		assert json.load(f)['points'] == 15
+	with pytest.raises(ValueError):
+		s.record_timing('lunch',1.0)
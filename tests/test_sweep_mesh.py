@@ -0,0 +1,112 @@
+"""Traversal of the mesh: raster and serpentine order, next() vs next_block(), and seek() / index_of()."""
+import numpy
+import pytest
+from components.sweep_mesh import SweepMesh, Axis
+
+def mesh(traversal='serpentine',lazy=False,sizes=(4,3,2)):
+	m = SweepMesh(traversal)
+	lincombs = [[0.0]+[1.0 if k == n else 0.0 for k in range(len(sizes))] for n in range(len(sizes))] # value n is the position along axis n
+	m.from_linear_functions([Axis(0.0,float(n-1),n) for n in sizes],lincombs,lazy=lazy)
+	return m
+
+def walk(m):
+	points = []
+	while not m.complete:
+		points.append(m.next())
+	return points
+
+@pytest.mark.parametrize('lazy',[False,True])
+def test_serpentine_order(lazy):
+	points = walk(mesh(lazy=lazy,sizes=(3,2)))
+	assert [p[0] for p in points] == [[0,0],[1,0],[2,0],[2,1],[1,1],[0,1]]
+	assert [p[2] for p in points] == [-1,0,0,1,0,0]
+	for positions,values,axis in points:
+		assert list(values) == [float(p) for p in positions]
+
+@pytest.mark.parametrize('lazy',[False,True])
+def test_serpentine_visits_the_raster_points(lazy):
+	raster     = walk(mesh('raster',lazy))
+	serpentine = walk(mesh('serpentine',lazy))
+	assert sorted([p[0] for p in serpentine]) == sorted([p[0] for p in raster])
+	for (a,va,axis_a),(b,vb,axis_b) in zip(serpentine,serpentine[1:]):
+		assert sum([abs(x-y) for x,y in zip(a,b)]) == 1 # each step moves one axis by one position
+		assert a[axis_b] != b[axis_b]
+
+def test_unknown_traversal():
+	with pytest.raises(ValueError):
+		SweepMesh('spiral')
+
+@pytest.mark.parametrize('traversal',['raster','serpentine'])
+@pytest.mark.parametrize('lazy',[False,True])
+@pytest.mark.parametrize('k',[1,5,24,100])
+def test_next_block_matches_next(traversal,lazy,k):
+	points = walk(mesh(traversal,lazy))
+	m,blocks = mesh(traversal,lazy),[]
+	while not m.complete:
+		blocks.append(m.next_block(k))
+	assert [len(block[0]) for block in blocks[:-1]] == [k]*(len(blocks)-1) # only the last block is short
+	assert numpy.concatenate([block[0] for block in blocks]).tolist() == [p[0] for p in points]
+	assert numpy.concatenate([block[2] for block in blocks]).tolist() == [p[2] for p in points]
+	assert numpy.allclose(numpy.concatenate([block[1] for block in blocks]),[p[1] for p in points])
+	with pytest.raises(ValueError):
+		m.next_block(1)
+
+def test_next_and_next_block_interleave():
+	a,b = mesh(),mesh()
+	for k in [1,3,2,7]:
+		points = [a.next() for n in range(k)]
+		block  = b.next_block(k)
+		assert block[0].tolist() == [p[0] for p in points]
+		assert (a.steps_done,a.axis_positions,a.directions) == (b.steps_done,b.axis_positions,b.directions)
+	assert a.next()[0] == b.next()[0]
+
+def test_get_block_leaves_iteration_state():
+	m = mesh()
+	m.next()
+	positions,values,axes = m.get_block(0,24)
+	assert axes[0] == -1 and len(positions) == 24
+	assert m.steps_done == 0 and m.next()[0] == [1,0,0]
+	with pytest.raises(ValueError):
+		m.get_block(20,26)
+
+@pytest.mark.parametrize('traversal',['raster','serpentine'])
+def test_index_of_matches_traversal(traversal):
+	m = mesh(traversal)
+	for index,(positions,values,axis) in enumerate(walk(m)):
+		assert m.index_of(positions) == index
+
+@pytest.mark.parametrize('traversal',['raster','serpentine'])
+@pytest.mark.parametrize('lazy',[False,True])
+def test_seek_continues_as_from_the_start(traversal,lazy):
+	full = walk(mesh(traversal,lazy))
+	for index in [0,1,5,11,12,23]:
+		m = mesh(traversal,lazy)
+		m.seek(index)
+		rest = walk(m)
+		assert [p[0] for p in rest] == [p[0] for p in full[index:]]
+		assert rest[0][2] == -1 # no axis is stepped to reach the point seeked to
+		assert [p[2] for p in rest[1:]] == [p[2] for p in full[index+1:]]
+		assert m.steps_done == m.total_steps()
+
+def test_seek_to_positions():
+	m = mesh()
+	m.seek([2,1,1])
+	assert m.next()[0] == [2,1,1]
+	for target in [[4,0,0],24,-1]:
+		with pytest.raises(ValueError):
+			m.seek(target)
+
+@pytest.mark.parametrize('traversal',['raster','serpentine'])
+@pytest.mark.parametrize('lazy',[False,True])
+def test_next_block_matches_next_after_seek(traversal,lazy):
+	for index in [0,7]:
+		a,b = mesh(traversal,lazy),mesh(traversal,lazy)
+		a.seek(index)
+		b.seek(index)
+		points = [a.next() for n in range(6)]
+		positions,values,axes = b.next_block(6)
+		assert [p[0] for p in points] == positions.tolist()
+		assert [p[2] for p in points] == axes.tolist()
+		assert numpy.allclose([p[1] for p in points],values)
+		assert (a.steps_done,a.axis_positions,a.directions) == (b.steps_done,b.axis_positions,b.directions)
+		assert a.next()[0] == b.next()[0]
@@ -0,0 +1,115 @@
+"""The Sweeper itself, stepped with advance() on the fake connection."""
+import numpy
+import pytest
+from components.fake_labrad import FakeConnection
+from components.sweep_file import build_sweep
+from conftest import dac_sweep, datasets
+from sweeper import Sweeper
+
+def start(sweep,**kwargs):
+	cxn = FakeConnection()
+	return cxn,build_sweep(sweep,Sweeper,connection=cxn,**kwargs)
+
+def finish(s):
+	while not s.done():
+		s.advance(max([s.next_deadline(),1e-6]))
+
+def record_sets(s):
+	"""Records each state sent to the swept settings."""
+	states    = []
+	set_state = s._set_state
+	def record(state):
+		set_state(state)
+		states.append(list(s._last_set_state))
+	s._set_state = record
+	return states
+
+def test_start_index_needs_pre_sweep():
+	cxn,s = start(dac_sweep(dataset=False))
+	s.close()
+	for start_index in [3,[3,0]]:
+		with pytest.raises(ValueError,match='pre-sweep'):
+			start(dac_sweep(mesh={'start_index':start_index},dataset=False))
+
+@pytest.mark.parametrize('start_index',[7,[2,1]])
+def test_start_index_ramps_there(start_index):
+	sweep = dac_sweep(mesh={'start_index':start_index,'do_pre_sweep':True,'start_rampfrom':[0.0]})
+	sweep['swept'][0]['max_step_size'] = 0.1
+	cxn,s  = start(sweep)
+	states = record_sets(s)
+	assert s.definition()['mesh']['start_index'] == 7
+	finish(s)
+	first = 0.25 + 0.5*0.5 # V0 at axis positions [2,1]
+	ramp  = [state[0] for state in states[:states.index([first])+1]]
+	assert ramp[0] > 0.0 and ramp[-1] == pytest.approx(first)
+	assert max(numpy.abs(numpy.diff([0.0]+ramp))) <= 0.1 + 1e-9
+	rows = datasets(cxn)['00001 - test']['data']
+	assert len(rows) == 15 - 7
+	assert rows[0][:2] == [2.0,1.0]
+
+def buffered(sweep):
+	"""The sweep with its DAC outputs and ADC input as 'buffered' settings."""
+	for setting in sweep['swept'] + sweep['recorded']:
+		port = setting.pop('inputs')[0]
+		setting.pop('var_slot',None)
+		setting.update(kind='buffered',setting=['dac_adc','DA_0','buffer_ramp'],port=port)
+	return sweep
+
+def test_buffered_sweep():
+	cxn,s = start(dac_sweep(swept=('V0','V1'),points=(6,3)))
+	finish(s)
+	calls = []
+	bcxn,b = start(buffered(dac_sweep(swept=('V0','V1'),points=(6,3))))
+	server = bcxn.servers['dac_adc']._server
+	ramp   = server.buffer_ramp
+	server.buffer_ramp = lambda ctx,*args:calls.append(args) or ramp(ctx,*args)
+	assert b._buffered
+	finish(b)
+	assert len(calls) == 3 # one ramp per line of the first axis
+	assert [call[4] for call in calls] == [6,6,6]
+	assert numpy.allclose(datasets(bcxn)['00001 - test']['data'],datasets(cxn)['00001 - test']['data'])
+	assert bcxn.requests < cxn.requests
+
+def test_buffered_sweep_restrictions():
+	sweep = buffered(dac_sweep())
+	sweep['recorded'] = dac_sweep()['recorded']
+	with pytest.raises(ValueError,match="'buffered'"):
+		start(sweep)
+	sweep = buffered(dac_sweep())
+	sweep['swept'][0]['max_step_size'] = 0.1 # steps of 0.25
+	with pytest.raises(ValueError,match='max_step_size'):
+		start(sweep)
+
+def timed_sweep():
+	sweep = dac_sweep()
+	sweep['axes'][0].update(min_ramp_duration=20,post_ramp_delay=10) # ms
+	sweep['axes'][1].update(post_ramp_delay=30)
+	return start(sweep)[1]
+
+def test_next_deadline():
+	s = timed_sweep()
+	elapsed,calls = 0.0,0
+	while not s.done():
+		dt = max([s.next_deadline(),1e-6])
+		elapsed += dt
+		calls   += 1
+		s.advance(dt)
+	assert elapsed == pytest.approx(0.010 + 12*(0.020+0.010) + 2*0.030,abs=1e-4) # the first delay, then each step of the first & second axis
+	with pytest.raises(ValueError):
+		s.next_deadline()
+
+	s,ticks = timed_sweep(),0
+	while not s.done():
+		s.advance(0.075)
+		ticks += 1
+	assert ticks == calls and 0.075*ticks > 4*elapsed # each delay or ramp takes a whole interval instead
+
+def test_dataset_ready_and_last_set_state():
+	assert Sweeper(connection=FakeConnection()).last_set_state() is None
+	cxn,s = start(dac_sweep(dataset=False))
+	assert (s.dataset_ready(),s.last_set_state()) == (False,[0.0]) # the first point
+	finish(s)
+	assert s.last_set_state() == pytest.approx([1.0 + 0.5])
+	s.initialize_dataset('test','\\tests')
+	assert s.dataset_ready()
+	s.close()
@@ -0,0 +1,67 @@
+"""Tracing of the LabRAD calls of a sweep, and the Chrome trace files written from it."""
+import json
+from components.engine import monotonic
+from components.fake_labrad import FakeConnection
+from components.sweep_file import build_sweep
+from components.tracing import Tracer, TracedConnection, TRACER
+from conftest import dac_sweep
+from sweeper import Sweeper
+
+def read_trace(path):
+	with open(path) as f:
+		return json.load(f)
+
+def names(trace):
+	return set([event['name'] for event in trace['traceEvents'] if event['ph'] != 'M'])
+
+def test_ring_buffer():
+	tracer = Tracer(capacity=4)
+	tracer.add('cleared','test',0.0,1.0)
+	tracer.start() # clears any previous spans
+	for n in range(10):
+		tracer.step = n
+		tracer.add('span','test',tracer.origin+n,tracer.origin+n+0.5,concurrent=(n == 9))
+	assert (tracer.recorded,tracer.dropped(),len(tracer.events)) == (10,6,4)
+	events = [event for event in tracer.trace_events() if event['ph'] != 'M']
+	assert [event['ph'] for event in events] == ['X','X','X','b','e']
+	assert [event['args']['step'] for event in events[:4]] == [6,7,8,9]
+	assert events[0]['ts'] == 6e6 and events[0]['dur'] == 0.5e6
+
+def test_traced_connection():
+	tracer = Tracer()
+	cxn    = TracedConnection(FakeConnection(latency=0.01),tracer)
+	ctx    = cxn.context()
+	cxn.dac_adc.select_device('DA_0',context=ctx) # not traced until started
+	assert tracer.recorded == 0
+	tracer.start()
+	cxn.servers['dac_adc'].set_voltage(0,1.0,context=ctx)
+	future = cxn.dac_adc.settings['read_voltage'](0,context=ctx,wait=False)
+	packet = cxn.dac_adc.packet(context=ctx)
+	packet.set_voltage(1,2.0)
+	packet.send()
+	assert future.wait() == 1.0
+	spans = list(tracer.events)
+	assert [span[0] for span in spans] == ['dac_adc.set_voltage','dac_adc.packet','dac_adc.read_voltage']
+	assert spans[1][6]['settings'] == ['set_voltage']
+	assert spans[2][7] is not None and spans[2][3] - spans[2][2] >= 0.01 # in flight until wait() returned
+
+def run(s,n):
+	for k in range(n):
+		if not s.done():s.advance(1.0)
+
+def test_sweeps_have_their_own_traces(tmpdir):
+	paths = [str(tmpdir.join('a.json')),str(tmpdir.join('b.json'))]
+	a = build_sweep(dac_sweep(swept=('V0',)),Sweeper,connection=FakeConnection(),trace_path=paths[0])
+	run(a,5)
+	b = build_sweep(dac_sweep(swept=('V1',)),Sweeper,connection=FakeConnection(),trace_path=paths[1]) # doesn't clear a's spans
+	while not (a.done() and b.done()):
+		run(a,1)
+		run(b,1)
+	assert not TRACER.enabled
+	traces = [read_trace(path) for path in paths]
+	for trace,label in zip(traces,['V0','V1']):
+		assert trace['otherData']['dropped'] == 0
+		assert set(['dac_adc.set_voltage','dac_adc.read_voltage','data_vault.add','set '+label,'get A0','dv.add','measure']) <= names(trace)
+		steps = [event['args']['step'] for event in trace['traceEvents'] if event.get('name') == 'measure']
+		assert len(steps) == 15 and steps == sorted(steps)
+	assert not 'set V1' in names(traces[0]) and not 'set V0' in names(traces[1])